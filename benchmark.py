@@ -0,0 +1,179 @@
+"""
+file: benchmark.py
+date: 10/17/26
+----------------------
+Times the matching pipeline on made-up cohorts (see synthetic.py) of
+several sizes:
+    loadData, computeSimilarities, makePairMatches, matchGroups and
+    writeMatchesToFile
+
+Every run is appended to RESULTS_FILE along with the git version it ran on
+and the machine it ran on, and compared with the latest run of a different
+version at the same size on the same number of CPUs, so slowdowns show up
+between versions. Timings only mean something on one machine, so
+RESULTS_FILE is kept out of the repository: run the benchmark on a clean
+checkout of the baseline first, then on the version to compare. Above
+DENSE_LIMIT people the full score matrix no longer fits comfortably in
+memory, so matching uses each person's top TOP_K partners instead and
+computeSimilarities is skipped. Below it, the matrix is computed once and
+makePairMatches matches from it, so its time is only the matching.
+
+Run from the repository root (it needs data/sports.json):
+    python benchmark.py
+The default SIZES take about three minutes on one core, most of it spent
+matching the groups of the 100000-person cohort.
+"""
+import argparse
+import contextlib
+from datetime import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+import match
+from synthetic import writeSurvey
+
+SIZES = [100, 1000, 10000, 100000]
+DENSE_LIMIT = 5000
+TOP_K = 32
+RESULTS_FILE = 'benchmark_results.jsonl'
+# Stages this much slower than the last version are flagged
+REGRESSION_RATIO = 1.2
+
+def gitVersion():
+    """ Returns the current commit (marked if there are local changes). """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=repo, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain',
+                                  '--untracked-files=no'],
+                                 cwd=repo, capture_output=True, text=True,
+                                 check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if changes else '')
+
+def timed(seconds, stage, function, *args, **kwargs):
+    """ Calls FUNCTION quietly and records how long it took in SECONDS. """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = function(*args, **kwargs)
+    seconds[stage] = time.perf_counter() - start
+    return value
+
+def benchmarkSize(n, work_dir, seed=0, top_k=None):
+    """
+    Runs every stage on N made-up respondents, writing everything to
+    WORK_DIR. TOP_K defaults to None (dense) up to DENSE_LIMIT people and to
+    the module's TOP_K above it.
+
+    Returns the result record.
+    """
+    if top_k is None and n > DENSE_LIMIT:
+        top_k = TOP_K
+
+    match.NUMBER_FILE = os.path.join(work_dir, 'numbers.csv')
+    match.TEXT_FILE = os.path.join(work_dir, 'text.csv')
+    match.OUT_PATH = work_dir + os.sep
+    match.PLOT_PATH = match.OUT_PATH + 'plots' + os.sep
+    match.QUIET = True
+    # time the real work, not reloading it or reading real past rounds
+    match.CHECKPOINTS = False
+    match.HISTORY_GLOB = None
+    writeSurvey(n, match.NUMBER_FILE, match.TEXT_FILE, seed=seed)
+
+    seconds = {}
+    people, _ = timed(seconds, 'loadData', match.loadData, seed=seed)
+    one_on_one, group = match.separatePairsAndGroups(people)
+
+    scores = None
+    if top_k is None:
+        scores = timed(seconds, 'computeSimilarities',
+                       match.computeSimilarities, one_on_one, upper_only=True)
+    matches = timed(seconds, 'makePairMatches', match.makePairMatches,
+                    one_on_one, top_k=top_k, scores=scores)
+    timed(seconds, 'matchGroups', match.matchGroups, group, top_k=top_k,
+          one_on_one=one_on_one)
+    timed(seconds, 'writeMatchesToFile', match.writeMatchesToFile, matches,
+          one_on_one, os.path.join(work_dir, 'benchmark'))
+
+    return {
+        'size': n,
+        'people': len(people),
+        'top k': top_k,
+        'seconds': seconds,
+    }
+
+def loadResults(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(result, previous):
+    """
+    Prints RESULT's timings next to those of the latest record in PREVIOUS
+    with the same size, settings and number of CPUs but another version.
+    """
+    baseline = None
+    for record in previous:
+        if record['size'] == result['size'] and \
+           record['top k'] == result['top k'] and \
+           record['cpus'] == result['cpus'] and \
+           record['version'] != result['version']:
+            baseline = record
+
+    title = f"{result['size']} people"
+    if baseline is not None:
+        title += f" (vs {baseline['version']}, {baseline['date']})"
+    print(title)
+
+    for stage, seconds in result['seconds'].items():
+        line = f'    {stage}'.ljust(26) + f'{seconds:9.3f}s'
+        before = baseline['seconds'].get(stage) if baseline else None
+        if before:
+            ratio = seconds / before
+            line += f'  {before:9.3f}s  x{ratio:.2f}'
+            if ratio > REGRESSION_RATIO:
+                line += '  <- slower'
+        print(line)
+
+def main(sizes=SIZES, top_k=None, seed=0, results_file=RESULTS_FILE):
+    previous = loadResults(results_file)
+    info = {
+        'version': gitVersion(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+    }
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = {**info, **benchmarkSize(n, work_dir, seed=seed,
+                                              top_k=top_k)}
+        compare(result, previous)
+        with open(results_file, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the matcher')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='match from each top k (default: dense up to '
+                             f'{DENSE_LIMIT} people, then {TOP_K})')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS_FILE,
+                        help='file the results are appended to')
+    args = parser.parse_args()
+
+    main(sizes=args.sizes, top_k=args.top_k, seed=args.seed,
+         results_file=args.results)
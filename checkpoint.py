@@ -0,0 +1,99 @@
+"""
+file: checkpoint.py
+date: 10/17/26
+----------------------
+Saves the results of slow stages so that a rerun on the same inputs can
+load them instead of recomputing them.
+
+Each checkpoint is a .npz file named after its stage and a key, where the
+key is a hash of everything the stage's result depends on (e.g. the bytes of
+the survey exports, or the response matrix and scoring options). Changing
+any input changes the key, so a stale checkpoint is never loaded; it is just
+left behind until there are more than MAX_CHECKPOINTS for that stage. Loading
+a checkpoint marks it as recently used, so the ones still in use are kept.
+Checkpoints can also be thrown away by stage with invalidate().
+"""
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+# Bump this when a stage's output or the way it is saved changes, so that
+# checkpoints written by older code are ignored.
+CHECKPOINT_VERSION = 2
+# Checkpoints kept per stage (e.g. the 1-on-1 and group score matrices)
+MAX_CHECKPOINTS = 4
+
+def fileHash(path):
+    """ Returns the SHA-256 of the file at PATH, read in chunks. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def contentKey(*parts):
+    """
+    Returns a key for PARTS: strings, numbers, booleans, None or NumPy arrays
+    (hashed by dtype, shape and contents).
+    """
+    digest = hashlib.sha256(f'v{CHECKPOINT_VERSION}'.encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f'{part.dtype.str}{part.shape}'.encode())
+            digest.update(part.tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()[:20]
+
+def _path(directory, stage, key):
+    return os.path.join(directory, f'{stage}-{key}.npz')
+
+def loadCheckpoint(directory, stage, key):
+    """
+    Returns the arrays saved for STAGE under KEY, or None if there aren't
+    any (or the file can't be read). The file's mtime is set to now, so that
+    saveCheckpoint prunes the checkpoints used least recently.
+    """
+    path = _path(directory, stage, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    except (OSError, ValueError) as error:
+        print(f'WARNING: Ignoring unreadable checkpoint {path} ({error})')
+        return None
+    os.utime(path)
+    return arrays
+
+def saveCheckpoint(directory, stage, key, arrays):
+    """
+    Saves ARRAYS (name -> array) for STAGE under KEY, keeping only the
+    MAX_CHECKPOINTS checkpoints of that stage saved or loaded most recently.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = _path(directory, stage, key)
+
+    """ Write a temporary file first so a crash never leaves half a file. """
+    temporary = path + '.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+    older = sorted(glob.glob(_path(directory, stage, '*')),
+                   key=os.path.getmtime, reverse=True)
+    for stale in older[MAX_CHECKPOINTS:]:
+        os.remove(stale)
+
+def invalidate(directory, stages=None):
+    """ Deletes the checkpoints of STAGES (all of them if None). """
+    if stages is None:
+        patterns = [os.path.join(directory, '*.npz')]
+    else:
+        patterns = [_path(directory, stage, '*') for stage in stages]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            os.remove(path)
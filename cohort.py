@@ -0,0 +1,349 @@
+"""
+file: cohort.py
+date: 10/17/26
+----------------------
+Streaming survey loader with a compact, columnar cohort representation.
+
+A cohort is a dictionary of columns where entry i of every column belongs to
+the same respondent:
+    'index'         int32 position of the response in the export
+    'qualtrics id'  response ID (column 8)
+    'start date', 'end date', 'name', 'email'   lists of strings
+    'sport id', 'year id', 'major id'           int16 Qualtrics answer codes
+    '1-on-1', 'same grade', 'speed-dating'      bool arrays
+    'friends'       list of the names each person nominated
+    'responses'     n x 29 uint8 matrix of compatibility answers
+
+along with the string tables 'sport names', 'year names' and 'major names'
+(answer code -> label, taken from the text export) and 'skipped', the number
+of unfinished surveys. cohortPeople turns a cohort back into the list of
+person dictionaries the rest of match.py uses, and packCohort/unpackCohort
+convert it to and from plain arrays for checkpoints (see checkpoint.py).
+
+buildPersonIndex and lookupPerson resolve the names and emails people type
+into the friend question.
+
+sportData returns the sport metadata in data/sports.json (sport name ->
+details such as 'kind'), read from disk once per process.
+"""
+from array import array
+import csv
+import difflib
+from functools import lru_cache
+from itertools import zip_longest
+import json
+import unicodedata
+
+import numpy as np
+
+from instrument import count
+
+SPORTS_FILE = 'data/sports.json'
+NUM_QUESTIONS = 29
+HEADER_ROWS = 3
+# How similar a misspelled name must be to a real one (see difflib)
+APPROXIMATE_CUTOFF = 0.85
+
+@lru_cache(maxsize=None)
+def sportData(path=SPORTS_FILE):
+    """
+    Returns the sport metadata in PATH. The file is only read the first time;
+    every later call returns the same dictionary, so don't modify it.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+def _code(value):
+    """ Returns the Qualtrics answer code in VALUE, or -1 if it is blank. """
+    return int(value) if value.strip() != '' else -1
+
+def _joinRows(number_rows, text_rows):
+    """
+    Yields (number_row, text_row) pairs joined on response ID. The two
+    exports are normally in the same order, so rows are matched as they
+    stream in; a row whose partner hasn't been seen yet waits in a
+    dictionary until it shows up.
+    """
+    pending_numbers = {}
+    pending_texts = {}
+    for number_row, text_row in zip_longest(number_rows, text_rows):
+        if number_row is not None:
+            pending_numbers[number_row[8]] = number_row
+        if text_row is not None:
+            pending_texts[text_row[8]] = text_row
+
+        for response_id in [number_row and number_row[8],
+                            text_row and text_row[8]]:
+            if response_id in pending_numbers and \
+               response_id in pending_texts:
+                yield (pending_numbers.pop(response_id),
+                       pending_texts.pop(response_id))
+
+    for response_id in pending_numbers.keys() | pending_texts.keys():
+        print(f'WARNING: Response {response_id} is only in one export.')
+
+def loadCohort(number_file, text_file, verbose=False):
+    """
+    Streams both Qualtrics exports in one pass and returns the cohort. Rows
+    with an unanswered compatibility question are skipped.
+    """
+    cohort = {
+        'index': array('i'),
+        'qualtrics id': [],
+        'start date': [],
+        'end date': [],
+        'name': [],
+        'email': [],
+        'sport id': array('h'),
+        'year id': array('h'),
+        'major id': array('h'),
+        '1-on-1': array('b'),
+        'same grade': array('b'),
+        'speed-dating': array('b'),
+        'friends': [],
+        'responses': array('B'),
+        'sport names': {},
+        'year names': {},
+        'major names': {},
+    }
+    skip_ids = set()
+
+    with open(number_file) as number_f, open(text_file) as text_f:
+        number_rows = csv.reader(number_f)
+        text_rows = csv.reader(text_f)
+
+        number_headers = [next(number_rows) for _ in range(HEADER_ROWS)]
+        for _ in range(HEADER_ROWS):
+            next(text_rows)
+
+        if verbose:
+            for i, column in enumerate(number_headers[1][25:54]):
+                print(f"{i}: {column}")
+
+        i = 0
+        for row, text_row in _joinRows(number_rows, text_rows):
+            """ Skip unfinished responses. """
+            if '' in row[25:54]:
+                skip_ids.add(row[8])
+                continue
+
+            cohort['index'].append(i)
+            cohort['qualtrics id'].append(row[8])
+            cohort['start date'].append(row[0])
+            cohort['end date'].append(row[1])
+            cohort['name'].append(' '.join(row[17].strip().split()).title())
+            cohort['email'].append(row[18].strip().lower())
+            cohort['1-on-1'].append(row[22] == '1')
+            cohort['friends'].append([f.strip() for f in row[23].split(',')
+                                      if f != ''])
+            cohort['same grade'].append(row[24] == '1')
+            cohort['speed-dating'].append(row[54] == '1')
+            cohort['responses'].extend(int(x) for x in row[25:54])
+
+            for column, names, value, label in [
+                    ('sport id', 'sport names', row[20], text_row[20]),
+                    ('year id', 'year names', row[19], text_row[19]),
+                    ('major id', 'major names', row[21], text_row[21])]:
+                code = _code(value)
+                cohort[column].append(code)
+                cohort[names].setdefault(code, label)
+
+            i += 1
+
+    for column in ['index', 'sport id', 'year id', 'major id']:
+        typecode = cohort[column].typecode
+        cohort[column] = np.array(cohort[column], dtype=typecode)
+    for column in ['1-on-1', 'same grade', 'speed-dating']:
+        cohort[column] = np.array(cohort[column], dtype=bool)
+    cohort['responses'] = np.array(cohort['responses'],
+                                   dtype=np.uint8).reshape(i, NUM_QUESTIONS)
+    cohort['skipped'] = len(skip_ids)
+    count('responses read', i + len(skip_ids))
+
+    return cohort
+
+def cohortSize(cohort):
+    return len(cohort['qualtrics id'])
+
+def permuteCohort(cohort, order):
+    """ Returns a copy of COHORT with its rows in the given ORDER. """
+    order = np.asarray(order, dtype=np.int64)
+    permuted = {}
+    for column, values in cohort.items():
+        if isinstance(values, np.ndarray):
+            permuted[column] = values[order]
+        elif isinstance(values, list):
+            permuted[column] = [values[i] for i in order]
+        else:
+            permuted[column] = values
+    return permuted
+
+_STRING_COLUMNS = ['qualtrics id', 'start date', 'end date', 'name', 'email']
+_NAME_TABLES = ['sport names', 'year names', 'major names']
+
+def packCohort(cohort):
+    """
+    Returns COHORT as a dictionary of plain arrays (for np.savez without
+    pickling). unpackCohort turns it back into a cohort.
+    """
+    packed = {column: values for column, values in cohort.items()
+              if isinstance(values, np.ndarray)}
+    for column in _STRING_COLUMNS:
+        packed[column] = np.array(cohort[column], dtype=str)
+    for column in _NAME_TABLES:
+        packed[f'{column} codes'] = np.array(list(cohort[column]),
+                                             dtype=np.int64)
+        packed[f'{column} labels'] = np.array(list(cohort[column].values()),
+                                              dtype=str)
+    packed['friends'] = np.array([name for friends in cohort['friends']
+                                  for name in friends], dtype=str)
+    packed['friend counts'] = np.array([len(friends)
+                                        for friends in cohort['friends']],
+                                       dtype=np.int64)
+    packed['skipped'] = np.array(cohort['skipped'])
+    return packed
+
+def unpackCohort(packed):
+    """ Returns the cohort packed by packCohort. """
+    cohort = {column: packed[column] for column in
+              ['index', 'sport id', 'year id', 'major id', '1-on-1',
+               'same grade', 'speed-dating', 'responses']}
+    for column in _STRING_COLUMNS:
+        cohort[column] = packed[column].tolist()
+    for column in _NAME_TABLES:
+        cohort[column] = dict(zip(packed[f'{column} codes'].tolist(),
+                                  packed[f'{column} labels'].tolist()))
+
+    names = packed['friends'].tolist()
+    ends = np.cumsum(packed['friend counts']).tolist()
+    cohort['friends'] = [names[end - k:end] for end, k in
+                         zip(ends, packed['friend counts'].tolist())]
+    cohort['skipped'] = int(packed['skipped'])
+    return cohort
+
+def cohortPeople(cohort):
+    """
+    Returns the legacy view of COHORT: one dictionary per person, shaped the
+    way loadData has always returned them. Each person's 'responses' is
+    their row of the cohort's response matrix, read-only and not copied, and
+    'row' is its position, so scoring.responseMatrix can take the answers of
+    any of them straight from the matrix.
+    """
+    responses = np.array(cohort['responses'], dtype=np.uint8)
+    responses.flags.writeable = False
+
+    people = []
+    for i in range(cohortSize(cohort)):
+        sport_id = int(cohort['sport id'][i])
+        person = {
+            'index': int(cohort['index'][i]),
+            'row': i,
+            'qualtrics id': cohort['qualtrics id'][i],
+            'start date': cohort['start date'][i],
+            'end date': cohort['end date'][i],
+            'meta data': {
+                'name': cohort['name'][i],
+                'email': cohort['email'][i],
+                'sport id': sport_id,
+                'year': cohort['year names'][int(cohort['year id'][i])],
+                'sport name': cohort['sport names'][sport_id],
+                'major': cohort['major names'][int(cohort['major id'][i])],
+            },
+            'athlete mingle': {
+                '1-on-1': bool(cohort['1-on-1'][i]),
+                'friends': list(cohort['friends'][i]),
+                'same grade': bool(cohort['same grade'][i]),
+                'speed-dating': bool(cohort['speed-dating'][i]),
+            },
+            'responses': responses[i],
+        }
+        people.append(person)
+    return people
+
+################################# Person index ################################
+
+def normalizeName(name):
+    """ Lowercases NAME and drops accents, punctuation and extra spaces. """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if c.isalnum() or c.isspace())
+    return ' '.join(name.lower().split())
+
+def _nearKeys(name, lengths):
+    """
+    Yields the keys under which names close to NAME are filed, for each of
+    LENGTHS (letters, not counting spaces): the first and last letters, the
+    first name and the last name. A name with one letter typed wrong,
+    swapped, missing or added keeps at least one of them, and its length
+    changes by at most one.
+    """
+    tokens = name.split()
+    letters = name.replace(' ', '')
+    for length in lengths:
+        yield 'ends', letters[:1], letters[-1:], length
+        if len(tokens) > 1:
+            yield 'first', tokens[0], length
+            yield 'last', tokens[-1], length
+
+def buildPersonIndex(people):
+    """
+    Returns hash maps from normalized name and from email to indices into
+    PEOPLE, and from near keys (see _nearKeys) to names. Build it once per
+    run and use lookupPerson for every query.
+    """
+    index = {'names': {}, 'emails': {}, 'near': {}}
+    for i, person in enumerate(people):
+        name = normalizeName(person['meta data']['name'])
+        if name not in index['names']:
+            length = len(name.replace(' ', ''))
+            for key in _nearKeys(name, [length]):
+                index['near'].setdefault(key, []).append(name)
+        index['names'].setdefault(name, []).append(i)
+        index['emails'].setdefault(person['meta data']['email'], []).append(i)
+    return index
+
+def dropPerson(index, i, name, email):
+    """
+    Takes person I, with NAME and EMAIL, out of INDEX (see buildPersonIndex),
+    so lookupPerson no longer finds them. Everyone else keeps their index.
+    """
+    name = normalizeName(name)
+    for table, key in [(index['names'], name), (index['emails'], email)]:
+        table[key].remove(i)
+        if len(table[key]) == 0:
+            del table[key]
+
+    if name not in index['names']:
+        length = len(name.replace(' ', ''))
+        for key in _nearKeys(name, [length]):
+            index['near'][key].remove(name)
+
+def lookupPerson(index, nomination, cutoff=APPROXIMATE_CUTOFF):
+    """
+    Returns (candidates, approximate) for a name or email someone typed.
+    Exactly one candidate means the nomination resolved; more than one means
+    it is ambiguous, and none means nobody matched.
+
+    Emails and normalized names are looked up directly. If a name has no
+    exact match, the closest names within CUTOFF are used instead and
+    approximate is True. Only these misses pay for the fuzzy search, and it
+    only compares the few names filed under the same near keys (see
+    _nearKeys), not everyone's, so a name with several typos may not be
+    found. Pass cutoff=None for exact lookups only.
+    """
+    nomination = nomination.strip()
+    if '@' in nomination:
+        return index['emails'].get(nomination.lower(), []), False
+
+    name = normalizeName(nomination)
+    if name in index['names']:
+        return index['names'][name], False
+    if cutoff is None:
+        return [], False
+
+    length = len(name.replace(' ', ''))
+    near = dict.fromkeys(other for key in _nearKeys(name, [length - 1, length,
+                                                           length + 1])
+                         for other in index['near'].get(key, []))
+    count('names compared', len(near))
+    close = difflib.get_close_matches(name, near, n=2, cutoff=cutoff)
+    return [i for match in close for i in index['names'][match]], True
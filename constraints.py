@@ -0,0 +1,86 @@
+"""
+file: constraints.py
+date: 10/17/26
+----------------------
+The rules for who can be paired with whom, as boolean masks over the cohort.
+
+A pair is eligible unless
+    - both people play the same sport (unless same_sport_ok),
+    - their sports are of the same kind, e.g. both Women's (unless
+      same_kind_ok), or
+    - one of them asked to be placed with people in their year and the other
+      is in a different year (only if GRADES is given).
+
+The rules only look at small integer codes per person: sport ids and kinds
+from scoring.cohortArrays, and GRADES from gradeArrays. eligibleMask checks
+any block of pairs at once. partnerPools splits the cohort into classes of
+people the rules treat alike, so the scorers can skip whole classes that can
+never be paired instead of scoring those pairs and throwing them away.
+"""
+import numpy as np
+
+def gradeArrays(people):
+    """
+    Returns the n x 2 GRADES array for PEOPLE: column 0 is a code for each
+    person's year, column 1 is 1 if they want to be with people in their year.
+    """
+    years = [person['meta data']['year'] for person in people]
+    grades = np.zeros((len(people), 2), dtype=np.int64)
+    grades[:, 0] = np.unique(years, return_inverse=True)[1].ravel()
+    grades[:, 1] = [person['athlete mingle']['same grade']
+                    for person in people]
+    return grades
+
+def eligibleMask(sports, kinds, rows, cols, same_kind_ok=False,
+                 same_sport_ok=False, grades=None):
+    """
+    Returns the len(ROWS) x len(COLS) boolean mask of the eligible pairs
+    between the people in ROWS and COLS.
+    """
+    eligible = np.ones((len(rows), len(cols)), dtype=bool)
+    if not same_sport_ok:
+        eligible &= sports[rows, None] != sports[None, cols]
+    if not same_kind_ok:
+        eligible &= kinds[rows, None] != kinds[None, cols]
+    if grades is not None:
+        years, same_grade = grades[:, 0], grades[:, 1].astype(bool)
+        eligible &= (years[rows, None] == years[None, cols]) | \
+                    ~(same_grade[rows, None] | same_grade[None, cols])
+    return eligible
+
+def ruleClasses(kinds, same_kind_ok=False, grades=None):
+    """
+    Returns (classes, allowed): the class of each person, where people in a
+    class share everything the kind and grade rules look at, and the C x C
+    mask of the pairs of classes with any eligible pairs between them. Sports
+    are left out: with same_kind_ok=False they are already covered by kinds,
+    and otherwise a sport only rules out a small part of its class.
+    """
+    columns = [np.zeros(len(kinds), dtype=np.int64)]
+    if not same_kind_ok:
+        columns.append(kinds)
+    if grades is not None:
+        columns.extend([grades[:, 0], grades[:, 1]])
+    keys, classes = np.unique(np.column_stack(columns), axis=0,
+                              return_inverse=True)
+    classes = classes.ravel()
+
+    """ One representative per class decides for the whole class. """
+    representatives = np.array([np.flatnonzero(classes == c)[0]
+                                for c in range(len(keys))], dtype=np.int64)
+    allowed = eligibleMask(None, kinds, representatives,
+                           representatives, same_kind_ok=same_kind_ok,
+                           same_sport_ok=True, grades=grades)
+    return classes, allowed
+
+def partnerPools(kinds, same_kind_ok=False, grades=None):
+    """
+    Yields (members, partners) for each class of ruleClasses: the people in
+    the class and everyone they could possibly be paired with, both sorted.
+    Every eligible pair (i, j) has j in the partners of i's class.
+    """
+    if len(kinds) == 0:
+        return
+    classes, allowed = ruleClasses(kinds, same_kind_ok, grades)
+    for c in range(len(allowed)):
+        yield np.flatnonzero(classes == c), np.flatnonzero(allowed[c][classes])
@@ -0,0 +1,133 @@
+"""
+file: friends.py
+date: 10/17/26
+----------------------
+Turns friend requests into seed pairs and groups.
+
+Everyone linked by nominations (directly or through a chain of friends) ends
+up in the same cluster. Clusters are found with union-find, so the whole
+nomination graph is processed in near-linear time. Each cluster is then cut
+into seeds of at most four people. Seeds of two or four are complete; seeds
+of three are completed with the best-scoring remaining participant who is
+eligible with all three.
+"""
+from collections import deque
+
+import numpy as np
+
+GROUP_SIZE = 4
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def friendClusters(friend_dict):
+    """
+    Returns the connected components of the nomination graph in FRIEND_DICT
+    (index -> list of friends' indices) that have at least two people. Each
+    component is sorted, and components are ordered by their first member.
+    """
+    parent = {i: i for i in friend_dict}
+    size = {i: 1 for i in friend_dict}
+
+    for i, friends in friend_dict.items():
+        for j in friends:
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i == root_j:
+                continue
+            if size[root_i] < size[root_j]:
+                root_i, root_j = root_j, root_i
+            parent[root_j] = root_i
+            size[root_i] += size[root_j]
+
+    components = {}
+    for i in friend_dict:
+        components.setdefault(_find(parent, i), []).append(i)
+
+    return sorted([sorted(component) for component in components.values()
+                   if len(component) > 1])
+
+def seedSizes(n):
+    """
+    Returns how to cut a cluster of N people into seeds of at most
+    GROUP_SIZE, never leaving someone on their own (e.g. 5 -> [3, 2]).
+    """
+    sizes = [GROUP_SIZE] * (n // GROUP_SIZE)
+    remainder = n % GROUP_SIZE
+    if remainder == 1:
+        sizes[-1:] = [GROUP_SIZE - 1, 2]
+    elif remainder > 0:
+        sizes.append(remainder)
+    return sizes
+
+def splitCluster(cluster, friend_dict):
+    """
+    Cuts CLUSTER into seeds. People are taken in breadth-first order from the
+    first member, so direct friends tend to land in the same seed.
+    """
+    order = []
+    seen = {cluster[0]}
+    queue = deque([cluster[0]])
+    while queue:
+        i = queue.popleft()
+        order.append(i)
+        for j in friend_dict[i]:
+            if j not in seen:
+                seen.add(j)
+                queue.append(j)
+
+    seeds = []
+    start = 0
+    for size in seedSizes(len(order)):
+        seeds.append(order[start:start + size])
+        start += size
+    return seeds
+
+def friendSeeds(friend_dict):
+    """ Returns the seeds (lists of indices) for every friend cluster. """
+    return [seed for cluster in friendClusters(friend_dict)
+            for seed in splitCluster(cluster, friend_dict)]
+
+def fillSeeds(seed_scores):
+    """
+    Picks one remaining participant for each incomplete seed. SEED_SCORES is
+    an s x r matrix of how well each of the r remaining participants fits
+    each of the s seeds. Fits are taken greedily, best first, and nobody is
+    used twice. Fits of -inf (e.g. someone who breaks a rule with one of the
+    seed's members) are never taken.
+
+    Returns the chosen participant (column) for each seed, or -1 if there
+    weren't enough eligible participants left.
+    """
+    s, r = seed_scores.shape
+    order = np.argsort(-seed_scores, axis=None, kind='stable')
+
+    fillers = np.full(s, -1)
+    used = np.zeros(r, dtype=bool)
+    for seed, candidate in zip(*np.unravel_index(order, (s, r))):
+        if seed_scores[seed, candidate] == -np.inf:
+            break
+        if fillers[seed] >= 0 or used[candidate]:
+            continue
+        fillers[seed] = candidate
+        used[candidate] = True
+        if (fillers >= 0).all():
+            break
+
+    return fillers.tolist()
+
+def seedPairs(scores):
+    """
+    Splits a seed into pairs. SCORES is the k x k matrix of scores between
+    the seed's members (k is 2 or 4). For four people, the split with the
+    highest total score is used.
+
+    Returns a list of pairs of positions into the seed.
+    """
+    if len(scores) == 2:
+        return [(0, 1)]
+
+    splits = [[(0, 1), (2, 3)], [(0, 2), (1, 3)], [(0, 3), (1, 2)]]
+    return max(splits, key=lambda split: sum(scores[i][j] for i, j in split))
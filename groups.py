@@ -0,0 +1,221 @@
+"""
+file: groups.py
+date: 10/17/26
+----------------------
+Combines pair matches into groups of four.
+
+Merging pair A = (a1, a2) with pair B = (b1, b2) is scored with all six
+similarities inside the resulting group: the two within the pairs (their
+scores as matched, so friend pairs keep theirs) plus the four across them.
+The scores for every pair-of-pairs combination are computed at once from a
+handful of score blocks, and the pairs are then matched to each other with
+the same engines used for pair matching (see matching.py). Given a top K,
+only each pair's best K merges are kept, a block of pairs at a time (see
+sparseMerges), so large cohorts never hold the P x P matrix.
+People matched in past rounds (see history.py) are kept out of each other's
+groups, or their merges are penalized, the same way as their pairs.
+"""
+import numpy as np
+
+from history import LOWEST_SCORE, pastBlock
+from matching import (greedyMatch, greedyMatchEdges, optimalMatch,
+                      optimalMatchEdges)
+from scoring import BLOCK_SIZE, INELIGIBLE, computeSimilarityBlock
+
+def mergeScores(pairs, responses, sports, kinds, grades=None, within=None):
+    """
+    Returns the P x P matrix whose (A, B) entry is the average of the six
+    similarities in the group formed by PAIRS[A] and PAIRS[B]. Pairs are
+    index pairs into the cohort described by RESPONSES, SPORTS and KINDS.
+    WITHIN holds the P pairs' own scores; if it is None they are scored
+    here. Pairs across the two that break a rule (see constraints.py, with
+    GRADES for the same-grade answers) count as INELIGIBLE. The diagonal is
+    INELIGIBLE.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    first, second = pairs[:, 0], pairs[:, 1]
+
+    def block(rows, cols):
+        return computeSimilarityBlock(responses, sports, kinds, rows, cols,
+                                      grades=grades)
+
+    """ Scores are symmetric, so (second, first) is the transpose. """
+    first_second = block(first, second)
+    if within is None:
+        within = np.diagonal(first_second)
+    within = np.asarray(within, dtype=np.float64)
+    across = block(first, first) + first_second + first_second.T + \
+             block(second, second)
+
+    scores = (within[:, None] + within[None, :] + across) / 6
+    np.fill_diagonal(scores, INELIGIBLE)
+    return scores
+
+def mergePenalties(pairs, past):
+    """
+    Returns the P x P amounts to take off the mergeScores of PAIRS for the
+    PAST pairs (see history.pastPairs) across each two of them: a sixth of
+    the four pairs' amounts, so as much as if their similarities were
+    lowered, and infinite if any of them is ruled out.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    first, second = pairs[:, 0], pairs[:, 1]
+
+    first_second = pastBlock(past, first, second)
+    return (pastBlock(past, first, first) + first_second + first_second.T +
+            pastBlock(past, second, second)) / 6
+
+def mergeEdges(pairs, responses, sports, kinds, top_k, grades=None,
+               within=None, past=None):
+    """
+    Returns (rows, cols, values, scores) for the merges (A, B), A < B, of
+    PAIRS where B is one of A's TOP_K best merges or A is one of B's, as
+    matching.candidateEdges does for people. The P x P matrix is never
+    built: it is scored BLOCK_SIZE pairs at a time. SCORES are the
+    mergeScores, and VALUES the same with the PAST amounts taken off (see
+    mergePenalties). Ruled-out merges are dropped.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    first, second = pairs[:, 0], pairs[:, 1]
+    n = len(pairs)
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0)
+
+    def block(rows, cols):
+        return computeSimilarityBlock(responses, sports, kinds, rows, cols,
+                                      grades=grades)
+
+    if within is None:
+        within = np.concatenate([
+            np.diagonal(block(first[start:start + BLOCK_SIZE],
+                              second[start:start + BLOCK_SIZE]))
+            for start in range(0, n, BLOCK_SIZE)])
+    within = np.asarray(within, dtype=np.float64)
+
+    k = min(top_k, n - 1)
+    found = []
+    for start in range(0, n, BLOCK_SIZE):
+        tile = np.arange(start, min(start + BLOCK_SIZE, n))
+        across = sum(block(rows, cols) for rows in [first[tile], second[tile]]
+                     for cols in [first, second])
+        scores = (within[tile, None] + within[None, :] + across) / 6
+        scores[np.arange(len(tile)), tile] = INELIGIBLE
+
+        values = scores
+        if past is not None:
+            penalties = sum(pastBlock(past, rows, cols)
+                            for rows in [first[tile], second[tile]]
+                            for cols in [first, second]) / 6
+            values = np.where((scores > INELIGIBLE) & np.isfinite(penalties),
+                              np.maximum(scores - penalties, LOWEST_SCORE),
+                              INELIGIBLE)
+
+        best = np.argpartition(-values, k - 1, axis=1)[:, :k]
+        at = np.repeat(np.arange(len(tile)), k)
+        cols = best.ravel()
+        keep = values[at, cols] > INELIGIBLE
+        found.append((tile[at[keep]], cols[keep], values[at, cols][keep],
+                      scores[at, cols][keep]))
+
+    rows, cols, values, scores = [np.concatenate(part)
+                                  for part in zip(*found)]
+    rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, unique = np.unique(rows * n + cols, return_index=True)
+    return rows[unique], cols[unique], values[unique], scores[unique]
+
+def sparseMerges(pairs, responses, sports, kinds, top_k, mode='greedy',
+                 grades=None, within=None, past=None):
+    """
+    Merges PAIRS using only each pair's TOP_K best merges (see mergeEdges).
+    As in matching.sparseMatch, the pairs left over are merged again among
+    themselves with K doubled, until a round merges none or K already
+    covered them all.
+
+    Returns (merges, unmerged): merges is a list of [(a, b), score] with
+    positions in PAIRS and the merge's real score, and unmerged the
+    positions left over.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if within is not None:
+        within = np.asarray(within, dtype=np.float64)
+
+    pool = np.arange(len(pairs))
+    k = top_k
+    merges = []
+    while len(pool) > 1:
+        rows, cols, values, scores = mergeEdges(
+            pairs[pool], responses, sports, kinds, k, grades=grades,
+            within=None if within is None else within[pool], past=past)
+        if mode == 'optimal':
+            found, leftover = optimalMatchEdges(len(pool), rows, cols, values)
+        else:
+            found, leftover = greedyMatchEdges(len(pool), rows, cols, values)
+
+        real = dict(zip(zip(rows.tolist(), cols.tolist()), scores.tolist()))
+        merges.extend([(int(pool[a]), int(pool[b])), real[a, b]]
+                      for (a, b), _ in found)
+
+        exhaustive = k >= len(pool) - 1
+        pool = pool[leftover]
+        if len(found) == 0 or exhaustive:
+            break
+        k *= 2
+
+    return merges, pool.tolist()
+
+def formGroups(pairs, responses, sports, kinds, preformed=(),
+               mode='greedy', grades=None, past=None, within=None,
+               top_k=None):
+    """
+    Merges PAIRS into groups of four. PREFORMED lists [(a, b), score] for
+    positions in PAIRS that must end up together with the score they were
+    given (e.g. a seed of four friends, see match.pairGroup); the rest are
+    merged by MODE ('greedy' or 'optimal'). GRADES and WITHIN (the pairs'
+    scores as they were matched) are passed on to mergeScores. PAST (see
+    history.pastPairs) rules out or penalizes the merges that would put
+    people matched before in one group again (see mergePenalties); the
+    groups are still written with their real scores. With TOP_K set, only
+    each pair's TOP_K best merges are considered (see sparseMerges), so the
+    P x P matrix is never built.
+
+    Returns (groups, leftover): groups is a list of [(i, j, k, l), score]
+    with score the average of the group's six similarities, and leftover is
+    the list of pairs that couldn't be merged (e.g. an odd pair out).
+    """
+    pairs = [tuple(int(i) for i in pair) for pair in pairs]
+
+    merges = [[(a, b), float(score)] for (a, b), score in preformed]
+    taken = {i for (a, b), _ in merges for i in (a, b)}
+
+    if top_k is not None:
+        free = [a for a in range(len(pairs)) if a not in taken]
+        found, unmerged = sparseMerges(
+            [pairs[a] for a in free], responses, sports, kinds, top_k,
+            mode=mode, grades=grades, past=past,
+            within=None if within is None else [within[a] for a in free])
+        merges += [[(free[a], free[b]), score] for (a, b), score in found]
+        unmerged = [free[a] for a in unmerged]
+    else:
+        scores = mergeScores(pairs, responses, sports, kinds, grades, within)
+        if past is None:
+            candidates = scores.copy()
+        else:
+            penalties = mergePenalties(pairs, past)
+            candidates = np.where(
+                (scores > INELIGIBLE) & np.isfinite(penalties),
+                np.maximum(scores - penalties, LOWEST_SCORE), INELIGIBLE)
+        candidates[np.tril_indices(len(scores))] = INELIGIBLE
+        candidates[list(taken), :] = INELIGIBLE
+        candidates[:, list(taken)] = INELIGIBLE
+
+        if mode == 'optimal':
+            found, unmerged = optimalMatch(candidates)
+        else:
+            found, unmerged = greedyMatch(candidates)
+
+        merges += [[(a, b), float(scores[a, b])] for (a, b), _ in found]
+        unmerged = [a for a in unmerged if a not in taken]
+
+    groups = [[pairs[a] + pairs[b], score] for (a, b), score in merges]
+    return groups, [pairs[a] for a in unmerged]
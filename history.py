@@ -0,0 +1,230 @@
+"""
+file: history.py
+date: 10/17/26
+----------------------
+Who was matched with whom in past rounds, so a new round can avoid pairing
+people again.
+
+Every round writes its matches to its own output folder (e.g. output/03-01/)
+and its date, the last survey response it matched, to the summaries. Rounds
+are ordered by that date (see roundDate), not by the folders' names.
+loadHistory reads the matches_*.csv and groups*.csv of every earlier round
+(everyone in a group of four counts as matched with the other three) into
+one index,
+(hash, hash) -> rounds ago, keyed by the hashes of both emails (smallest
+first), so the history never holds an email and any pair is looked up in
+O(1). pastPairs turns the index into the PAST pairs of a cohort: their
+positions and how much to take off their score, infinite for pairs that are
+ruled out. Those are applied to a whole score matrix (penalizeScores), to
+an edge list (penalizeEdges) or to any block of pairs (pastBlock) at once,
+and actualScores puts the real scores back on the matches that are made
+anyway.
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from scoring import INELIGIBLE, computeSimilarityBlock
+
+# The lowest score a penalized pair can get, so it is still eligible
+LOWEST_SCORE = np.nextafter(INELIGIBLE, 0)
+
+def emailHash(email):
+    """ Returns a signed 64-bit hash of EMAIL (case and spaces ignored). """
+    digest = hashlib.blake2b(email.strip().lower().encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), 'little', signed=True)
+
+def pairKey(first, second):
+    """ Returns the history key of the pair of emails FIRST and SECOND. """
+    return tuple(sorted((emailHash(first), emailHash(second))))
+
+def roundDate(folder):
+    """
+    Returns the date of the round in FOLDER as 'YYYY-MM-DD HH:MM:SS': the
+    'round date' in its summaries or, for rounds written without one, the
+    time its newest matches were written.
+    """
+    dates = []
+    for path in glob.glob(os.path.join(folder, '*.summary.json')):
+        with open(path) as f:
+            summary = json.load(f)
+        if summary.get('round date') is not None:
+            dates.append(summary['round date'])
+    if len(dates) > 0:
+        return max(dates)
+
+    paths = glob.glob(os.path.join(folder, 'matches_*.csv')) + \
+            glob.glob(os.path.join(folder, 'groups*.csv'))
+    written = max([os.path.getmtime(path) for path in paths],
+                  default=os.path.getmtime(folder))
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(written))
+
+def pastRounds(pattern, current=None, before=None):
+    """
+    Returns the output folders matching the glob PATTERN, oldest first (see
+    roundDate), leaving out CURRENT, the folder of this round, and every
+    round dated BEFORE or later.
+    """
+    current = None if current is None else os.path.realpath(current)
+    dated = [(roundDate(folder), folder) for folder in glob.glob(pattern)
+             if os.path.isdir(folder) and
+             os.path.realpath(folder) != current]
+    return [folder for date, folder in sorted(dated)
+            if before is None or date < before]
+
+def readPairs(path):
+    """
+    Yields the pair keys of every match in the matches CSV at PATH: every
+    pair of members ('p1 email', 'p2 email', ...) of every row.
+    """
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = [name for name in reader.fieldnames or []
+                   if re.fullmatch(r'p\d+ email', name)]
+        for row in reader:
+            emails = [row[name] for name in columns if row[name]]
+            for a in range(len(emails)):
+                for b in range(a + 1, len(emails)):
+                    yield pairKey(emails[a], emails[b])
+
+def loadHistory(folders):
+    """
+    Returns the history index of FOLDERS (oldest first): pair key -> the
+    number of rounds since the pair was last matched, 1 for the last round.
+    """
+    history = {}
+    for rounds_ago, folder in enumerate(reversed(folders), 1):
+        paths = glob.glob(os.path.join(folder, 'matches_*.csv')) + \
+                glob.glob(os.path.join(folder, 'groups*.csv'))
+        for path in sorted(paths):
+            for key in readPairs(path):
+                history.setdefault(key, rounds_ago)
+    return history
+
+def pastPairs(history, emails, penalty=None, decay=1.0):
+    """
+    Returns (pairs, amounts) for the people with EMAILS: the m x 2 positions
+    (i < j) of the pairs in HISTORY and what to take off their scores,
+    PENALTY * DECAY ** (rounds ago - 1), or infinity if PENALTY is None.
+    """
+    pairs = np.zeros((0, 2), dtype=np.int64)
+    if len(history) == 0 or len(emails) < 2:
+        return pairs, np.zeros(0)
+
+    """ Look both hashes of every past pair up among the cohort's at once. """
+    hashes = np.array([emailHash(email) for email in emails], dtype=np.int64)
+    order = np.argsort(hashes, kind='stable')
+    keys = np.array(list(history), dtype=np.int64)
+    rounds_ago = np.fromiter(history.values(), dtype=np.int64,
+                             count=len(history))
+
+    slots = np.searchsorted(hashes[order], keys).clip(max=len(emails) - 1)
+    found = (hashes[order][slots] == keys).all(axis=1)
+    pairs = np.sort(order[slots[found]], axis=1)
+    rounds_ago = rounds_ago[found]
+
+    """ Someone who signed up twice with one email isn't a pair. """
+    distinct = pairs[:, 0] != pairs[:, 1]
+    pairs, rounds_ago = pairs[distinct], rounds_ago[distinct]
+
+    if penalty is None:
+        return pairs, np.full(len(pairs), np.inf)
+    return pairs, penalty * decay ** (rounds_ago - 1.0)
+
+def pastAmong(past, ids):
+    """ Returns the PAST pairs among the people in IDS, indexed into IDS. """
+    pairs, amounts = past
+    ids = np.asarray(ids, dtype=np.int64)
+    position = np.full(max(pairs.max(initial=-1), ids.max(initial=-1)) + 1, -1)
+    position[ids] = np.arange(len(ids))
+    among = position[pairs]
+    keep = (among >= 0).all(axis=1)
+    return np.sort(among[keep], axis=1), amounts[keep]
+
+def penalizeScores(scores, past):
+    """
+    Takes the PAST amounts (see pastPairs) off SCORES, in place, on both
+    sides of the diagonal. Ineligible pairs stay ineligible, ruled-out pairs
+    become INELIGIBLE and penalized pairs don't drop below LOWEST_SCORE.
+    """
+    pairs, amounts = past
+    for rows, cols in [pairs.T, pairs.T[::-1]]:
+        values = scores[rows, cols]
+        scores[rows, cols] = np.where(
+            (values > INELIGIBLE) & np.isfinite(amounts),
+            np.maximum(values - amounts, LOWEST_SCORE), INELIGIBLE)
+
+def pastBlock(past, rows, cols):
+    """
+    Returns the len(ROWS) x len(COLS) amounts PAST takes off the scores
+    between the people in ROWS and COLS (see pastPairs), 0 for the pairs
+    that weren't matched before. Nobody may be in ROWS, or in COLS, twice.
+    """
+    pairs, amounts = past
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    block = np.zeros((len(rows), len(cols)))
+
+    size = max(pairs.max(initial=-1), rows.max(initial=-1),
+               cols.max(initial=-1)) + 1
+    row_at, col_at = np.full(size, -1), np.full(size, -1)
+    row_at[rows] = np.arange(len(rows))
+    col_at[cols] = np.arange(len(cols))
+    for first, second in [pairs.T, pairs.T[::-1]]:
+        a, b = row_at[first], col_at[second]
+        found = (a >= 0) & (b >= 0)
+        block[a[found], b[found]] = amounts[found]
+    return block
+
+def penalizeEdges(rows, cols, values, past, ids):
+    """
+    Returns the edges (ROWS, COLS, VALUES) with the PAST amounts taken off,
+    where IDS maps the edges' people to the positions PAST uses. Ruled-out
+    edges are dropped.
+    """
+    pairs, amounts = past
+    if len(pairs) == 0 or len(rows) == 0:
+        return rows, cols, values
+
+    first, second = ids[rows], ids[cols]
+    edge_keys = np.minimum(first, second) << 32 | np.maximum(first, second)
+    past_keys = pairs[:, 0] << 32 | pairs[:, 1]
+    order = np.argsort(past_keys)
+
+    slots = np.searchsorted(past_keys[order], edge_keys).clip(
+        max=len(pairs) - 1)
+    found = past_keys[order][slots] == edge_keys
+    taken = np.where(found, amounts[order][slots], 0.0)
+
+    keep = np.isfinite(taken)
+    values = np.maximum(values - taken, LOWEST_SCORE)
+    return rows[keep], cols[keep], values[keep]
+
+def actualScores(matches, past, responses, sports, kinds):
+    """
+    Returns MATCHES with the penalized PAST pairs among them scored again
+    (RESPONSES, SPORTS and KINDS as in scoring.cohortArrays), so that their
+    scores are written without the penalty.
+    """
+    pairs, amounts = past
+    penalized = {tuple(pair) for pair in pairs[np.isfinite(amounts)].tolist()}
+    redo = [k for k, (ids, _) in enumerate(matches)
+            if tuple(sorted(ids)) in penalized]
+    if len(redo) == 0:
+        return matches
+
+    rows = [min(matches[k][0]) for k in redo]
+    cols = [max(matches[k][0]) for k in redo]
+    scores = computeSimilarityBlock(responses, sports, kinds, rows, cols,
+                                    same_kind_ok=True,
+                                    same_sport_ok=True).diagonal()
+    matches = list(matches)
+    for k, score in zip(redo, scores.tolist()):
+        matches[k] = [matches[k][0], score]
+    return matches
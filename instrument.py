@@ -0,0 +1,109 @@
+"""
+file: instrument.py
+date: 10/17/26
+----------------------
+Records where a run spends its time and memory.
+
+Wrap a stage of the pipeline in `with stage('name'):` (or decorate a
+function with `@stage('name')`) to record its wall time, CPU time, peak
+memory and any counts added with count() while it runs. Stages can be
+nested; a nested stage is reported as 'outer/inner', and its counts also
+add up in the stages around it.
+
+Peak memory is the process's peak resident set size so far, which is cheap
+to read but never goes down. For the peak of each stage on its own, call
+traceMemory() before the run (this slows allocation-heavy code down).
+
+writeReport saves everything as JSON, and resetReport starts over.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_records = []
+_open_stages = []
+_totals = {}
+_started = datetime.now().isoformat(timespec='seconds')
+
+def peakRSS():
+    """ Returns the peak resident set size of this process in MB. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def traceMemory():
+    """ Starts tracking each stage's own peak of allocated memory. """
+    tracemalloc.start()
+
+def count(name, k=1):
+    """ Adds K to counter NAME in every open stage and in the run totals. """
+    for record in _open_stages:
+        record['counts'][name] = record['counts'].get(name, 0) + k
+    _totals[name] = _totals.get(name, 0) + k
+
+@contextmanager
+def stage(name):
+    """ Records the enclosed stage (see above). """
+    parent = _open_stages[-1] if _open_stages else {}
+    path = f"{parent['stage']}/{name}" if parent else name
+    record = {'stage': path, 'counts': {}}
+    _records.append(record)
+    _open_stages.append(record)
+
+    """
+    tracemalloc has a single peak, which is reset here; the enclosing stage
+    keeps the peak it had reached so far in '_peak'.
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        parent['_peak'] = max(parent.get('_peak', 0),
+                              tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall seconds'] = time.perf_counter() - wall
+        record['cpu seconds'] = time.process_time() - cpu
+        record['peak rss mb'] = peakRSS()
+        if tracing:
+            peak = max(tracemalloc.get_traced_memory()[1],
+                       record.pop('_peak', 0))
+            record['peak traced mb'] = peak / 2**20
+            parent['_peak'] = max(parent.get('_peak', 0), peak)
+        _open_stages.remove(record)
+
+def report():
+    """ Returns the run report: every stage, in the order they started. """
+    return {
+        'started': _started,
+        'command': sys.argv,
+        'peak rss mb': peakRSS(),
+        'counts': dict(_totals),
+        'stages': [{key: value for key, value in record.items()
+                    if key != '_peak'} for record in _records],
+    }
+
+def resetReport():
+    """
+    Forgets every stage and count so far, so that a long-lived process (see
+    service.py) reports each of its runs on its own.
+    """
+    global _started
+    _records.clear()
+    _totals.clear()
+    _started = datetime.now().isoformat(timespec='seconds')
+
+def writeReport(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=4)
@@ -52,125 +52,198 @@ Each row has the following columns:
 60: Q7 - Topic Sentiment Score
 61: Q7 - Topics
 """
-import csv
-import copy
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import cProfile
+import io
 import json
 import os
 import random
+import time
 
 import numpy as np
 
-from similarity import *
-from plot import *
+from cohort import (buildPersonIndex, cohortPeople, cohortSize, loadCohort,
+                    lookupPerson, packCohort, permuteCohort, sportData,
+                    unpackCohort)
+from constraints import gradeArrays
+from history import (actualScores, loadHistory, pastAmong, pastPairs,
+                     pastRounds, penalizeScores)
+from checkpoint import (contentKey, fileHash, invalidate, loadCheckpoint,
+                        saveCheckpoint)
+from scoring import (INELIGIBLE, cohortArrays, computeSimilarityBlock,
+                     computeSimilarityMatrix, responseMatrix)
+from friends import fillSeeds, friendSeeds, seedPairs
+from groups import formGroups
+from output import sharedResponses, writeTable
+from stats import cohortStats
+from instrument import count, resetReport, stage, traceMemory, writeReport
+from matching import (greedyMatch, greedyMatchRuns, optimalMatch,
+                      shardMatch, sparseMatch, storeEdges)
 
 TEXT_FILE = 'data/Athlete Mingle_February 18, 2021_11.25.csv'
 NUMBER_FILE = 'data/Athlete Mingle_February 18, 2021_11.24.csv'
 OUT_PATH = 'output/03-01/'
 PLOT_PATH = OUT_PATH + 'plots/'
 
-MATCH_HEADER = 'p1 id,p1 name,p1 email,p1 sport,p1 year,p1 same grade,' + \
-               'p2 id,p2 name,p2 email,p2 sport,p2 year,p2 same grade,' + \
-               'score,question,response\n'
+# 'greedy' or 'optimal' (maximum-weight matching over every eligible pair,
+# which needs networkx and takes minutes for more than a few hundred people)
+MATCH_MODE = 'greedy'
+# Set to k to make 'optimal' only search each person's k best partners and
+# the greedy matches: much faster, but a heuristic that can miss the optimum
+# (see matching.optimalMatch).
+OPTIMAL_TOP_K = None
+# Set to k to match from each person's top k partners instead of the full
+# n x n score matrix (see scoring.candidateIndex for the memory bound).
+SPARSE_TOP_K = None
+# Set to s to match in shards of at most s people, one year at a time (see
+# matching.shardMatch), in a pool of SHARD_WORKERS processes (None means one
+# per core), instead of scoring everyone against everyone. SPARSE_TOP_K
+# takes precedence.
+SHARD_SIZE = None
+SHARD_WORKERS = None
+# Set to True to score the pairs tile by tile in a pool of SIMILARITY_WORKERS
+# processes (None means one per core), write them to sorted files in OUT_PATH
+# and match greedily as they are read back, instead of holding the n x n
+# score matrix in memory (see matching.storeEdges). Only for MATCH_MODE
+# 'greedy', and there are no heat maps of the scores.
+SCORE_STORE = False
+SIMILARITY_WORKERS = None
+SIMILARITY_TILE_SIZE = 2048
+# Set to False to ignore "Do you want to be placed with people in your
+# year?". Otherwise, someone who said yes is only matched with people in
+# their year (see constraints.py).
+SAME_GRADE = True
+# Any of 'csv', 'jsonl' and 'npz' (see output.writeTable)
+OUTPUT_FORMATS = ('csv',)
+# Set to True to skip printing every match while writing
+QUIET = False
+# Set to False (or pass --skip-analysis) to only write the matches
+ANALYZE = True
+# Number of processes drawing plots (None means one per core)
+PLOT_WORKERS = None
+# Set to True (or pass --preview-plots) for quick low-resolution plots
+PLOT_PREVIEW = False
+# Every run writes how long each stage took to OUT_PATH/REPORT_FILE (see
+# instrument.py). TRACE_MEMORY (--trace-memory) also measures each stage's
+# own peak memory, and PROFILE (--profile) saves a cProfile dump to
+# OUT_PATH/PROFILE_FILE; both slow the run down.
+REPORT_FILE = 'run_report.json'
+TRACE_MEMORY = False
+PROFILE = False
+PROFILE_FILE = 'profile.prof'
+# Set to True (or pass --checkpoints) to save the parsed cohort and the score
+# matrices to OUT_PATH/CHECKPOINT_DIR and reload them when the inputs haven't
+# changed (see checkpoint.py). --invalidate throws away the checkpoints of
+# some stages.
+CHECKPOINTS = False
+CHECKPOINT_DIR = 'checkpoints/'
+# Seed for shuffling people (--seed). None draws a new one, which is printed
+# and written to the summaries.
+SEED = None
+# Set to N (or pass --restarts N) to try N seeded shuffles, starting from
+# SEED (or 0), in a pool of RESTART_WORKERS processes and keep the one with
+# the best community score. Every seed's score goes to OUT_PATH/RESTARTS_FILE.
+RESTARTS = None
+RESTART_WORKERS = None
+RESTARTS_FILE = 'restarts.json'
+# Every run saves who was matched with whom to OUT_PATH/STATE_FILE. Pass
+# --update to only match the responses that came in since (see
+# updateMatches) instead of matching everyone again.
+STATE_FILE = 'match_state.json'
+# Output folders of past rounds (a glob) whose matches_*.csv and groups*.csv
+# are read so that nobody is paired or grouped with someone they were matched
+# with before (see history.py). Only rounds dated before this one count; a
+# round's date is the last response it matched (see latestResponse). Those
+# pairs are ruled out, or with HISTORY_PENALTY set, their score is lowered by
+# HISTORY_PENALTY * HISTORY_DECAY ** (rounds ago - 1). None turns this off.
+HISTORY_GLOB = 'output/*/'
+HISTORY_PENALTY = None
+HISTORY_DECAY = 0.5
+# How to order people in the score heat maps: None, 'match' (matched people
+# next to each other) or 'cluster' (similar people next to each other)
+HEAT_MAP_ORDER = 'match'
+
+PERSON_FIELDS = ['id', 'name', 'email', 'sport', 'year', 'same grade']
 
 ################################ Loading data #################################
 
-SPORT_DATA = {}
-with open('data/sports.json') as f:
-    SPORT_DATA = json.load(f)
+def shuffleOrder(n, seed):
+    """ Returns the order loadData puts N people in for SEED. """
+    order = list(range(n))
+    random.Random(seed).shuffle(order)
+    return order
 
-def loadData(verbose=False):
+def loadData(verbose=False, seed=None, shuffle=True):
+    """
+    Returns (people, seed): the people who finished the survey, shuffled with
+    SEED, and the seed. The exports are parsed in one streaming pass (see
+    cohort.loadCohort). If SEED is None, a new one is drawn; it is printed and
+    written to the summaries, so any run can be repeated with --seed. With
+    SHUFFLE=False, people are left in the order of the exports.
+    
+    With CHECKPOINTS, the parsed cohort and the seed are saved under a hash of
+    both exports. A rerun on the same exports without a seed loads them
+    instead, so it gets the same order (and matches); invalidate the 'cohort'
+    checkpoint for a new shuffle.
+    """
     print(f"{'=' * 10} Loading data {'=' * 10}")
-        
-    people = []
-    skip_ids = []
     
-    with open(NUMBER_FILE) as f:
-        _, column_headers, _, *responses = csv.reader(f)
-        
-        if verbose:
-            for i, column in enumerate(column_headers[25:54]):
-                print(f"{i}: {column}")
-        
-        """ Skip unfinished responses. """
-        for row in responses:
-            for res in row[25:54]:
-                if res == '':
-                    skip_ids.append(row[8])
-                    break
-        
-        i = 0
-        for row in responses:
-            if row[8] in skip_ids:
-                continue
-            
-            person = {
-                'index': i,
-                'qualtrics id': row[8],
-                'start date': row[0],
-                'end date': row[1],
-                'meta data': {
-                    'name': ' '.join(row[17].strip().split()).title(),
-                    'email': row[18].strip().lower(),
-                    'sport id': int(row[20]),
-                },
-                'athlete mingle': {
-                    '1-on-1': row[22] == '1',
-                    'friends': [f.strip() for f in row[23].split(',')
-                                if f != ''],
-                    'same grade': row[24] == '1',
-                    'speed-dating': row[54] == '1',
-                },
-                'responses': [int(x) for x in row[25:54]],
-            }
-            people.append(person)
-            
-            i += 1
+    if CHECKPOINTS:
+        key = contentKey(fileHash(NUMBER_FILE), fileHash(TEXT_FILE))
+        saved = loadCheckpoint(f'{OUT_PATH}{CHECKPOINT_DIR}', 'cohort', key)
+    else:
+        saved = None
     
-    """ Add additional string data to each person. """
-    with open(TEXT_FILE) as f:
-        _, column_headers, _, *responses = csv.reader(f)
+    if saved is not None:
+        print('Loaded the cohort from a checkpoint')
+        count('checkpoints loaded')
+        saved_seed = int(saved.pop('seed'))
+        seed = saved_seed if seed is None else seed
+        cohort = unpackCohort(saved)
+    else:
+        cohort = loadCohort(NUMBER_FILE, TEXT_FILE, verbose=verbose)
+        seed = random.randrange(2**32) if seed is None else seed
         
-        i = 0
-        for row in responses:
-            if row[8] in skip_ids:
-                continue
-            
-            assert people[i]['qualtrics id'] == row[8]
-            
-            people[i]['meta data']['year'] = row[19]
-            people[i]['meta data']['sport name'] = row[20]
-            people[i]['meta data']['major'] = row[21]
-            
-            i += 1
+        if CHECKPOINTS:
+            saveCheckpoint(f'{OUT_PATH}{CHECKPOINT_DIR}', 'cohort', key,
+                           {**packCohort(cohort), 'seed': np.array(seed)})
     
-    """ Randomize people so that the timestamp doesn't influence matches. """
-    # random.seed(42)
-    random.shuffle(people)
+    """ Randomize people so the timestamp doesn't influence matches. """
+    if shuffle:
+        print(f'Shuffling with seed {seed}')
+        cohort = permuteCohort(cohort, shuffleOrder(cohortSize(cohort), seed))
+    people = cohortPeople(cohort)
             
     print(f'There were {len(people)} responses ' + \
-          f'and {len(skip_ids)} unfinished surveys.')
+          f'and {cohort["skipped"]} unfinished surveys.')
     
     if verbose:
-        print(json.dumps(people[-1], indent=4))
+        print(json.dumps(people[-1], indent=4,
+                         default=np.ndarray.tolist))
     
-    return people
+    return people, seed
 
 ################################ Data analysis ################################
 
 def analyzeData(people):
+    """
+    Plots the cohort to PLOT_PATH. The plotting libraries are slow to import,
+    so they are only loaded here, when a run actually makes plots.
+    """
+    from plot import renderPlots
+    
     print(f"\n{'=' * 10} Analyzing data {'=' * 10}")
     
-    years = [person['meta data']['year'] for person in people]
-    majors = [person['meta data']['major'] for person in people]
-    sports = [person['meta data']['sport name'] for person in people]
-    responses = np.array([person['responses'] for person in people])
-
-    plotYears(years, out_path=f'{PLOT_PATH}years.png')
-    plotMajors(majors, out_path=f'{PLOT_PATH}majors.png')
-    plotSports(sports, out_path=f'{PLOT_PATH}sports.png')
-    plotKinds(sports, out_path=f'{PLOT_PATH}kinds.png')
-    plotYearKind(years, sports, out_path=f'{PLOT_PATH}yearsKinds.png')
-    plotResponses(responses, out_path=f'{PLOT_PATH}responses.png')
+    """ Count everything once (see stats.py); the plots only draw. """
+    stats = cohortStats(people, sportData())
+    
+    start = time.perf_counter()
+    drawn = renderPlots(stats, PLOT_PATH, workers=PLOT_WORKERS,
+                        preview=PLOT_PREVIEW)
+    print(f'Drew {len(drawn)} plot(s) in ' + \
+          f'{time.perf_counter() - start:.2f}s')
 
 ############################## Helper functions ###############################
 
@@ -184,218 +257,1067 @@ def separatePairsAndGroups(people):
             group.append(person)
     return one_on_one, group
 
-def findPerson(target_name, people):
-    for person in people:
-        if person['meta data']['name'] == target_name:
-            return person
+def personGrades(people):
+    """ Returns the GRADES of PEOPLE, or None if SAME_GRADE is off. """
+    return gradeArrays(people) if SAME_GRADE else None
+
+def latestResponse(people):
+    """ Returns the end date of the last survey of PEOPLE, or None. """
+    return max((person['end date'] for person in people), default=None)
+
+# The date of this round (see latestResponse), set by main
+_round = {'date': None}
+# (HISTORY_GLOB, round date) -> history index, read once per process
+_history = {}
 
-def computeSimilarities(people, same_kind_ok=False):
+def personHistory(people):
+    """
+    Returns the PAST pairs of PEOPLE (see history.pastPairs) from the rounds
+    before this one, or None if HISTORY_GLOB is None.
+    """
+    if HISTORY_GLOB is None:
+        return None
+    key = (HISTORY_GLOB, _round['date'])
+    if key not in _history:
+        rounds = pastRounds(HISTORY_GLOB, OUT_PATH, before=_round['date'])
+        _history[key] = loadHistory(rounds)
+        print(f'{len(_history[key])} pair(s) matched in ' + \
+              f'{len(rounds)} past round(s)')
+    
+    past = pastPairs(_history[key],
+                     [person['meta data']['email'] for person in people],
+                     penalty=HISTORY_PENALTY, decay=HISTORY_DECAY)
+    count('past pairs', len(past[0]))
+    return past
+
+@stage('resolveFriendRequests')
+def resolveFriendRequests(group, one_on_one=(), placed=()):
+    """
+    Returns a dictionary of index -> list of friends' indices (into GROUP)
+    for every person in GROUP. Nominations go both ways: if A puts down B,
+    B's list also contains A.
+    
+    Names and emails are resolved through an index built once (see
+    cohort.lookupPerson), so this is linear in the number of nominations.
+    Nominations that can't be resolved, are ambiguous, or only matched a
+    misspelled name are reported together at the end, as are nominations of
+    people in ONE_ON_ONE or PLACED (already matched in an earlier run).
+    """
+    index = buildPersonIndex(group)
+    one_on_one_index = buildPersonIndex(one_on_one)
+    placed_index = buildPersonIndex(placed)
+    
+    friend_dict = {i: [] for i in range(len(group))}
+    report = []
+    
+    for i, person in enumerate(group):
+        nominator = person['meta data']['name']
+        count('nominations', len(person['athlete mingle']['friends']))
+        for friend in person['athlete mingle']['friends']:
+            candidates, approximate = lookupPerson(index, friend, cutoff=None)
+            
+            # Someone put down a friend but friend signed up for 1-on-1
+            if len(candidates) == 0 and \
+               len(lookupPerson(one_on_one_index, friend, cutoff=None)[0]):
+                report.append((friend, nominator, '1-on-1'))
+                continue
+            if len(candidates) == 0 and \
+               len(lookupPerson(placed_index, friend, cutoff=None)[0]):
+                report.append((friend, nominator, 'already matched'))
+                continue
+            
+            # Otherwise, try to correct a misspelled name
+            if len(candidates) == 0:
+                candidates, approximate = lookupPerson(index, friend)
+                count('fuzzy name lookups')
+            
+            if len(candidates) != 1:
+                reason = 'ambiguous' if candidates else 'not found'
+                report.append((friend, nominator, reason))
+                continue
+            
+            j = candidates[0]
+            if j == i:
+                continue
+            if approximate:
+                report.append((friend, nominator,
+                               f"read as {group[j]['meta data']['name']}"))
+            
+            # add person and friend to corresponding element in friend_dict
+            if j not in friend_dict[i]:
+                friend_dict[i].append(j)
+            if i not in friend_dict[j]:
+                friend_dict[j].append(i)
+    
+    """
+    Sorted, so the lists don't depend on the order people were read in (see
+    shuffledInputs).
+    """
+    for friends in friend_dict.values():
+        friends.sort()
+    
+    if len(report) > 0:
+        print(f'{len(report)} friend request(s) need a look:')
+        for friend, nominator, reason in report:
+            print(f"{friend} ({reason})".ljust(40) + "nominated by " + \
+                  f"{nominator} (group)")
+    
+    return friend_dict
+
+@stage('computeSimilarities')
+def computeSimilarities(people, same_kind_ok=False, upper_only=False,
+                        arrays=None):
+    """
+    Returns the n x n matrix of compatibility scores, computed in one batch.
+    If UPPER_ONLY is True, only pairs (i, j) with i < j are scored. ARRAYS
+    are PEOPLE's scoring.cohortArrays, worked out here if not given.
+    
+    With CHECKPOINTS, the matrix is saved under a hash of everything it is
+    computed from and reloaded the next time the same people are scored.
+    """
     print('Computing compatibilities')
     
-    scores = np.zeros((len(people), len(people)))
-    for i, p1 in enumerate(people):
-        for j, p2 in enumerate(people):
-            scores[i][j] = computeSimilarity(p1, p2, same_kind_ok=same_kind_ok)
+    responses, sports, kinds = arrays or cohortArrays(people, sportData())
+    grades = personGrades(people)
+    saved = None
+    if CHECKPOINTS:
+        key = contentKey(responses, sports, kinds, grades, same_kind_ok,
+                         upper_only)
+        saved = loadCheckpoint(f'{OUT_PATH}{CHECKPOINT_DIR}', 'scores',
+                               key)
+    
+    if saved is not None:
+        print('Loaded the scores from a checkpoint')
+        count('checkpoints loaded')
+        scores = saved['scores']
+    else:
+        scores = computeSimilarityMatrix(responses, sports, kinds,
+                                         same_kind_ok=same_kind_ok,
+                                         upper_only=upper_only,
+                                         grades=grades)
+        if CHECKPOINTS:
+            saveCheckpoint(f'{OUT_PATH}{CHECKPOINT_DIR}', 'scores', key,
+                           {'scores': scores})
     
     print(scores)
-    # plotHeatMap(scores, out_path=f'{OUT_PATH}confusion_matrix.png')
     print()
     
     return scores
     
-def findSimilarResponse(p1, p2, p3=None, p4=None):
+def plotScores(scores, matches, out_path):
+    """ Draws the heat map of SCORES, ordered by HEAT_MAP_ORDER. """
+    from plot import clusterOrder, matchOrder, plotHeatMap
+    
+    order = None
+    if HEAT_MAP_ORDER == 'match':
+        order = matchOrder(matches, len(scores))
+    elif HEAT_MAP_ORDER == 'cluster':
+        order = clusterOrder(scores)
+    plotHeatMap(scores, out_path, order=order)
+    
+def findSimilarResponse(p1, p2, p3=None, p4=None, rng=None):
     """
     Returns a random similar response. A response is the same if for each
     person, the person is None, or the response is the same as p1's response.
+    If no response is the same for everyone, returns empty strings.
     
-    Here is the numpy code when there are only 2 people:
-        same_responses = np.argwhere(res1 == res2).flatten()
+    The writers pick responses for all matches at once with
+    output.sharedResponses; this is the same thing for a single match.
     """
-    res1 = np.array(p1['responses'])
-    res2 = np.array(p2['responses'])
-    res3 = np.array(p3['responses']) if p3 else None
-    res4 = np.array(p4['responses']) if p4 else None
+    people = [p for p in [p1, p2, p3, p4] if p]
+    questions, answers = sharedResponses(responseMatrix(people),
+                                         [list(range(len(people)))], rng=rng)
     
-    same_responses = []
-    for i in range(len(res1)):
-        if ((res1[i] == res2[i]) and
-            (not p3 or res1[i] == res3[i]) and
-            (not p4 or res1[i] == res4[i])):
-            same_responses.append(i)
-    
-    question_num = np.random.choice(same_responses)
-    response = res1[question_num]
-    
-    return question_num, response
+    if questions[0] < 0:
+        return '', ''
+    return questions[0], answers[0]
 
 def adjustScore(old_score):
     old_score = .5 if old_score < 0 else old_score
     return .5115 * old_score + .5561
 
-def writeMatchesToFile(matches, people, out_path, first=True, last=True):
+def communityScore(matches):
+    """ Returns the average adjusted score of MATCHES. """
+    if len(matches) == 0:
+        return 0.0
+    return sum(adjustScore(match[1]) for match in matches) / len(matches)
+
+def matchTable(matches, people, rng=None):
     """
-    params:
-        first - True if this is the first set of matches written to the file
-        last - True if this is the last set of matches written to the file
+    Returns the table (column name -> list of values) describing MATCHES.
+    Each match is [ids, score], where ids holds two or more indices into
+    PEOPLE; there are one set of person columns per member. Scores are
+    adjusted, and question/response are None if nothing is shared.
     """
-    mode = 'w' if first else 'a'
-    with open(out_path, mode) as f:
-        if first:
-            f.write(MATCH_HEADER)
-        
-        community_score = 0.0
-        
-        for match in matches:
-            p1_id, p2_id = match[0]
-            
-            p1 = people[p1_id]
-            p2 = people[p2_id]
-            
-            p1_info = p1['meta data']
-            p2_info = p2['meta data']
-            
-            question_num, response = findSimilarResponse(p1, p2)
-            score = adjustScore(match[1])
-            
-            print("Person " + f"{p1_id}".rjust(3) + f" matched with " + \
-                  "Person " + f"{p2_id}".rjust(3) + \
-                  f" (score: {score:.4%})")
-            f.write(f"{p1_id},{p1_info['name']},{p1_info['email']}," + \
-                    f"{p1_info['sport name']},{p1_info['year']}," + \
-                    f"{p1['athlete mingle']['same grade']}," + \
-                    f"{p2_id},{p2_info['name']},{p2_info['email']}," + \
-                    f"{p2_info['sport name']},{p2_info['year']}," + \
-                    f"{p2['athlete mingle']['same grade']}," + \
-                    f"{score:.4%},{question_num},{response}\n")
-            
-            community_score += score
-            
-        community_score /= len(matches)
+    size = len(matches[0][0]) if len(matches) > 0 else 2
+    table = {f'p{n} {field}': [] for n in range(1, size + 1)
+             for field in PERSON_FIELDS}
+    table.update({'score': [], 'question': [], 'response': []})
+    
+    questions, answers = sharedResponses(responseMatrix(people),
+                                         [match[0] for match in matches],
+                                         rng=rng)
+    
+    for match, question_num, response in zip(matches, questions, answers):
+        for n, i in enumerate(match[0], 1):
+            person = people[i]
+            info = person['meta data']
+            for field, value in zip(PERSON_FIELDS, [
+                    int(i), info['name'], info['email'], info['sport name'],
+                    info['year'], person['athlete mingle']['same grade']]):
+                table[f'p{n} {field}'].append(value)
         
-        message = f"\nCommunity score: {community_score:.4%}\n"
-        print(message)
-        f.write(message)
+        table['score'].append(adjustScore(match[1]))
+        table['question'].append(int(question_num) if question_num >= 0
+                                 else None)
+        table['response'].append(int(response) if question_num >= 0
+                                 else None)
+    
+    return table
 
-        if not last:
-            f.write('\n')
+@stage('writeMatchesToFile')
+def writeMatchesToFile(matches, people, out_base, columns=None, summary=None,
+                       formats=None, quiet=None, rng=None):
+    """
+    Writes MATCHES (pairs or groups) to OUT_BASE in every one of FORMATS
+    (OUTPUT_FORMATS by default), with the community score in a separate
+    OUT_BASE.summary.json.
+    
+    params:
+        columns - extra columns (name -> list of values) to add to the table
+        summary - extra entries for the summary file
+        quiet - skip printing every match (QUIET by default)
+        rng - seed or np.random.Generator for picking the shared responses
+    """
+    formats = OUTPUT_FORMATS if formats is None else formats
+    quiet = QUIET if quiet is None else quiet
+    
+    table = matchTable(matches, people, rng=rng)
+    table.update(columns or {})
+    
+    if not quiet:
+        for match, score in zip(matches, table['score']):
+            first, *others = match[0]
+            print("Person " + f"{first}".rjust(3) + " matched with " + \
+                  ", ".join("Person " + f"{i}".rjust(3) for i in others) + \
+                  f" (score: {score:.4%})")
+    
+    community_score = sum(table['score']) / max(len(matches), 1)
+    print(f"\nCommunity score: {community_score:.4%}\n")
+    
+    summary = {'matches': len(matches), 'community score': community_score,
+               'round date': _round['date'], **(summary or {})}
+    writeTable(table, out_base, formats=formats, summary=summary,
+               csv_formats={'score': '{:.4%}'})
 
 ################################## Matching ###################################
 
-def makePairMatches(people):
+@stage('makePairMatches')
+def makePairMatches(people, mode='greedy', top_k=None, store_path=None,
+                    heat_map_path=None, scores=None):
     """
     Returns an array of matches where each match is a list of length 2. The
     frist element of the list is a pair of indices into the PEOPLE array. The
     second element of the list is the computed score for that pair.
     
-    This algorithm uses a greedy algorithm: find the highest match, then pair
-    those two and remove them from set of matches.
+    By default this uses a greedy algorithm: find the highest match, then pair
+    those two and remove them from set of matches. The candidate pairs are
+    sorted once up front (see matching.greedyMatch) rather than searching the
+    whole matrix for every match.
+    
+    With mode='optimal', this instead finds a maximum-weight matching (see
+    matching.optimalMatch) and reports how it compares to the greedy one.
+    
+    If TOP_K is set, only each person's TOP_K best partners are kept (see
+    matching.sparseMatch) and the dense score matrix is never built.
+    Otherwise, SCORES (if given) are used as PEOPLE's scores, or else with
+    SHARD_SIZE set, PEOPLE are matched in shards (see matching.shardMatch),
+    or else with STORE_PATH the pairs are written to sorted runs in that
+    folder and matched greedily from there (see matching.storeEdges). If
+    HEAT_MAP_PATH is given and there is a score matrix, the scores are
+    plotted there (see plotScores).
+    
+    Pairs matched in past rounds (see HISTORY_GLOB) are ruled out or
+    penalized; SCORES are changed in place for that.
     """
-    original_scores = computeSimilarities(people)
-    scores = copy.deepcopy(original_scores)
+    assert mode in ('greedy', 'optimal'), f'Unknown matching mode: {mode}'
+    
+    past = personHistory(people)
+    arrays = cohortArrays(people, sportData())
+    grades = personGrades(people)
+    sharded = top_k is None and scores is None and SHARD_SIZE is not None
+    stored = top_k is None and scores is None and not sharded and \
+             store_path is not None
+    if sharded:
+        print(f'Matching in shards of up to {SHARD_SIZE}')
+    elif stored:
+        assert mode == 'greedy', \
+            'SCORE_STORE only matches greedily; use SPARSE_TOP_K instead'
+        print('Computing compatibilities')
+        with stage('storeEdges'):
+            runs = storeEdges(*arrays, store_path, workers=SIMILARITY_WORKERS,
+                              tile_size=SIMILARITY_TILE_SIZE, grades=grades,
+                              past=past)
+    elif top_k is None and scores is None:
+        scores = computeSimilarities(people, upper_only=True, arrays=arrays)
+    elif top_k is not None:
+        print(f'Indexing top {top_k} compatibilities')
+    
+    if scores is not None and past is not None:
+        penalizeScores(scores, past)
     
     print('Creating matches')
     
-    unmatched = set(range(len(people)))
-    matches = []
-    while (len(unmatched) > 1):
-        ind = np.unravel_index(np.argmax(scores, axis=None), scores.shape)
-        matches.append([ind, scores[ind]])
+    if sharded:
+        matches, unmatched = shardMatch(*arrays, SHARD_SIZE, mode=mode,
+                                        grades=grades, past=past,
+                                        workers=SHARD_WORKERS,
+                                        optimal_top_k=OPTIMAL_TOP_K)
+    elif stored:
+        matches, unmatched = greedyMatchRuns(len(people), runs)
+    elif top_k is None:
+        matches, unmatched = greedyMatch(scores)
+    else:
+        matches, unmatched = sparseMatch(*arrays, top_k, grades=grades,
+                                         past=past)
+    
+    greedy = None
+    if mode == 'optimal' and not sharded:
+        greedy = matchLeftovers(matches, unmatched, arrays, past)[0]
         
-        for i in ind:
-            assert i in unmatched, 'Ran out of matches. Please re-run.'
-            
-            unmatched.remove(i)
-            scores[i, :] = -1
-            scores[:, i] = -1
-            
-    if len(unmatched) == 1:
+        start = time.perf_counter()
+        if top_k is None:
+            matches, unmatched = optimalMatch(scores, top_k=OPTIMAL_TOP_K,
+                                              greedy=matches)
+        else:
+            matches, unmatched = sparseMatch(*arrays, top_k, mode='optimal',
+                                             grades=grades, past=past,
+                                             optimal_top_k=OPTIMAL_TOP_K)
+        elapsed = time.perf_counter() - start
+    
+    paired = len(matches)
+    matches, unmatched = matchLeftovers(matches, unmatched, arrays, past,
+                                        mode=mode)
+    if len(matches) > paired:
+        print(f'{2 * (len(matches) - paired)} people matched outside ' + \
+              'their year')
+        count('matched outside their year', 2 * (len(matches) - paired))
+    
+    """
+    Both matchings are compared once everyone they can match is matched;
+    the optimal one may match more people, so the totals are shown too.
+    """
+    if greedy is not None:
+        improvement = communityScore(matches) - communityScore(greedy)
+        print(f'Optimal matching took {elapsed:.2f}s. Community score: ' + \
+              f'{communityScore(matches):.4%} ({improvement:+.4%} vs ' + \
+              'greedy)')
+        for name, found in [('optimal', matches), ('greedy', greedy)]:
+            print(f'    {name}: {len(found)} matches, total adjusted ' + \
+                  f'score {communityScore(found) * len(found):.4f}')
+    
+    """ Penalized pairs that were matched anyway get their real scores back """
+    if past is not None and np.isfinite(past[1]).any():
+        matches = actualScores(matches, past, *arrays)
+    
+    for i in unmatched:
         print('WARNING: Someone is left unmatched.')
-        print(json.dumps(people[list(unmatched)[0]], indent=4))
+        print(json.dumps(people[i], indent=4,
+                         default=np.ndarray.tolist))
+    
+    if heat_map_path is not None and scores is not None:
+        plotScores(scores, matches, heat_map_path)
     
     return matches
 
-def matchGroups(group):
+def matchLeftovers(matches, unmatched, arrays, past, mode='greedy'):
+    """
+    Being placed with people in your year is a wish, not a must: returns
+    (matches, unmatched) with the people in UNMATCHED, whom the same-grade
+    answers left without a partner, matched among themselves without them
+    (ARRAYS and PAST are everyone's, as in makePairMatches). Only does
+    anything with SAME_GRADE.
+    """
+    if not SAME_GRADE or len(unmatched) < 2:
+        return matches, unmatched
+    
+    leftovers = np.array(unmatched)
+    responses, sports, kinds = [values[leftovers] for values in arrays]
+    everyone = np.arange(len(leftovers))
+    block = computeSimilarityBlock(responses, sports, kinds, everyone,
+                                   everyone)
+    block[np.tril_indices(len(leftovers))] = INELIGIBLE
+    if past is not None:
+        penalizeScores(block, pastAmong(past, leftovers))
+    
+    if mode == 'optimal':
+        found, unmatched = optimalMatch(block, top_k=OPTIMAL_TOP_K)
+    else:
+        found, unmatched = greedyMatch(block)
+    return (matches + [[(int(leftovers[i]), int(leftovers[j])), score]
+                       for (i, j), score in found],
+            leftovers[unmatched].tolist())
+
+def upperScores(scores, ids):
+    """
+    Returns the scores among IDS (indices into SCORES) in the shape
+    computeSimilarities(upper_only=True) gives: only pairs (i, j) with i < j.
+    """
+    block = scores[np.ix_(ids, ids)]
+    block[np.tril_indices(len(ids))] = INELIGIBLE
+    return block
+
+def poolScores(people, ids, scores):
+    """
+    Returns the full score matrix of PEOPLE, in their order, taken from
+    SCORES, the matrix of the people with the qualtrics IDS.
+    """
+    at = {qualtrics_id: k for k, qualtrics_id in enumerate(ids)}
+    order = [at[person['qualtrics id']] for person in people]
+    return scores[np.ix_(order, order)]
+
+def pairGroup(group, friend_dict, mode='greedy', top_k=None, scores=None,
+              heat_map_path=None):
+    """
+    Returns (matches, friend_matches, everyone, preformed) for GROUP: the
+    pair matches of people who didn't put down a friend, the pairs of
+    friends, the list both of them index into, and [(a, b), score] for each
+    seed of four friends, with a and b the positions of its pairs in
+    matches + friend_matches.
+    
+    FRIEND_DICT is the output of resolveFriendRequests. SCORES, if given, is
+    the full score matrix of GROUP, from which the people without friend
+    requests are matched instead of scoring them again.
+    """
+    """
+    Cut each cluster of friends into seed pairs and groups (see friends.py).
+    Seeds of three are completed with the best-scoring person who didn't put
+    down a friend and is eligible with all three.
+    """
+    seeds = friendSeeds(friend_dict)
+    seeded = {i for seed in seeds for i in seed}
+    remaining = [i for i in range(len(group)) if i not in seeded]
+    
+    if len(seeds) > 0:
+        responses, sports, kinds = cohortArrays(group, sportData())
+        grades = personGrades(group)
+    
+    open_seeds = [seed for seed in seeds if len(seed) == 3]
+    if len(open_seeds) > 0 and len(remaining) > 0:
+        members = [i for seed in open_seeds for i in seed]
+        seed_scores = computeSimilarityBlock(responses, sports, kinds,
+                                             members, remaining, grades=grades)
+        seed_scores = np.where(seed_scores > INELIGIBLE, seed_scores, -np.inf)
+        seed_scores = seed_scores.reshape(len(open_seeds), 3, -1).sum(axis=1)
+    
+        fillers = fillSeeds(seed_scores)
+        for seed, filler in zip(open_seeds, fillers):
+            if filler >= 0:
+                seed.append(remaining[filler])
+        filled = set(fillers)
+        remaining = [i for k, i in enumerate(remaining) if k not in filled]
+    
+    """ Separate into people who put friend requests and people who didn't """
+    friend_requests = []
+    friend_scores = []
+    # indices into GROUP of the people who didn't
+    unpaired = list(remaining)
+    
+    # [position in friend_requests where a seed of four starts, its score]
+    preformed = []
+    
+    for seed in seeds:
+        # a seed of three that couldn't be completed: match the third normally
+        if len(seed) == 3:
+            unpaired.append(seed.pop())
+    
+        """
+        Friends are paired whatever their sports. The rules still hold for
+        the others in a seed: friends of friends, and the filler. Only the
+        seed's rows are passed, so they aren't prepared for everyone again.
+        """
+        arrays = responses[seed], sports[seed], kinds[seed]
+        members = range(len(seed))
+        seed_scores = np.where(
+            [[j in friend_dict[i] for j in seed] for i in seed],
+            computeSimilarityBlock(*arrays, members, members,
+                                   same_kind_ok=True, same_sport_ok=True),
+            computeSimilarityBlock(*arrays, members, members,
+                                   grades=None if grades is None else
+                                          grades[seed]))
+        if len(seed) == 4:
+            score = seed_scores[np.triu_indices(4, 1)].mean()
+            preformed.append([len(friend_requests), float(score)])
+        for a, b in seedPairs(seed_scores):
+            friend_requests.extend([group[seed[a]], group[seed[b]]])
+            friend_scores.append(float(seed_scores[a, b]))
+    no_friend_requests = [group[i] for i in unpaired]
+    
+    # matches with no friend requests
+    store_path = f'{OUT_PATH}scores_group/' if SCORE_STORE else None
+    matches = makePairMatches(no_friend_requests, mode=mode, top_k=top_k,
+                              store_path=store_path,
+                              heat_map_path=heat_map_path,
+                              scores=None if scores is None else
+                                     upperScores(scores, unpaired))
+    
+    # matches with friend requests, scored with their seeds above
+    friend_matches = [[(2 * k, 2 * k + 1), score]
+                      for k, score in enumerate(friend_scores)]
+    
+    """
+    Both sets of matches index into EVERYONE, with the friend pairs shifted
+    past the others.
+    """
+    everyone = no_friend_requests + friend_requests
+    offset = len(no_friend_requests)
+    friend_matches = [[(offset + i, offset + j), score]
+                      for (i, j), score in friend_matches]
+    preformed = [[(len(matches) + start // 2, len(matches) + start // 2 + 1),
+                  score] for start, score in preformed]
+    
+    return matches, friend_matches, everyone, preformed
+
+def matchGroups(group, mode='greedy', top_k=None, one_on_one=(),
+                heat_map=False, friend_dict=None, scores=None, seed=None):
     """
     Create pair matches. We must respect match requests for people who put a
     friend's name down. Thus, there is some additional processing to figure out
-    hard matches. Then, the rest of the people are matched into pairs using the
-    same algorithm for one-on-ones.
+    hard matches: friends (and friends of friends) are kept together in seed
+    pairs or groups. Then, the rest of the people are matched into pairs using
+    the same algorithm for one-on-ones (MODE and TOP_K are passed through to
+    makePairMatches). ONE_ON_ONE is only used to explain nominations of
+    people who signed up for 1-on-1. With HEAT_MAP, their scores are plotted
+    to PLOT_PATH. See pairGroup for FRIEND_DICT and SCORES, which are worked
+    out here if not given.
     
-    Afterwards, we will go through the matches by hand, cleaning any poor
-    matches. Lastly, we will manually combine pairs together to create groups
-    of four.
+    Lastly, pairs are combined into groups of four (see groups.formGroups,
+    which also gets TOP_K) and written one row per group to groups.csv.
+    SEED (the shuffle's) goes into the summaries and picks the shared
+    responses. We still go through the matches by hand afterwards to clean
+    up any poor ones.
+    
+    Returns the group part of the match state (see poolState).
     """
     print(f"\n{'=' * 10} Matching groups {'=' * 10}")
     
     """ Aggregate all friend requests """
-    # dictionary of name -> list of friends' names
-    friend_dict = {person['meta data']['name']: [] for person in group}
+    # dictionary of index -> list of friends' indices
+    if friend_dict is None:
+        friend_dict = resolveFriendRequests(group, one_on_one)
     
-    for person in group:
-        for friend in person['athlete mingle']['friends']:
-            # Someone put down a friend but friend signed up for 1-on-1
-            if friend not in friend_dict:
-                print(f"{friend} (1-on-1)".ljust(25) + f"nominated by " + \
-                      f"{person['meta data']['name']} (group)")
-                continue
-            # add person and friend to corresponding element in friend_dict
-            if friend not in friend_dict[person['meta data']['name']]:
-                friend_dict[person['meta data']['name']].append(friend)
-            if person['meta data']['name'] not in friend_dict[friend]:
-                friend_dict[friend].append(person['meta data']['name'])
+    heat_map_path = f'{PLOT_PATH}scores_group.png' if heat_map else None
+    matches, friend_matches, everyone, preformed = pairGroup(
+        group, friend_dict, mode=mode, top_k=top_k, scores=scores,
+        heat_map_path=heat_map_path)
     
-    """ Separate into people who put friend requests and people who didn't """
-    friend_requests = []
-    no_friend_requests = []
-            
-    for name, friends in friend_dict.items():
-        if len(friends) == 0:
-            no_friend_requests.append(findPerson(name, group))
-        else:
-            # if the person is already included, don't create a duplicate match
-            for person in friend_requests:
-                if person['meta data']['name'] == friends[0]:
-                    break
-            else:
-                """
-                Only get the first friend. Add the person and friend to the
-                list. Append the indices to matches with the computed score.
-                """
-                p1, p2 = findPerson(name, group), findPerson(friends[0], group)
-                friend_requests.extend([p1, p2])
+    """ Both sets of matches are written together. """
+    friend_request = [False] * len(matches) + [True] * len(friend_matches)
+    writeMatchesToFile(matches + friend_matches, everyone,
+                       f'{OUT_PATH}matches_group',
+                       columns={'friend request': friend_request},
+                       summary={
+                           'community score (no friend request)':
+                               communityScore(matches),
+                           'community score (friend request)':
+                               communityScore(friend_matches),
+                           'seed': seed,
+                       }, rng=seed)
+    
+    """
+    Combine the pairs into groups of four (see groups.py). Pairs from the
+    same seed of four friends stay together.
+    """
+    print('Creating groups')
+    
+    pairs = [match[0] for match in matches + friend_matches]
+    within = [match[1] for match in matches + friend_matches]
+    
+    with stage('formGroups'):
+        groups, leftover = formGroups(pairs,
+                                      *cohortArrays(everyone, sportData()),
+                                      preformed=preformed, mode=mode,
+                                      grades=personGrades(everyone),
+                                      past=personHistory(everyone),
+                                      within=within, top_k=top_k)
+        count('groups', len(groups))
+    writeMatchesToFile(groups, everyone, f'{OUT_PATH}groups',
+                       summary={'seed': seed}, rng=seed)
+    
+    for pair in leftover:
+        print('WARNING: A pair is left without a group.')
+        print(json.dumps([everyone[i] for i in pair], indent=4,
+                         default=np.ndarray.tolist))
+    
+    return poolState(matches + friend_matches, everyone,
+                     {'friend request': friend_request}, groups)
 
-    # matches with no friend requests
-    matches = makePairMatches(no_friend_requests)
-    writeMatchesToFile(matches, no_friend_requests,
-                       f'{OUT_PATH}matches_group.csv', last=False)
-    
-    # matches with friend requests
-    matches = []
-    
-    for i in range(0, len(friend_requests) - 1, 2):
-        p1, p2 = friend_requests[i:i+2]
-        score = computeSimilarity(p1, p2, same_kind_ok=True,
-                                  same_sport_ok=True)
-        matches.append([(i, i + 1), score])
+def matchOneOnOnes(one_on_one, mode='greedy', top_k=None, heat_map=False,
+                   scores=None, seed=None):
+    """
+    Matches and writes the people who signed up for 1-on-1 (see matchGroups
+    for SEED). Returns the 1-on-1 part of the match state.
+    """
+    print(f"\n{'=' * 10} Matching one-on-ones {'=' * 10}")
+    
+    store_path = f'{OUT_PATH}scores_1-on-1/' if SCORE_STORE else None
+    heat_map_path = f'{PLOT_PATH}scores_1-on-1.png' if heat_map else None
+    matches = makePairMatches(one_on_one, mode=mode, top_k=top_k,
+                              store_path=store_path,
+                              heat_map_path=heat_map_path, scores=scores)
+    writeMatchesToFile(matches, one_on_one, f'{OUT_PATH}matches_1-on-1',
+                       summary={'seed': seed}, rng=seed)
+    return poolState(matches, one_on_one)
+
+############################### Late submissions ##############################
+
+def poolState(matches, people, columns=None, groups=(), group_columns=None):
+    """
+    Returns the match state of one pool (1-on-1 or group), ready to be saved
+    as JSON: the order of PEOPLE, its MATCHES and, for the group pool, its
+    GROUPS, all indices into PEOPLE. Everyone is named by qualtrics id, so
+    the state can be read back against a newer export (see stateMatches and
+    savedOrder).
+    
+    Each match is {'ids', 'score', 'round'} plus its value of each of COLUMNS
+    (name -> list of values, as in writeMatchesToFile); GROUP_COLUMNS are the
+    same for GROUPS. 'round' is 0 unless the columns give one.
+    """
+    def entries(found, columns):
+        return [{'ids': [people[i]['qualtrics id'] for i in ids],
+                 'score': float(score), 'round': 0,
+                 **{name: values[k] for name, values in columns.items()}}
+                for k, (ids, score) in enumerate(found)]
+    
+    matched = {i for ids, _ in matches for i in ids}
+    return {
+        'order': [person['qualtrics id'] for person in people],
+        'matches': entries(matches, columns or {}),
+        'unmatched': [person['qualtrics id']
+                      for i, person in enumerate(people) if i not in matched],
+        'groups': entries(groups, group_columns or {}),
+    }
+
+def stateMatches(entries, index):
+    """
+    Returns (matches, entries): the saved ENTRIES (see poolState) as
+    [ids, score] matches with INDEX (qualtrics id -> position), and the
+    entries they came from. Entries with someone who is no longer in the
+    exports are dropped with a warning.
+    """
+    matches, kept = [], []
+    for entry in entries:
+        if any(i not in index for i in entry['ids']):
+            print(f"WARNING: Dropping the match of {entry['ids']}, " + \
+                  "someone is no longer in the exports.")
+            continue
+        matches.append([tuple(index[i] for i in entry['ids']),
+                        entry['score']])
+        kept.append(entry)
+    return matches, kept
+
+def loadMatchState():
+    """ Returns the match state saved by the last run, or None. """
+    path = f'{OUT_PATH}{STATE_FILE}'
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def saveMatchState(state):
+    with open(f'{OUT_PATH}{STATE_FILE}', 'w') as f:
+        json.dump(state, f, indent=4)
+
+def savedOrder(people, section):
+    """
+    Returns PEOPLE (everyone in one pool now) in the order saved in SECTION,
+    followed by the people who weren't in the last run in the order of the
+    exports, so that everyone keeps their id in the match files.
+    """
+    position = {i: k for k, i in enumerate(section.get('order', []))}
+    return sorted(people, key=lambda person: position.get(
+        person['qualtrics id'], len(position)))
+
+def latePool(people, section):
+    """
+    Returns (index, kept, entries, pool) for one pool of PEOPLE (everyone in
+    it now) and its saved SECTION: qualtrics id -> position in PEOPLE, the
+    saved matches that still stand (see stateMatches), and the positions of
+    everyone else. The pool starts with the people who were already waiting
+    (left unmatched, or whose match was dropped), followed by the late ones.
+    """
+    index = {person['qualtrics id']: i for i, person in enumerate(people)}
+    kept, entries = stateMatches(section['matches'], index)
+    
+    known = set(section['unmatched'])
+    known.update(i for entry in section['matches'] for i in entry['ids'])
+    matched = {i for ids, _ in kept for i in ids}
+    
+    waiting = [i for i, person in enumerate(people)
+               if i not in matched and person['qualtrics id'] in known]
+    late = [i for i, person in enumerate(people)
+            if person['qualtrics id'] not in known]
+    print(f'{len(late)} late response(s), {len(waiting)} waiting from ' + \
+          'earlier runs')
+    count('late people', len(late))
+    return index, kept, entries, waiting + late
+
+def updateOneOnOnes(one_on_one, section, round_, mode='greedy', top_k=None,
+                    seed=None):
+    """
+    Matches the late 1-on-1 people among themselves and with whoever was
+    left unmatched, keeping every match in SECTION (the 1-on-1 part of the
+    last state), and writes all of them with the round each was made in.
+    Returns the new SECTION.
+    """
+    print(f"\n{'=' * 10} Updating one-on-ones {'=' * 10}")
+    
+    _, kept, entries, pool = latePool(one_on_one, section)
+    
+    found = []
+    if len(pool) > 1:
+        found = makePairMatches([one_on_one[i] for i in pool], mode=mode,
+                                top_k=top_k)
+    found = [[tuple(pool[i] for i in ids), score] for ids, score in found]
+    
+    """
+    Old matches stay first, so they keep their shared question (see
+    output.sharedResponses).
+    """
+    rounds = [entry['round'] for entry in entries] + [round_] * len(found)
+    writeMatchesToFile(kept + found, one_on_one, f'{OUT_PATH}matches_1-on-1',
+                       columns={'round': rounds},
+                       summary={'seed': seed, 'round': round_}, rng=seed)
+    return poolState(kept + found, one_on_one, {'round': rounds})
+
+def updateGroups(group, section, round_, mode='greedy', top_k=None,
+                 one_on_one=(), seed=None):
+    """
+    Same as updateOneOnOnes for the group pool. The late people and those
+    left unmatched are paired as in matchGroups, friend requests among them
+    included, and the new pairs are combined into groups with the pairs that
+    are still without a group. Existing pairs and groups are kept.
+    """
+    print(f"\n{'=' * 10} Updating groups {'=' * 10}")
+    
+    index, kept, entries, pool = latePool(group, section)
+    placed = [group[i] for ids, _ in kept for i in ids]
+    
+    found, preformed, friend_request = [], [], []
+    if len(pool) > 0:
+        members = [group[i] for i in pool]
+        friend_dict = resolveFriendRequests(members, one_on_one, placed)
+        matches, friend_matches, everyone, preformed = pairGroup(
+            members, friend_dict, mode=mode, top_k=top_k)
         
-    writeMatchesToFile(matches, friend_requests,
-                       f'{OUT_PATH}matches_group.csv', first=False)
+        to_group = [index[person['qualtrics id']] for person in everyone]
+        found = [[tuple(to_group[i] for i in ids), score]
+                 for ids, score in matches + friend_matches]
+        friend_request = [False] * len(matches) + [True] * len(friend_matches)
+    
+    friend_request = [entry['friend request'] for entry in entries] + \
+                     friend_request
+    rounds = [entry['round'] for entry in entries] + [round_] * len(found)
+    writeMatchesToFile(kept + found, group, f'{OUT_PATH}matches_group',
+                       columns={'friend request': friend_request,
+                                'round': rounds},
+                       summary={'seed': seed, 'round': round_}, rng=seed)
+    
+    """
+    The new pairs join the old pairs without a group: those left over last
+    time and those whose group was dropped.
+    """
+    print('Creating groups')
+    
+    kept_groups, group_entries = stateMatches(section['groups'], index)
+    grouped = {i for ids, _ in kept_groups for i in ids}
+    waiting = [match for match in kept if match[0][0] not in grouped]
+    pairs = [ids for ids, _ in waiting + found]
+    preformed = [[(a + len(waiting), b + len(waiting)), score]
+                 for (a, b), score in preformed]
+    
+    with stage('formGroups'):
+        groups, leftover = formGroups(pairs, *cohortArrays(group, sportData()),
+                                      preformed=preformed, mode=mode,
+                                      grades=personGrades(group),
+                                      past=personHistory(group),
+                                      within=[score for _, score in
+                                              waiting + found], top_k=top_k)
+        count('groups', len(groups))
+    
+    group_rounds = [entry['round'] for entry in group_entries] + \
+                   [round_] * len(groups)
+    writeMatchesToFile(kept_groups + groups, group, f'{OUT_PATH}groups',
+                       columns={'round': group_rounds},
+                       summary={'seed': seed, 'round': round_}, rng=seed)
+    
+    for pair in leftover:
+        print('WARNING: A pair is left without a group.')
+        print(json.dumps([group[i] for i in pair], indent=4,
+                         default=np.ndarray.tolist))
+    
+    return poolState(kept + found, group,
+                     {'friend request': friend_request, 'round': rounds},
+                     kept_groups + groups, {'round': group_rounds})
 
-def matchOneOnOnes(one_on_one):
-    print(f"\n{'=' * 10} Matching one-on-ones {'=' * 10}")
+@stage('updateMatches')
+def updateMatches(people, state, mode='greedy', top_k=None):
+    """
+    Matches only the people in PEOPLE (everyone in the exports now) who
+    weren't in the run that saved STATE. Everyone matched before keeps their
+    match; the late people are matched among themselves and with whoever was
+    left unmatched. For k late and u unmatched people only those (k + u)^2
+    pairs are scored, instead of everyone's.
     
-    matches = makePairMatches(one_on_one)
-    writeMatchesToFile(matches, one_on_one, f'{OUT_PATH}matches_1-on-1.csv')
+    Returns the new state, whose 'round' counts the updates so far.
+    """
+    round_ = state['round'] + 1
+    one_on_one, group = separatePairsAndGroups(people)
+    one_on_one = savedOrder(one_on_one, state['1-on-1'])
+    group = savedOrder(group, state['group'])
+    
+    with stage('update one-on-ones'):
+        one_on_one_state = updateOneOnOnes(one_on_one, state['1-on-1'],
+                                           round_, mode=mode, top_k=top_k,
+                                           seed=state['seed'])
+    with stage('update groups'):
+        group_state = updateGroups(group, state['group'], round_, mode=mode,
+                                   top_k=top_k, one_on_one=one_on_one,
+                                   seed=state['seed'])
+    
+    return {'seed': state['seed'], 'round': round_,
+            '1-on-1': one_on_one_state, 'group': group_state}
 
-def main():
-    os.makedirs(OUT_PATH, exist_ok=True)
-    os.makedirs(PLOT_PATH, exist_ok=True)
+################################## Restarts ###################################
+
+_restart_state = {}
+
+def shuffledInputs(people, seed, one_on_one_scores, group_scores,
+                   friend_dict):
+    """
+    Returns (one_on_one, group, one_on_one_scores, group_scores, friend_dict)
+    as main would have them for PEOPLE (in the order of the exports) loaded
+    with SEED, by reordering the given ones instead of working them out
+    again. The 1-on-1 scores come back in upper_only form, as
+    makePairMatches computes them.
+    """
+    one_on_one, group = separatePairsAndGroups(people)
+    is_one_on_one = np.array([person['athlete mingle']['1-on-1']
+                              for person in people], dtype=bool)
+    
+    """ Each person's position in their own list, before the shuffle """
+    position = np.zeros(len(people), dtype=np.int64)
+    position[is_one_on_one] = np.arange(len(one_on_one))
+    position[~is_one_on_one] = np.arange(len(group))
+    
+    order = np.array(shuffleOrder(len(people), seed), dtype=np.int64)
+    one_on_one_ids = position[order[is_one_on_one[order]]]
+    group_ids = position[order[~is_one_on_one[order]]]
+    
+    new_position = np.empty(len(group), dtype=np.int64)
+    new_position[group_ids] = np.arange(len(group))
+    shuffled_friends = {i: sorted(int(new_position[j])
+                                  for j in friend_dict[old])
+                        for i, old in enumerate(group_ids.tolist())}
+    
+    return ([one_on_one[i] for i in one_on_one_ids],
+            [group[i] for i in group_ids],
+            upperScores(one_on_one_scores, one_on_one_ids),
+            group_scores[np.ix_(group_ids, group_ids)],
+            shuffled_friends)
+
+def _initRestartWorker(people, one_on_one_scores, group_scores, friend_dict,
+                       mode):
+    _restart_state.update(people=people, scores=(one_on_one_scores,
+                                                 group_scores),
+                          friend_dict=friend_dict, mode=mode)
+
+def _scoreShuffle(seed):
+    """ Matches everyone shuffled with SEED and returns the score. """
+    state = _restart_state
+    one_on_one, group, one_on_one_scores, group_scores, friend_dict = \
+        shuffledInputs(state['people'], seed, *state['scores'],
+                       state['friend_dict'])
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        one_on_one_matches = makePairMatches(one_on_one, mode=state['mode'],
+                                             scores=one_on_one_scores)
+        matches, friend_matches, _, _ = pairGroup(group, friend_dict,
+                                                  mode=state['mode'],
+                                                  scores=group_scores)
+    return communityScore(one_on_one_matches + matches + friend_matches)
+
+@stage('bestShuffle')
+def bestShuffle(people, seeds, mode='greedy', workers=None):
+    """
+    Matches PEOPLE (in the order of the exports) once for every seed in
+    SEEDS, shuffled as loadData would shuffle them, in a pool of WORKERS
+    processes (one per core if None). Both score matrices and the friend
+    requests are worked out once and reordered for each shuffle.
+    
+    Runs are compared by the community score of all the pair matches they
+    write (1-on-1 and group, as in writeMatchesToFile); forming the groups
+    of four is left to the winner.
+    
+    Returns (seed, community scores, inputs): the best seed (the first one if
+    several tie), each seed's community score and the winner's
+    shuffledInputs.
+    """
+    print(f"\n{'=' * 10} Trying {len(seeds)} shuffles {'=' * 10}")
     
-    people = loadData()
-    analyzeData(people)
     one_on_one, group = separatePairsAndGroups(people)
-    matchOneOnOnes(one_on_one)
-    matchGroups(group)
+    friend_dict = resolveFriendRequests(group, one_on_one)
+    init_args = (people, computeSimilarities(one_on_one),
+                 computeSimilarities(group), friend_dict, mode)
+    
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(seeds) == 1:
+        _initRestartWorker(*init_args)
+        results = [_scoreShuffle(seed) for seed in seeds]
+        _restart_state.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(seeds)),
+                                 initializer=_initRestartWorker,
+                                 initargs=init_args) as pool:
+            results = list(pool.map(_scoreShuffle, seeds))
+    count('shuffles tried', len(seeds))
+    
+    community_scores = dict(zip(seeds, results))
+    best = max(seeds, key=community_scores.get)
+    for seed in seeds:
+        print(f'Seed {seed}'.ljust(20) + \
+              f'community score: {community_scores[seed]:.4%}' + \
+              ('  <- best' if seed == best else ''))
+    
+    return best, community_scores, shuffledInputs(people, best,
+                                                  *init_args[1:4])
+
+def main(analyze=ANALYZE, trace_memory=TRACE_MEMORY, profile=PROFILE,
+         invalidated=(), seed=SEED, restarts=RESTARTS, update=False,
+         pool_scores=None):
+    """
+    Runs everything. INVALIDATED lists the checkpoints to throw away first:
+    'cohort', 'scores' or 'all'. People are shuffled with SEED, or with the
+    best of RESTARTS seeds starting from SEED (see bestShuffle). With UPDATE,
+    only the people who weren't in the last run are matched (see
+    updateMatches), unless there is no last run.
+    
+    POOL_SCORES, if given, holds a (qualtrics ids, full score matrix) pair
+    for the 1-on-1 and the group pool, e.g. kept in memory by service.py.
+    Only the people listed are matched, and their scores are taken from the
+    matrices (see poolScores) instead of being computed again.
+    """
+    assert restarts is None or SPARSE_TOP_K is None, \
+        'Restarts reuse the full score matrices, so SPARSE_TOP_K must be None'
+    assert restarts is None or pool_scores is None, \
+        'Restarts score each shuffle themselves, so POOL_SCORES must be None'
+    
+    os.makedirs(OUT_PATH, exist_ok=True)
+    
+    state = loadMatchState() if update else None
+    if update and state is None:
+        print(f'No {OUT_PATH}{STATE_FILE} yet, matching everyone')
+    
+    if len(invalidated) > 0:
+        invalidate(f'{OUT_PATH}{CHECKPOINT_DIR}',
+                   None if 'all' in invalidated else invalidated)
+    
+    """ The report covers this run only, however many ran in this process. """
+    resetReport()
+    if trace_memory:
+        traceMemory()
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    
+    try:
+        with stage('load'):
+            people, loaded_seed = loadData(
+                seed=seed, shuffle=restarts is None and state is None)
+            if pool_scores is not None:
+                listed = {qualtrics_id for ids, _ in pool_scores
+                          for qualtrics_id in ids}
+                people = [person for person in people
+                          if person['qualtrics id'] in listed]
+            count('people', len(people))
+            _round['date'] = latestResponse(people)
+        if state is not None:
+            saveMatchState(updateMatches(people, state, mode=MATCH_MODE,
+                                         top_k=SPARSE_TOP_K))
+            return
+        if analyze:
+            with stage('analyze'):
+                os.makedirs(PLOT_PATH, exist_ok=True)
+                analyzeData(people)
+        
+        scores, friend_dict = (None, None), None
+        if restarts is None:
+            seed = loaded_seed
+            with stage('split'):
+                one_on_one, group = separatePairsAndGroups(people)
+            if pool_scores is not None:
+                scores = tuple(poolScores(pool, *given) for pool, given in
+                               zip([one_on_one, group], pool_scores))
+        else:
+            first = 0 if seed is None else seed
+            seed, community_scores, inputs = bestShuffle(
+                people, list(range(first, first + restarts)),
+                mode=MATCH_MODE, workers=RESTART_WORKERS)
+            one_on_one, group, *scores, friend_dict = inputs
+            
+            with open(f'{OUT_PATH}{RESTARTS_FILE}', 'w') as f:
+                json.dump({'best seed': seed, 'community scores':
+                           community_scores}, f, indent=4)
+            print(f'Best seed: {seed} (pass --seed {seed} to rerun it)')
+        
+        with stage('match one-on-ones'):
+            count('one-on-one people', len(one_on_one))
+            one_on_one_state = matchOneOnOnes(
+                one_on_one, mode=MATCH_MODE, top_k=SPARSE_TOP_K,
+                heat_map=analyze, scores=scores[0], seed=seed)
+        with stage('match groups'):
+            count('group people', len(group))
+            group_state = matchGroups(
+                group, mode=MATCH_MODE, top_k=SPARSE_TOP_K,
+                one_on_one=one_on_one, heat_map=analyze,
+                friend_dict=friend_dict, scores=scores[1], seed=seed)
+        saveMatchState({'seed': seed, 'round': 0, '1-on-1': one_on_one_state,
+                        'group': group_state})
+    finally:
+        """ Report whatever ran, even if a stage failed. """
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(f'{OUT_PATH}{PROFILE_FILE}')
+        writeReport(f'{OUT_PATH}{REPORT_FILE}')
+        print(f'Run report written to {OUT_PATH}{REPORT_FILE}')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Athlete Mingle matching')
+    parser.add_argument('--skip-analysis', action='store_true',
+                        help="don't plot the cohort, only write the matches")
+    parser.add_argument('--preview-plots', action='store_true',
+                        help='draw the plots at low resolution')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="measure each stage's own peak memory")
+    parser.add_argument('--profile', action='store_true',
+                        help=f'save a cProfile dump to {PROFILE_FILE}')
+    parser.add_argument('--checkpoints', action='store_true',
+                        help='save slow stages and reload them on a rerun')
+    parser.add_argument('--invalidate', nargs='+', default=[],
+                        choices=['cohort', 'scores', 'all'],
+                        help='recompute these instead of using checkpoints')
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help='seed for shuffling people (default: a new one)')
+    parser.add_argument('--restarts', type=int, default=RESTARTS,
+                        help='try this many seeds and keep the best')
+    parser.add_argument('--update', action='store_true',
+                        help='only match the people the last run missed')
+    args = parser.parse_args()
+    
+    PLOT_PREVIEW = PLOT_PREVIEW or args.preview_plots
+    CHECKPOINTS = CHECKPOINTS or args.checkpoints
+    
+    main(analyze=ANALYZE and not args.skip_analysis,
+         trace_memory=TRACE_MEMORY or args.trace_memory,
+         profile=PROFILE or args.profile, invalidated=args.invalidate,
+         seed=args.seed, restarts=args.restarts, update=args.update)
\ No newline at end of file
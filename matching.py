@@ -0,0 +1,475 @@
+"""
+file: matching.py
+date: 10/17/26
+----------------------
+Matching engines that turn compatibility scores into pair matches.
+
+Every engine returns matches in the same shape as makePairMatches: a list of
+[(i, j), score] where i and j index into the scored cohort. The engines work
+on edge lists (rows, cols, values), so they run the same way on a dense score
+matrix or on the sparse candidate index from scoring.candidateIndex.
+storeEdges writes a cohort's pairs to disk tile by tile, as sorted runs that
+greedyMatchRuns merges back, for cohorts whose score matrix doesn't fit.
+shardMatch instead splits the cohort into shards by year and matches each
+one on its own, so no score block is larger than a shard.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import heapq
+import os
+
+import numpy as np
+
+from instrument import count
+from history import pastAmong, penalizeEdges, penalizeScores
+from scoring import (INELIGIBLE, candidateIndex, candidatePairs,
+                     computeSimilarityBlock)
+
+TILE_SIZE = 2048
+# Pairs read from each run at a time (see greedyMatchRuns)
+RUN_CHUNK = 256
+
+def sortedEdges(scores):
+    """
+    Returns (rows, cols, values) for every eligible off-diagonal entry of
+    SCORES, sorted from best to worst. Ties are broken by row-major position,
+    which is the same order np.argmax uses.
+    """
+    n = len(scores)
+    flat = np.flatnonzero(scores > INELIGIBLE)
+    rows, cols = np.divmod(flat, n)
+    keep = rows != cols
+    flat, rows, cols = flat[keep], rows[keep], cols[keep]
+
+    values = scores.ravel()[flat]
+    order = np.argsort(-values, kind='stable')
+    return rows[order], cols[order], values[order]
+
+def _unmatched(n, matches):
+    matched = np.zeros(n, dtype=bool)
+    for (i, j), _ in matches:
+        matched[i] = matched[j] = True
+    return np.flatnonzero(~matched).tolist()
+
+def greedyMatchEdges(n, rows, cols, values, presorted=False):
+    """
+    Greedy matching over an edge list: take the highest scoring pair, remove
+    both people, and repeat. The edges are sorted once (best first, ties in
+    row-major order) and walked lazily, skipping any pair where someone is
+    already matched.
+
+    Returns (matches, unmatched), where unmatched is the list of people left
+    without an eligible partner.
+    """
+    if not presorted:
+        order = np.lexsort((rows * n + cols, -values))
+        rows, cols, values = rows[order], cols[order], values[order]
+
+    matched = np.zeros(n, dtype=bool)
+    remaining = n
+    matches = []
+    examined = 0
+    for examined, (i, j, score) in enumerate(zip(rows.tolist(), cols.tolist(),
+                                                 values.tolist()), 1):
+        if remaining < 2:
+            break
+        if matched[i] or matched[j]:
+            continue
+        matches.append([(i, j), score])
+        matched[i] = matched[j] = True
+        remaining -= 2
+    count('greedy edges examined', examined)
+
+    return matches, np.flatnonzero(~matched).tolist()
+
+def greedyMatch(scores):
+    """ Greedy matching on a dense score matrix (see greedyMatchEdges). """
+    return greedyMatchEdges(len(scores), *sortedEdges(scores), presorted=True)
+
+def candidateEdges(scores, top_k=None):
+    """
+    Returns (rows, cols, values) for the eligible pairs (i, j), i < j, where
+    j is one of i's TOP_K best partners or i is one of j's. With TOP_K set to
+    None every eligible pair is returned. SCORES may hold only its upper
+    triangle.
+    """
+    n = len(scores)
+    full = np.maximum(scores, scores.T)
+    np.fill_diagonal(full, INELIGIBLE)
+
+    eligible = full > INELIGIBLE
+    if top_k is not None and top_k < n - 1:
+        best = np.argpartition(-full, top_k - 1, axis=1)[:, :top_k]
+        mask = np.zeros((n, n), dtype=bool)
+        mask[np.arange(n)[:, None], best] = True
+        eligible &= mask | mask.T
+
+    rows, cols = np.nonzero(np.triu(eligible, 1))
+    return rows, cols, full[rows, cols]
+
+def optimalMatchEdges(n, rows, cols, values):
+    """
+    Maximum-weight matching over an edge list using Edmonds' blossom
+    algorithm (from networkx, which is only needed for this mode). Among the
+    matchings that pair up the most people, this finds the one with the
+    highest total score.
+
+    Returns (matches, unmatched) like greedyMatchEdges, with the matches
+    sorted from best to worst.
+    """
+    try:
+        import networkx as nx
+    except ImportError:
+        raise ImportError('Optimal matching requires networkx. ' + \
+                          'Install it with `pip install networkx`.')
+
+    """
+    Every maximum cardinality matching has the same number of edges, so
+    shifting all weights by a constant keeps them positive without changing
+    which matching wins.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    for i, j, score in zip(rows.tolist(), cols.tolist(), values.tolist()):
+        i, j = min(i, j), max(i, j)
+        graph.add_edge(i, j, weight=score - INELIGIBLE + 1, score=score)
+
+    count('optimal graph edges', graph.number_of_edges())
+    matching = nx.max_weight_matching(graph, maxcardinality=True)
+
+    matches = []
+    for pair in matching:
+        i, j = sorted(pair)
+        matches.append([(i, j), graph.edges[i, j]['score']])
+    matches.sort(key=lambda match: (-match[1], match[0]))
+
+    return matches, _unmatched(n, matches)
+
+def optimalMatch(scores, top_k=None, greedy=None):
+    """
+    Maximum-weight matching on a dense score matrix (see optimalMatchEdges).
+    By default every eligible pair is searched, so the matching is optimal.
+
+    The blossom algorithm is slow on dense graphs. With TOP_K set, it only
+    considers each person's TOP_K best partners plus the GREEDY matches
+    (computed here if not given), so the result is never worse than greedy
+    but is a heuristic: it can miss the optimum when the best matching uses
+    a pair outside both people's top K.
+    """
+    n = len(scores)
+    if greedy is None and top_k is not None:
+        greedy, _ = greedyMatch(scores)
+
+    rows, cols, values = candidateEdges(scores, top_k)
+    if top_k is not None and len(greedy) > 0:
+        rows = np.concatenate([rows, [i for (i, _), _ in greedy]])
+        cols = np.concatenate([cols, [j for (_, j), _ in greedy]])
+        values = np.concatenate([values, [score for _, score in greedy]])
+
+    return optimalMatchEdges(n, rows.astype(np.int64), cols.astype(np.int64),
+                             values)
+
+def sparseMatch(responses, sports, kinds, top_k, mode='greedy',
+                same_kind_ok=False, same_sport_ok=False, grades=None,
+                past=None, optimal_top_k=None):
+    """
+    Matches the cohort using only each person's TOP_K best partners (see
+    scoring.candidateIndex), so the full n x n matrix is never built.
+
+    Someone whose candidates all get matched to other people may still have
+    an eligible partner outside their top K. So after each round, the people
+    left over are re-indexed among themselves with K doubled and matched
+    again. This stops once a round makes no matches or K already covered the
+    whole remaining pool. GRADES (see constraints.gradeArrays) enforces the
+    same-grade answers, and PAST (see history.pastPairs) rules out or
+    penalizes pairs matched before. With mode='optimal' and OPTIMAL_TOP_K
+    set, each round's maximum-weight matching only searches everyone's
+    OPTIMAL_TOP_K best candidates plus the round's greedy matches, as in
+    optimalMatch.
+
+    Returns (matches, unmatched) with indices into the full cohort.
+    """
+    def penalized(rows, cols, values):
+        if past is None:
+            return rows, cols, values
+        return penalizeEdges(rows, cols, values, past, pool)
+
+    pool = np.arange(len(responses))
+    k = top_k
+    matches = []
+    while len(pool) > 1:
+        partners, partner_scores = candidateIndex(
+            responses[pool], sports[pool], kinds[pool], k,
+            same_kind_ok=same_kind_ok, same_sport_ok=same_sport_ok,
+            grades=None if grades is None else grades[pool])
+        rows, cols, values = penalized(*candidatePairs(partners,
+                                                       partner_scores))
+
+        if mode != 'optimal':
+            found, leftover = greedyMatchEdges(len(pool), rows, cols, values)
+        else:
+            if optimal_top_k is not None and optimal_top_k < k:
+                greedy, _ = greedyMatchEdges(len(pool), rows, cols, values)
+                rows, cols, values = penalized(*candidatePairs(
+                    partners[:, :optimal_top_k],
+                    partner_scores[:, :optimal_top_k]))
+                rows = np.concatenate([rows, [i for (i, _), _ in greedy]])
+                cols = np.concatenate([cols, [j for (_, j), _ in greedy]])
+                values = np.concatenate([values,
+                                         [score for _, score in greedy]])
+            found, leftover = optimalMatchEdges(
+                len(pool), rows.astype(np.int64), cols.astype(np.int64),
+                values)
+        matches.extend([(int(pool[i]), int(pool[j])), score]
+                       for (i, j), score in found)
+
+        exhaustive = k >= len(pool) - 1
+        pool = pool[leftover]
+        if len(found) == 0 or exhaustive:
+            break
+        k *= 2
+
+    return matches, pool.tolist()
+
+################################# Edge store ##################################
+
+_run_state = {}
+
+def _initRunWorker(responses, sports, kinds, folder, dtype, grades, past):
+    """ Runs once in each worker process; keeps the cohort. """
+    _run_state.update({
+        'responses': responses,
+        'sports': sports,
+        'kinds': kinds,
+        'folder': folder,
+        'dtype': dtype,
+        'grades': grades,
+        'past': past,
+    })
+
+def _sortTile(tile):
+    """
+    Scores the pairs (i, j), i < j, in one tile of the pair space and writes
+    the eligible ones to the tile's run file, best first. Returns its path.
+    """
+    row_start, row_stop, col_start, col_stop = tile
+    state = _run_state
+    n = len(state['responses'])
+
+    rows = np.arange(row_start, row_stop)
+    cols = np.arange(col_start, col_stop)
+    block = computeSimilarityBlock(state['responses'], state['sports'],
+                                   state['kinds'], rows, cols,
+                                   grades=state['grades'])
+    block[rows[:, None] >= cols[None, :]] = INELIGIBLE
+
+    rows, cols = np.nonzero(block > INELIGIBLE)
+    values = block[rows, cols]
+    rows, cols = rows + row_start, cols + col_start
+    if state['past'] is not None:
+        rows, cols, values = penalizeEdges(rows, cols, values, state['past'],
+                                           np.arange(n))
+
+    """ Sorted as stored, so the runs merge in greedyMatchEdges' order. """
+    values = values.astype(state['dtype'])
+    order = np.lexsort((cols, rows, -values))
+    run = np.empty(len(order), dtype=[('row', np.int32), ('col', np.int32),
+                                      ('score', state['dtype'])])
+    run['row'], run['col'], run['score'] = \
+        rows[order], cols[order], values[order]
+
+    path = os.path.join(state['folder'], f'{row_start}_{col_start}.npy')
+    np.save(path, run)
+    return path
+
+def storeEdges(responses, sports, kinds, folder, workers=None,
+               tile_size=TILE_SIZE, dtype=np.float32, grades=None,
+               past=None):
+    """
+    Scores every pair (i, j), i < j, tile by tile in a pool of WORKERS
+    processes (one per core if None), and writes the eligible pairs of each
+    TILE_SIZE x TILE_SIZE tile to a run file of its own in FOLDER, sorted
+    from best to worst. Tiles below the diagonal have no such pairs and are
+    skipped. GRADES and PAST are as in sparseMatch.
+
+    Returns the paths of the runs, which greedyMatchRuns matches from. No
+    n x n array is ever built: a worker holds one tile and the files hold
+    12 bytes per eligible pair (with the default float32 scores; pass
+    dtype=np.float64 for exactly the in-memory scores).
+    """
+    responses = np.ascontiguousarray(responses, dtype=np.uint8)
+    n = len(responses)
+    os.makedirs(folder, exist_ok=True)
+    for path in glob.glob(os.path.join(folder, '*.npy')):
+        os.remove(path)
+
+    tiles = [(row, min(row + tile_size, n), col, min(col + tile_size, n))
+             for row in range(0, n, tile_size)
+             for col in range(row, n, tile_size)]
+
+    init_args = (responses, np.asarray(sports), np.asarray(kinds), folder,
+                 dtype, grades, past)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(tiles) <= 1:
+        _initRunWorker(*init_args)
+        runs = [_sortTile(tile) for tile in tiles]
+        _run_state.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tiles)),
+                                 initializer=_initRunWorker,
+                                 initargs=init_args) as pool:
+            runs = list(pool.map(_sortTile, tiles))
+        # the workers' counts don't come back, so count their tiles' pairs
+        # here (including any they skipped as ineligible)
+        count('pairs scored', sum((row_stop - row) * (col_stop - col)
+                                  for row, row_stop, col, col_stop in tiles))
+
+    return runs
+
+def _runEdges(path, chunk):
+    """
+    Yields (-score, i, j) for every pair in the run at PATH, best first,
+    reading CHUNK pairs of it at a time.
+    """
+    run = np.load(path, mmap_mode='r')
+    for start in range(0, len(run), chunk):
+        part = run[start:start + chunk]
+        yield from zip((-part['score'].astype(np.float64)).tolist(),
+                       part['row'].tolist(), part['col'].tolist())
+
+def greedyMatchRuns(n, runs, chunk=RUN_CHUNK):
+    """
+    Greedy matching (see greedyMatchEdges) of N people over the sorted RUNS
+    of storeEdges. The runs are merged as they are read, CHUNK pairs of each
+    at a time, so memory stays at about CHUNK pairs per run however many
+    pairs there are. Ties are broken in row-major order, as in
+    greedyMatchEdges.
+    """
+    matched = np.zeros(n, dtype=bool)
+    remaining = n
+    matches = []
+    examined = 0
+    edges = heapq.merge(*(_runEdges(path, chunk) for path in runs))
+    for examined, (negative, i, j) in enumerate(edges, 1):
+        if remaining < 2:
+            break
+        if matched[i] or matched[j]:
+            continue
+        matches.append([(i, j), -negative])
+        matched[i] = matched[j] = True
+        remaining -= 2
+    count('greedy edges examined', examined)
+
+    return matches, np.flatnonzero(~matched).tolist()
+
+################################### Shards ####################################
+
+_shard_state = {}
+
+def cohortShards(kinds, grades=None, shard_size=None):
+    """
+    Splits the cohort into shards to be matched on their own: one per year
+    (a single one if GRADES is None), and a year of more than SHARD_SIZE
+    people into as few shards as fit. Each year is dealt out in order of
+    kind and same-grade answer, so every shard gets its share of each kind
+    and answer, and no shard is left with only people of one kind, who can
+    never be paired with each other.
+
+    Returns a list of sorted index arrays.
+    """
+    n = len(kinds)
+    years = np.zeros(n, dtype=np.int64) if grades is None else grades[:, 0]
+    same_grade = np.zeros(n, dtype=np.int64) if grades is None else \
+                 grades[:, 1]
+
+    shards = []
+    for year in np.unique(years):
+        members = np.flatnonzero(years == year)
+        members = members[np.lexsort((members, same_grade[members],
+                                      kinds[members]))]
+        parts = 1 if shard_size is None else -(-len(members) // shard_size)
+        shards.extend(np.sort(members[start::parts])
+                      for start in range(parts))
+    return shards
+
+def _initShardWorker(responses, sports, kinds, mode, grades, past,
+                     optimal_top_k):
+    """ Runs once in each worker process; keeps the cohort. """
+    _shard_state.update({
+        'responses': responses,
+        'sports': sports,
+        'kinds': kinds,
+        'mode': mode,
+        'grades': grades,
+        'past': past,
+        'optimal top k': optimal_top_k,
+    })
+
+def _matchShard(ids):
+    """
+    Matches the people in IDS (indices into the cohort) among themselves.
+    Returns (matches, unmatched) with indices into the cohort.
+    """
+    state = _shard_state
+    block = computeSimilarityBlock(state['responses'], state['sports'],
+                                   state['kinds'], ids, ids,
+                                   grades=state['grades'])
+    block[np.tril_indices(len(ids))] = INELIGIBLE
+    if state['past'] is not None:
+        penalizeScores(block, pastAmong(state['past'], ids))
+
+    if state['mode'] == 'optimal':
+        found, unmatched = optimalMatch(block, top_k=state['optimal top k'])
+    else:
+        found, unmatched = greedyMatch(block)
+    return ([[(int(ids[i]), int(ids[j])), score] for (i, j), score in found],
+            ids[unmatched].tolist())
+
+def shardMatch(responses, sports, kinds, shard_size, mode='greedy',
+               grades=None, past=None, workers=None, optimal_top_k=None):
+    """
+    Matches the cohort one shard at a time (see cohortShards), in a pool of
+    WORKERS processes (one per core if None), and then matches everyone the
+    shards left unmatched among themselves. That last pass pairs people from
+    different shards: people in different years who didn't ask to be with
+    their year, and the odd ones out of a year's shards. GRADES, PAST and
+    OPTIMAL_TOP_K are as in sparseMatch.
+
+    Only the shards and the leftovers are scored, so the largest score block
+    is about SHARD_SIZE x SHARD_SIZE instead of n x n. Pairs across shards
+    are only considered among the leftovers, so the matches can be a little
+    worse than matching everyone at once.
+
+    Returns (matches, unmatched) like greedyMatchEdges.
+    """
+    responses = np.ascontiguousarray(responses, dtype=np.uint8)
+    shards = cohortShards(kinds, grades, shard_size)
+    count('shards', len(shards))
+
+    init_args = (responses, np.asarray(sports), np.asarray(kinds), mode,
+                 grades, past, optimal_top_k)
+    workers = workers or os.cpu_count() or 1
+
+    """ The leftovers are matched here, so the cohort is kept here too. """
+    _initShardWorker(*init_args)
+    if workers == 1 or len(shards) == 1:
+        results = [_matchShard(ids) for ids in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)),
+                                 initializer=_initShardWorker,
+                                 initargs=init_args) as pool:
+            results = list(pool.map(_matchShard, shards))
+        # the workers' counts don't come back, so count the shards' pairs
+        # here (including any they skipped as ineligible)
+        count('pairs scored', sum(len(ids) ** 2 for ids in shards))
+
+    matches = [match for found, _ in results for match in found]
+    leftovers = np.array(sorted(i for _, unmatched in results
+                                for i in unmatched), dtype=np.int64)
+    count('shard leftovers', len(leftovers))
+
+    found, unmatched = _matchShard(leftovers) if len(leftovers) > 1 else \
+                       ([], leftovers.tolist())
+    _shard_state.clear()
+    return matches + found, unmatched
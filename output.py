@@ -0,0 +1,113 @@
+"""
+file: output.py
+date: 10/17/26
+----------------------
+Helpers for writing matches out.
+
+sharedResponses picks the "you both said..." question for every match at
+once, from the cohort's response matrix (see scoring.responseMatrix).
+
+writeTable serializes a whole match table (column name -> list of values) in
+one buffered pass per format:
+    csv    - for people; properly quoted, one row per match
+    jsonl  - one JSON object per match
+    npz    - one NumPy array per column, for downstream tools
+A summary (e.g. the community score) goes to a separate .summary.json file.
+"""
+import csv
+import json
+
+import numpy as np
+
+from instrument import count
+
+def sharedResponses(responses, members, rng=None):
+    """
+    For each match, picks a random question that everyone in the match
+    answered the same way.
+
+    params:
+        responses - n x 29 response matrix
+        members - m x g array of indices into RESPONSES, one row per match.
+                  Groups of any size work; pad smaller groups with -1.
+        rng - seed or np.random.Generator used to pick among the questions
+
+    Returns (questions, answers), two length-m arrays. Both are -1 for a
+    match where nobody answered any question the same way.
+    """
+    rng = np.random.default_rng(rng)
+    members = np.asarray(members, dtype=np.int64)
+    m = len(members)
+    if m == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    members = members.reshape(m, -1)
+
+    """ Padding repeats the first member, who agrees with themselves. """
+    members = np.where(members >= 0, members, members[:, :1])
+    answers = responses[members].astype(np.int64)
+    shared = (answers == answers[:, :1, :]).all(axis=1)
+
+    """
+    The question with the largest random key among the shared ones is a
+    uniform choice of shared question.
+    """
+    keys = rng.random(shared.shape)
+    keys[~shared] = -1
+    questions = keys.argmax(axis=1)
+
+    rows = np.arange(m)
+    found = shared[rows, questions]
+    return (np.where(found, questions, -1),
+            np.where(found, answers[rows, 0, questions], -1))
+
+def _binaryColumn(values):
+    """ Returns VALUES as an array, with None as '' or -1 as appropriate. """
+    present = [value for value in values if value is not None]
+    blank = '' if all(isinstance(value, str) for value in present) else -1
+    return np.array([blank if value is None else value for value in values])
+
+def writeTable(table, out_base, formats=('csv',), summary=None,
+               csv_formats=None):
+    """
+    Writes TABLE to OUT_BASE plus each format's extension, and SUMMARY (if
+    given) to OUT_BASE.summary.json. CSV_FORMATS maps a column to the format
+    string its values are written with in the CSV, e.g. {'score': '{:.4%}'}.
+
+    Returns the paths written.
+    """
+    columns = list(table)
+    rows = list(zip(*table.values()))
+    paths = []
+
+    for fmt in formats:
+        path = f'{out_base}.{fmt}'
+        if fmt == 'csv':
+            csv_formats = csv_formats or {}
+            formatters = [csv_formats.get(column) for column in columns]
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(
+                    [value if formatter is None or value is None
+                     else formatter.format(value)
+                     for value, formatter in zip(row, formatters)]
+                    for row in rows)
+        elif fmt == 'jsonl':
+            with open(path, 'w') as f:
+                f.writelines(json.dumps(dict(zip(columns, row))) + '\n'
+                             for row in rows)
+        elif fmt == 'npz':
+            np.savez(path, **{column: _binaryColumn(values)
+                              for column, values in table.items()})
+        else:
+            raise ValueError(f'Unknown output format: {fmt}')
+        paths.append(path)
+        count('rows written', len(rows))
+
+    if summary is not None:
+        path = f'{out_base}.summary.json'
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=4)
+        paths.append(path)
+
+    return paths
@@ -5,42 +5,41 @@ author: Dean Stratakos
 ----------------------
 Helper functions for visualizing data from Athlete Mingle.
 
+Every plot takes the counts computed by stats.cohortStats rather than
+counting the data itself.
+
+Plots are drawn on their own matplotlib Figure (no pyplot state) and saved
+with the Agg renderer, so they can be drawn in separate processes at once.
+renderPlots does this for all of them, and skips plots whose counts haven't
+changed since they were last written. pyplot is only imported to show a plot
+interactively.
+
+plotHeatMap draws score matrices of any size as a single image: large ones
+are averaged down to HEAT_MAP_SIZE cells per side, and people can be
+reordered so that matches (matchOrder) or similar people (clusterOrder) sit
+next to each other.
+
 TODO: Add number labels to years and kinds plots
 """
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import json
+import os
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
 import numpy as np
-import seaborn as sb
-
-SPORT_DATA = {}
-with open('data/sports.json') as f:
-    SPORT_DATA = json.load(f)
-
-year_labels = ['Frosh', 'Sophomore', 'Junior', 'Senior', '5th year/Coterm']
-major_labels = [
-    'Aeronautics and Astronautics',
-    'Biology',
-    'Chemistry',
-    'Computer Science',
-    'Earth Systems',
-    'Econ',
-    'Engineering',
-    'English',
-    'History',
-    'Human Biology',
-    'MS&E',
-    'Physics',
-    'Political Science',
-    'Product Design',
-    'Psychology',
-    'STS',
-    'SymSys',
-    'Other'
-]
-sport_labels = SPORT_DATA.keys()
-kind_labels = ['Men', 'Women', 'Co-Ed']
+
+from scoring import BLOCK_SIZE, INELIGIBLE
+
+# DPI of the quick, low-resolution previews (see renderPlots)
+PREVIEW_DPI = 40
+# Largest heat map drawn cell by cell; bigger score matrices are averaged
+HEAT_MAP_SIZE = 400
+# Largest heat map with the score written in every cell
+ANNOTATE_SIZE = 25
+# Name of the file in the plot directory that remembers what was drawn
+CACHE_FILE = 'plot_cache.json'
 
 def autolabel(ax, rects):
     """
@@ -68,166 +67,346 @@ def autolabelh(ax, rects):
                     textcoords='offset points',
                     ha='left', va='center')
 
-def plotHeatMap(scores, out_path):
+def newFigure(interactive=False, **kwargs):
+    """
+    Returns an empty figure. Only an interactive figure goes through pyplot;
+    any other one is standalone and saved with the Agg renderer.
+    """
+    if interactive:
+        import matplotlib.pyplot as plt
+        return plt.figure(**kwargs)
+    return Figure(**kwargs)
+
+def finishFigure(fig, out_path, interactive=False, dpi=None):
+    """ Shows FIG, or saves it to OUT_PATH at DPI (the default if None). """
+    if interactive:
+        import matplotlib.pyplot as plt
+        plt.show()
+        plt.close(fig)
+    else:
+        fig.savefig(out_path, dpi=dpi or 'figure')
+
+def matchOrder(matches, n):
+    """
+    Returns an ordering of the N people that puts the members of each match
+    next to each other, best matches first, and anyone unmatched last.
+    """
+    order = [i for ids, _ in sorted(matches, key=lambda match: -match[1])
+             for i in ids]
+    matched = set(order)
+    return np.array(order + [i for i in range(n) if i not in matched],
+                    dtype=np.int64)
+
+def clusterOrder(scores, iterations=50):
+    """
+    Returns an ordering of the rows of SCORES that puts people who score
+    alike next to each other: they are sorted by the leading eigenvector of
+    the (symmetrized) score matrix, found by power iteration. Only
+    BLOCK_SIZE rows are read at a time, so SCORES can be a memory-mapped
+    store.
+    """
+    n = len(scores)
+    vector = np.ones(n) / np.sqrt(max(n, 1))
+    for _ in range(iterations):
+        product = np.zeros(n)
+        for start in range(0, n, BLOCK_SIZE):
+            rows = slice(start, min(start + BLOCK_SIZE, n))
+            block = np.where(scores[rows] == INELIGIBLE, 0, scores[rows])
+            # scores may only be filled in above the diagonal (i < j)
+            product[rows] += block @ vector
+            product += block.T @ vector[rows]
+        norm = np.linalg.norm(product)
+        if norm == 0:
+            break
+        vector = product / norm
+    return np.argsort(vector, kind='stable')
+
+def heatMapCells(scores, order=None, size=HEAT_MAP_SIZE):
+    """
+    Returns the matrix drawn for SCORES: rows and columns are taken in ORDER
+    (all of them by default), then averaged in b x b blocks so that there are
+    at most SIZE cells per side. Only b rows of SCORES are read at a time.
+
+    INELIGIBLE pairs are left out of the averages, and a block with only
+    ineligible pairs is NaN (drawn blank). Each pair is counted in both of
+    its cells, so a matrix scored only above the diagonal (upper_only) is
+    drawn in full.
+
+    Returns (cells, b).
+    """
+    n = len(scores)
+    order = np.arange(n) if order is None else np.asarray(order)
+    b = max(-(-n // size), 1)
+    m = -(-n // b)
+
+    totals = np.zeros((m, m))
+    counts = np.zeros((m, m))
+    # columns are padded to a multiple of b with ineligible scores
+    padded = np.full(m * b, -1, dtype=np.int64)
+    padded[:n] = order
+    for r in range(m):
+        block = np.asarray(scores[np.sort(order[r * b:(r + 1) * b])],
+                           dtype=np.float64)
+        block = np.where(padded >= 0, block[:, padded], INELIGIBLE)
+        block = block.reshape(len(block), m, b)
+        valid = block != INELIGIBLE
+        totals[r] = np.where(valid, block, 0).sum(axis=(0, 2))
+        counts[r] = valid.sum(axis=(0, 2))
+
+    totals += totals.T
+    counts += counts.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return totals / counts, b
+
+def plotHeatMap(scores, out_path, order=None, title='Compatibility scores',
+                size=HEAT_MAP_SIZE, dpi=None):
+    """
+    Draws SCORES as one image (see heatMapCells for ORDER and SIZE). Cells
+    are labeled with their score if there are at most ANNOTATE_SIZE per side.
+    """
     print('Plotting heat map')
     
-    plt.subplots(figsize=(11, 9))
-    sb.heatmap(scores, annot=True)
-    plt.savefig(out_path)
-    plt.close()
+    cells, b = heatMapCells(scores, order=order, size=size)
     
-def plotYears(years, out_path, interactive=False):
-    print('Plotting years')
+    fig = newFigure(figsize=(11, 9))
+    ax = fig.subplots()
+    image = ax.imshow(cells, cmap='viridis', vmin=-1, vmax=1,
+                      interpolation='nearest')
+    fig.colorbar(image, ax=ax)
     
-    counts = [years.count(y) for y in year_labels]
+    if b > 1:
+        title += f' (average of {b} x {b} blocks)'
+    ax.set_title(title)
     
-    plt.bar(range(len(counts)), counts, color='#Bf0A30')
-    plt.xlabel('Year')
-    plt.ylabel('Responses')
-    plt.title('Athlete Mingle Year Distribution')
-
-    plt.xticks(range(len(counts)), year_labels)
+    if len(cells) <= ANNOTATE_SIZE:
+        for (i, j), value in np.ndenumerate(cells):
+            if not np.isnan(value):
+                ax.text(j, i, f'{value:.2f}', ha='center', va='center',
+                        fontsize=8, color='w' if value < 0.3 else 'k')
+    
+    finishFigure(fig, out_path, dpi=dpi)
 
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
+def plotYears(stats, out_path, interactive=False, dpi=None):
+    print('Plotting years')
     
-def plotMajors(majors, out_path, interactive=False):
+    counts = stats['years']
+    
+    fig = newFigure(interactive)
+    ax = fig.subplots()
+    ax.bar(range(len(counts)), counts, color='#Bf0A30')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Responses')
+    ax.set_title('Athlete Mingle Year Distribution')
+    
+    ax.set_xticks(range(len(counts)))
+    ax.set_xticklabels(stats['year labels'])
+    
+    finishFigure(fig, out_path, interactive, dpi)
+
+def plotMajors(stats, out_path, interactive=False, dpi=None):
     print('Plotting majors')
     
-    counts = [majors.count(label) for label in major_labels]
+    counts = stats['majors']
     
-    fig, ax = plt.subplots()
+    fig = newFigure(interactive)
+    ax = fig.subplots()
     
     fig.set_size_inches(18.5, 10.5)
-    plt.subplots_adjust(left=0.2)
+    fig.subplots_adjust(left=0.2)
     
     rects = ax.barh(range(len(counts)), counts, color='#Bf0A30')
     ax.invert_yaxis()
-    plt.ylabel('Majors')
-    plt.xlabel('Responses')
-    plt.title('Athlete Mingle Major Distribution')
-
-    plt.yticks(range(len(counts)), major_labels)
+    ax.set_ylabel('Majors')
+    ax.set_xlabel('Responses')
+    ax.set_title('Athlete Mingle Major Distribution')
+    
+    ax.set_yticks(range(len(counts)))
+    ax.set_yticklabels(stats['major labels'])
     
     autolabelh(ax, rects)
-
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
     
-def plotSports(sports, out_path, interactive=False):
+    finishFigure(fig, out_path, interactive, dpi)
+
+def plotSports(stats, out_path, interactive=False, dpi=None):
     print('Plotting sports')
     
-    counts = [sports.count(label) for label in sport_labels]
+    counts = stats['sports']
     
-    fig, ax = plt.subplots()
+    fig = newFigure(interactive)
+    ax = fig.subplots()
     
     fig.set_size_inches(18.5, 10.5)
-    plt.subplots_adjust(left=0.2)
+    fig.subplots_adjust(left=0.2)
     
     rects = ax.barh(range(len(counts)), counts, color='#Bf0A30')
     ax.invert_yaxis()
-    plt.ylabel('Sport')
-    plt.xlabel('Responses')
-    plt.title('Athlete Mingle Sport Distribution')
-
-    plt.yticks(range(len(counts)), sport_labels)
+    ax.set_ylabel('Sport')
+    ax.set_xlabel('Responses')
+    ax.set_title('Athlete Mingle Sport Distribution')
+    
+    ax.set_yticks(range(len(counts)))
+    ax.set_yticklabels(stats['sport labels'])
     
     autolabelh(ax, rects)
-
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
     
-def plotKinds(sports, out_path, interactive=False):
+    finishFigure(fig, out_path, interactive, dpi)
+
+def plotKinds(stats, out_path, interactive=False, dpi=None):
     print('Plotting kinds')
     
-    counts = [0, 0, 0]
-    for res in sports:
-        for sport, sport_details in SPORT_DATA.items():
-            if sport == res:
-                counts[kind_labels.index(sport_details['kind'])] += 1
+    counts = stats['kinds']
+    
+    fig = newFigure(interactive)
+    ax = fig.subplots()
+    ax.bar(range(len(counts)), counts, color='#Bf0A30')
+    ax.set_xlabel('Kind')
+    ax.set_ylabel('Responses')
+    ax.set_title('Athlete Mingle Kind Distribution')
     
-    # fig, ax = plt.subplots()
+    ax.set_xticks(range(len(counts)))
+    ax.set_xticklabels(stats['kind labels'])
     
-    plt.bar(range(len(counts)), counts, color='#Bf0A30')
-    plt.xlabel('Kind')
-    plt.ylabel('Responses')
-    plt.title('Athlete Mingle Kind Distribution')
-
-    plt.xticks(range(len(counts)), kind_labels)
+    finishFigure(fig, out_path, interactive, dpi)
 
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
-    
-def plotYearKind(years, sports, out_path, interactive=False):
+def plotYearKind(stats, out_path, interactive=False, dpi=None):
     print('Plotting years and kinds')
     
-    counts = np.zeros((3, len(year_labels)), dtype='intc')
+    counts = stats['year kind']
     
-    for y, s in zip(years, sports):
-        kind = SPORT_DATA[s]['kind']
-        counts[kind_labels.index(kind)][year_labels.index(y)] += 1
-    
-    x = np.arange(len(year_labels))
+    x = np.arange(len(stats['year labels']))
     width = 0.2
-
-    fig, ax = plt.subplots()
+    
+    fig = newFigure(interactive)
+    ax = fig.subplots()
     rects1 = ax.bar(x - width, counts[0], width, label='Men', color='#Bf0A30')
     rects2 = ax.bar(x, counts[1], width, label='Women', color='#4298B5')
     rects3 = ax.bar(x + width, counts[2], width, label='Co-Ed', color='#7F7776')
-
+    
     ax.set_ylabel('Responses')
     ax.set_title('Athlete Mingle Year and Kind distributions')
     ax.set_xticks(x)
-    ax.set_xticklabels(year_labels)
+    ax.set_xticklabels(stats['year labels'])
     ax.legend()
-
+    
     autolabel(ax, rects1)
     autolabel(ax, rects2)
     autolabel(ax, rects3)
     
     fig.tight_layout()
-
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
     
-def plotResponses(responses, out_path, interactive=False):
+    finishFigure(fig, out_path, interactive, dpi)
+
+def plotResponses(stats, out_path, interactive=False, dpi=None):
     print('Plotting responses')
     
-    fig, axs = plt.subplots(6, 5)
+    """
+    Every question has the same answers and is drawn on the same scale, so
+    the axes are shared, which also saves laying out their ticks 29 times.
+    """
+    fig = newFigure(interactive)
+    axs = fig.subplots(6, 5, sharex=True, sharey=True)
     fig.set_size_inches(30, 11)
-    plt.subplots_adjust(left=0.05, right=0.95, hspace=0.6)
-    
-    for q in range(len(responses[0])):
-        freq, bins, patches = axs[q // 5, q % 5].hist(responses[:, q], bins=5)
-        axs[q // 5, q % 5].set_title(f'Question {q}')
-        axs[q // 5, q % 5].xaxis.set_major_locator(MaxNLocator(integer=True))
-        axs[q // 5, q % 5].yaxis.set_major_locator(MaxNLocator(integer=True))
-        axs[q // 5, q % 5].set_ylim((0, 300))
-        
-        bin_centers = np.diff(bins) * 0.5 + bins[:-1]
-
-        n = 0
-        for fr, x, patch in zip(freq, bin_centers, patches):
-            height = int(fr)
-            axs[q // 5, q % 5].annotate("{}".format(height),
-                xy = (x, height),             # top left corner of histogram bar
+    fig.subplots_adjust(left=0.05, right=0.95, hspace=0.6)
+    
+    answers = stats['answers']
+    total = max(stats['count'], 1)
+    
+    axs[0, 0].xaxis.set_major_locator(MaxNLocator(integer=True))
+    axs[0, 0].yaxis.set_major_locator(MaxNLocator(integer=True))
+    # room above the tallest bar for the labels
+    axs[0, 0].set_ylim((0, max(stats['responses'].max(initial=0) * 1.2, 1)))
+    for k in range(len(stats['responses']), axs.size):
+        axs.flat[k].axis('off')
+        # the question above the spare plot is now the bottom of its column
+        axs.flat[k - 5].xaxis.set_tick_params(labelbottom=True)
+    
+    for q, freq in enumerate(stats['responses']):
+        ax = axs[q // 5, q % 5]
+        ax.bar(answers, freq, width=0.8)
+        ax.set_title(f'Question {q}')
+    
+        for x, height in zip(answers, freq):
+            height = int(height)
+            ax.annotate("{}".format(height),
+                xy = (x, height),             # top of the bar
                 xytext = (0, 10),             # offset label position above bar
-                textcoords = "offset points", # offset (in points) from *xy* value
+                textcoords = "offset points", # offset (in points) from *xy*
                 ha = 'center', va = 'bottom',
                 fontsize=10)
-            axs[q // 5, q % 5].annotate(f"{height / 327:.1%}",
-                xy = (x, height),             # top left corner of histogram bar
+            ax.annotate(f"{height / total:.1%}",
+                xy = (x, height),             # top of the bar
                 xytext = (0, 0.2),            # offset label position above bar
-                textcoords = "offset points", # offset (in points) from *xy* value
+                textcoords = "offset points", # offset (in points) from *xy*
                 ha = 'center', va = 'bottom',
                 fontsize=8)
-            n = n + 1
     
-    if interactive: plt.show()
-    else: plt.savefig(out_path)
-    plt.close()
\ No newline at end of file
+    finishFigure(fig, out_path, interactive, dpi)
+
+############################### Rendering plots ###############################
+
+# file name -> (plot function, the stats it draws)
+PLOTS = {
+    'years.png': (plotYears, ['years', 'year labels']),
+    'majors.png': (plotMajors, ['majors', 'major labels']),
+    'sports.png': (plotSports, ['sports', 'sport labels']),
+    'kinds.png': (plotKinds, ['kinds', 'kind labels']),
+    'yearsKinds.png': (plotYearKind, ['year kind', 'year labels']),
+    'responses.png': (plotResponses, ['responses', 'answers', 'count']),
+}
+
+def plotKey(name, stats, dpi=None):
+    """ Returns a hash of everything that goes into drawing plot NAME. """
+    _, keys = PLOTS[name]
+    inputs = {key: np.asarray(stats[key]).tolist() for key in keys}
+    inputs.update({'name': name, 'dpi': dpi})
+    encoded = json.dumps(inputs, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def _renderPlot(name, stats, out_path, dpi):
+    plot, keys = PLOTS[name]
+    plot({key: stats[key] for key in keys}, out_path, dpi=dpi)
+
+def renderPlots(stats, plot_path, workers=None, preview=False, cache=True):
+    """
+    Draws every plot in PLOTS to PLOT_PATH, each in its own process, so the
+    whole thing takes about as long as the slowest plot. WORKERS is the
+    number of processes (None means one per core, 1 draws them here).
+
+    With PREVIEW, plots are saved at PREVIEW_DPI, which is much faster. With
+    CACHE, a plot is only drawn if its counts or DPI changed since it was
+    last written to PLOT_PATH.
+
+    Returns the file names that were drawn.
+    """
+    dpi = PREVIEW_DPI if preview else None
+    cache_path = os.path.join(plot_path, CACHE_FILE)
+
+    drawn = {}
+    if cache and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            drawn = json.load(f)
+
+    keys = {name: plotKey(name, stats, dpi) for name in PLOTS}
+    todo = [name for name in PLOTS
+            if not cache or drawn.get(name) != keys[name] or
+            not os.path.exists(os.path.join(plot_path, name))]
+    for name in PLOTS:
+        if name not in todo:
+            print(f'Skipping {name} (unchanged)')
+
+    jobs = [(name, stats, os.path.join(plot_path, name), dpi)
+            for name in todo]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            _renderPlot(*job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(_renderPlot, *zip(*jobs)):
+                pass
+
+    drawn.update({name: keys[name] for name in todo})
+    with open(cache_path, 'w') as f:
+        json.dump(drawn, f, indent=4)
+
+    return todo
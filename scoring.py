@@ -0,0 +1,263 @@
+"""
+file: scoring.py
+date: 10/17/26
+----------------------
+Batched compatibility scoring for Athlete Mingle.
+
+computeSimilarities used to call similarity.computeSimilarity (a module that
+isn't part of this repository) once per ordered pair. The functions here
+build the whole score matrix from the stacked response matrix and per-person
+sport/kind codes using NumPy array operations instead.
+
+A score is the Pearson correlation between two people's 29 compatibility
+answers. Pairs excluded by the rules in constraints.py score INELIGIBLE, and
+are skipped rather than scored wherever whole classes of people are ruled
+out.
+
+The answers are kept as one contiguous n x 29 uint8 matrix, the cohort's
+(see cohort.cohortPeople), which responseMatrix takes rows of.
+All of the sums are exact integers: the pairwise dot products go through
+float32 BLAS, which is exact at these sizes (see _productBlock), and the rest
+is int64. So the only rounding is in the final square root and division.
+The tests compare the scores with similarity.computeSimilarity where that
+module can be imported, and with np.corrcoef everywhere.
+"""
+import numpy as np
+
+from constraints import eligibleMask, partnerPools
+from instrument import count
+
+KIND_LABELS = ['Men', 'Women', 'Co-Ed']
+NUM_QUESTIONS = 29
+INELIGIBLE = -1.0
+BLOCK_SIZE = 1024
+
+################################ Score matrix #################################
+
+def responseMatrix(people):
+    """
+    Returns the n x 29 uint8 matrix of PEOPLE's responses. People from
+    cohort.cohortPeople hold rows of their cohort's matrix, so theirs are
+    taken from it by row in one step. Anyone else's answers are stacked.
+    """
+    matrix = getattr(people[0]['responses'], 'base', None) if people else None
+    if matrix is not None and all(
+            getattr(person['responses'], 'base', None) is matrix
+            for person in people):
+        return matrix[[person['row'] for person in people]]
+
+    return np.array([person['responses'] for person in people],
+                    dtype=np.uint8).reshape(len(people), NUM_QUESTIONS)
+
+def responseTerms(responses):
+    """ Returns the int64 sum and sum of squares of each row of RESPONSES. """
+    return (responses.sum(axis=1, dtype=np.int64),
+            np.square(responses, dtype=np.int64).sum(axis=1))
+
+def cohortArrays(people, sport_data):
+    """
+    Returns the (responses, sports, kinds) arrays for PEOPLE. Row i of each
+    array corresponds to people[i].
+        responses - n x 29 uint8 matrix of answers (see responseMatrix)
+        sports - sport id of each person
+        kinds - index into KIND_LABELS of each person's sport kind
+    """
+    responses = responseMatrix(people)
+    sports = np.array([person['meta data']['sport id'] for person in people],
+                      dtype=np.int64)
+    kind_names = [sport_data[person['meta data']['sport name']]['kind']
+                  for person in people]
+    kinds = np.array([KIND_LABELS.index(kind) for kind in kind_names],
+                     dtype=np.int64)
+    return responses, sports, kinds
+
+def _productBlock(responses, rows, cols):
+    """
+    Returns the dot products between the answers of ROWS and COLS, as
+    float64. Every dot product (and every partial sum along the way) is an
+    integer below 29 * 255^2 < 2^24, which float32 represents exactly, so
+    BLAS can compute them instead of NumPy's much slower integer loops.
+    """
+    left = responses[rows].astype(np.float32)
+    right = responses[cols].astype(np.float32)
+    return (left @ right.T).astype(np.float64)
+
+def _scoreBlock(responses, sums, squares, rows, cols):
+    """
+    Returns the Pearson correlations between the people in ROWS and COLS.
+    People who gave the same answer to every question have no variance and
+    score 0 with everyone.
+
+    The covariances and the products of the variances are integers below
+    2^53, so they are exact in float64 and only the square root and the
+    division round. The block is computed in place to keep a single
+    temporary the size of the block.
+    """
+    q = responses.shape[1]
+    var = (q * squares - sums * sums).astype(np.float64)
+
+    scores = _productBlock(responses, rows, cols)
+    scores *= q
+    scores -= np.outer(sums[rows], sums[cols])
+
+    denom = np.outer(var[rows], var[cols])
+    np.sqrt(denom, out=denom)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(scores, denom, out=scores)
+    scores[var[rows] == 0] = 0
+    scores[:, var[cols] == 0] = 0
+    return scores
+
+def _eligibleScoreBlock(responses, sums, squares, sports, kinds, rows, cols,
+                        same_kind_ok, same_sport_ok, grades=None):
+    """
+    Returns the scores between ROWS and COLS, with the pairs excluded by the
+    rules (see constraints.eligibleMask) set to INELIGIBLE. Rows and columns
+    without any eligible pair are not scored at all.
+    """
+    eligible = eligibleMask(sports, kinds, rows, cols, same_kind_ok,
+                            same_sport_ok, grades)
+    live_rows, live_cols = eligible.any(axis=1), eligible.any(axis=0)
+
+    if live_rows.all() and live_cols.all():
+        block = _scoreBlock(responses, sums, squares, rows, cols)
+        count('pairs scored', block.size)
+        block[~eligible] = INELIGIBLE
+        return block
+
+    block = np.full(eligible.shape, INELIGIBLE)
+    if live_rows.any():
+        live = np.ix_(live_rows, live_cols)
+        scores = _scoreBlock(responses, sums, squares, rows[live_rows],
+                             cols[live_cols])
+        count('pairs scored', scores.size)
+        block[live] = np.where(eligible[live], scores, INELIGIBLE)
+
+    return block
+
+def computeSimilarityMatrix(responses, sports, kinds, same_kind_ok=False,
+                            same_sport_ok=False, upper_only=False,
+                            grades=None):
+    """
+    Returns the n x n matrix of compatibility scores for the cohort. Each
+    class of people from constraints.partnerPools is only scored against the
+    people they could be paired with.
+
+    params:
+        same_kind_ok - allow pairs whose sports are the same kind
+        same_sport_ok - allow pairs who play the same sport
+        upper_only - only compute pairs (i, j) with i < j. Every other entry
+                     is INELIGIBLE. The greedy matcher picks the same pairs
+                     from this matrix at roughly half the cost.
+        grades - GRADES from constraints.gradeArrays to enforce the
+                 same-grade answers, or None to ignore them
+    """
+    responses = np.ascontiguousarray(responses, dtype=np.uint8)
+    n = len(responses)
+
+    sums, squares = responseTerms(responses)
+
+    scores = np.full((n, n), INELIGIBLE)
+    for members, partners in partnerPools(kinds, same_kind_ok, grades):
+        for start in range(0, len(members), BLOCK_SIZE):
+            rows = members[start:start + BLOCK_SIZE]
+            cols = partners[partners > rows[0]] if upper_only else partners
+            if len(cols) == 0:
+                continue
+
+            block = _eligibleScoreBlock(responses, sums, squares, sports,
+                                        kinds, rows, cols, same_kind_ok,
+                                        same_sport_ok, grades)
+            if upper_only:
+                block[rows[:, None] >= cols[None, :]] = INELIGIBLE
+
+            scores[np.ix_(rows, cols)] = block
+
+    return scores
+
+def computeSimilarityBlock(responses, sports, kinds, rows, cols,
+                           same_kind_ok=False, same_sport_ok=False,
+                           grades=None):
+    """
+    Returns the len(ROWS) x len(COLS) block of computeSimilarityMatrix,
+    without computing the rest of the matrix.
+    """
+    responses = np.ascontiguousarray(responses, dtype=np.uint8)
+    sums, squares = responseTerms(responses)
+    return _eligibleScoreBlock(responses, sums, squares, sports, kinds,
+                               np.asarray(rows, dtype=np.int64),
+                               np.asarray(cols, dtype=np.int64),
+                               same_kind_ok, same_sport_ok, grades)
+
+############################### Candidate index ###############################
+
+def candidateIndex(responses, sports, kinds, k, same_kind_ok=False,
+                   same_sport_ok=False, grades=None):
+    """
+    Returns each person's K best eligible partners without ever holding the
+    full n x n matrix. The result is a pair of n x K arrays:
+        partners - int32 indices of the partners, best first, -1 for padding
+                   when someone has fewer than K eligible partners
+        partner_scores - float64 scores of those partners (INELIGIBLE for
+                         padding), identical to computeSimilarityMatrix
+
+    Memory: the index keeps 12 * K bytes per participant (4 for the partner
+    index, 8 for the score). While it is built, one BLOCK_SIZE x n block of
+    scores is held at a time, so peak memory is about 12 * K * n bytes plus
+    a few BLOCK_SIZE * n * 8 byte temporaries, instead of 8 * n^2 bytes.
+
+    Each class of people from constraints.partnerPools is only scored against
+    the people they could be paired with (see computeSimilarityMatrix).
+    """
+    responses = np.ascontiguousarray(responses, dtype=np.uint8)
+    n = len(responses)
+    k = max(0, min(k, n - 1))
+
+    sums, squares = responseTerms(responses)
+
+    partners = np.full((n, k), -1, dtype=np.int32)
+    partner_scores = np.full((n, k), INELIGIBLE)
+    pools = partnerPools(kinds, same_kind_ok, grades) if k else []
+    for members, cols in pools:
+        width = min(k, len(cols))
+        for start in range(0, len(members) if width else 0, BLOCK_SIZE):
+            rows = members[start:start + BLOCK_SIZE]
+
+            block = _eligibleScoreBlock(responses, sums, squares, sports,
+                                        kinds, rows, cols, same_kind_ok,
+                                        same_sport_ok, grades)
+            block[rows[:, None] == cols[None, :]] = INELIGIBLE
+
+            if width < len(cols):
+                best = np.argpartition(-block, width - 1, axis=1)[:, :width]
+            else:
+                best = np.tile(np.arange(len(cols)), (len(rows), 1))
+            best_scores = np.take_along_axis(block, best, axis=1)
+
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = cols[np.take_along_axis(best, order, axis=1)]
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+            eligible = best_scores > INELIGIBLE
+            partners[rows, :width] = np.where(eligible, best, -1)
+            partner_scores[rows, :width] = np.where(eligible, best_scores,
+                                                    INELIGIBLE)
+
+    return partners, partner_scores
+
+def candidatePairs(partners, partner_scores):
+    """
+    Returns (rows, cols, values) for every distinct pair (i, j), i < j, in the
+    candidate index. A pair is included if either person lists the other.
+    """
+    n, k = partners.shape
+    rows = np.repeat(np.arange(n), k)
+    cols = partners.ravel().astype(np.int64)
+    values = partner_scores.ravel()
+
+    keep = cols >= 0
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+    rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+
+    _, first = np.unique(rows * n + cols, return_index=True)
+    return rows[first], cols[first], values[first]
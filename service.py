@@ -0,0 +1,527 @@
+"""
+file: service.py
+date: 10/17/26
+----------------------
+A local HTTP service around the matcher. It keeps each event's cohort and
+score matrices in memory, so a lookup takes milliseconds instead of a whole
+run of match.py.
+
+An event is a folder in EVENT_DIR holding its survey exports as numbers.csv
+and text.csv (the same files match.py reads from NUMBER_FILE and TEXT_FILE).
+Its matches and run report are written to the event's output/ folder.
+Events are ordered by their date, the end date of their last survey response
+(see eventDate). The outputs of the events dated before an event are its
+past rounds (see history.py); later events' never are.
+
+Endpoints (JSON in and out):
+    GET  /events                            events, oldest first, their
+                                            dates, and which are in memory
+    GET  /events/<event>                    the size of each pool
+    GET  /events/<event>/people/<who>/candidates?k=10
+                                            the k best partners of <who>
+                                            (qualtrics id or email)
+    DELETE /events/<event>/people/<who>     leaves <who> out of lookups,
+                                            candidates and match runs
+    POST /events/<event>/responses          {"numbers": [row, ...],
+                                             "text": [row, ...]}
+                                            adds survey rows to the exports
+    POST /events/<event>/match              {"seed": 3, "update": false}
+                                            runs match.py on the event (see
+                                            match.main) and returns the
+                                            summaries
+
+Loading an event (parsing the exports and scoring both pools) and match
+runs go to a pool of WORKERS processes, so the server keeps answering while
+they run. Match runs are given the event's score matrices instead of
+scoring everyone again. Up to MAX_EVENTS events are kept in memory; the
+least recently used one is dropped first, and an event is dropped when
+responses are added to it. Each event takes about
+8 * (1-on-1 people^2 + group people^2) bytes.
+
+People are looked up through each pool's person index (see
+cohort.buildPersonIndex). Removing someone (e.g. a no-show) takes them out
+of it and lasts as long as the server runs; their responses stay in the
+exports.
+
+Only the standard library is used. The service is meant for a laptop during
+an event, so it listens on localhost and has no authentication.
+
+Try it on made-up data (see synthetic.py):
+    python service.py --synthetic 2000
+    curl localhost:8000/events/demo
+"""
+import argparse
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import csv
+from http import HTTPStatus
+import io
+import json
+import os
+import re
+import signal
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+import match
+from cohort import HEADER_ROWS, buildPersonIndex, dropPerson, lookupPerson
+from instrument import resetReport
+from scoring import INELIGIBLE
+from synthetic import writeSurvey
+
+EVENT_DIR = 'events/'
+HOST = '127.0.0.1'
+PORT = 8000
+# Events whose cohort and scores are kept in memory
+MAX_EVENTS = 4
+# Processes loading events and running matches (None means one per core)
+WORKERS = None
+# Candidates returned when the request doesn't say
+TOP_K = 10
+
+POOLS = ['1-on-1', 'group']
+SUMMARIES = ['matches_1-on-1', 'matches_group', 'groups']
+
+class RequestError(Exception):
+    """ A request that can't be served, answered with STATUS. """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+############################## Worker processes ###############################
+
+def useEvent(event_dir, event):
+    """ Points match.py at EVENT's files, in this process. """
+    folder = os.path.join(event_dir, event)
+    match.NUMBER_FILE = os.path.join(folder, 'numbers.csv')
+    match.TEXT_FILE = os.path.join(folder, 'text.csv')
+    match.OUT_PATH = os.path.join(folder, 'output') + os.sep
+    match.PLOT_PATH = match.OUT_PATH + 'plots' + os.sep
+    match.HISTORY_GLOB = os.path.join(event_dir, '*', 'output', '')
+    match.QUIET = True
+    os.makedirs(match.OUT_PATH, exist_ok=True)
+
+    """ Nothing from the last task in this process carries over. """
+    match._history.clear()
+    match._round['date'] = None
+    resetReport()
+
+def describe(person):
+    """ Returns what the service tells about PERSON. """
+    info = person['meta data']
+    return {
+        'qualtrics id': person['qualtrics id'],
+        'name': info['name'],
+        'email': info['email'],
+        'sport': info['sport name'],
+        'year': info['year'],
+        'same grade': person['athlete mingle']['same grade'],
+    }
+
+def loadEvent(event_dir, event):
+    """
+    Returns EVENT's cache entry: for each pool (1-on-1 and group), its people
+    (see describe) in the order of the exports, its full score matrix, its
+    person index (see cohort.buildPersonIndex) and its qualtrics ids, and
+    the positions of the people removed from it (see removePerson).
+    """
+    useEvent(event_dir, event)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        people, _ = match.loadData(shuffle=False)
+        one_on_one, group = match.separatePairsAndGroups(people)
+        pools = dict(zip(POOLS, [one_on_one, group]))
+        scores = {name: match.computeSimilarities(pool)
+                  for name, pool in pools.items()}
+
+    return {
+        'people': {name: [describe(person) for person in pool]
+                   for name, pool in pools.items()},
+        'scores': scores,
+        'index': {name: buildPersonIndex(pool)
+                  for name, pool in pools.items()},
+        'ids': {name: {person['qualtrics id'].lower(): i
+                       for i, person in enumerate(pool)}
+                for name, pool in pools.items()},
+        'removed': {name: set() for name in POOLS},
+        'seconds': time.perf_counter() - start,
+    }
+
+def runMatch(event_dir, event, seed=None, update=False, pools=None):
+    """
+    Runs match.py on EVENT (see match.main) and returns the summaries it
+    wrote, along with the match state's round. POOLS, if given, holds each
+    pool's (qualtrics ids, score matrix, removed positions) from the cache
+    entry: the removed people are left out and the others matched from the
+    matrix.
+    """
+    useEvent(event_dir, event)
+    start = time.perf_counter()
+
+    pool_scores = None
+    if pools is not None:
+        pool_scores = []
+        for ids, scores, removed in pools:
+            kept = [i for i in range(len(ids)) if i not in removed]
+            pool_scores.append(([ids[i] for i in kept],
+                                scores[np.ix_(kept, kept)]))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        match.main(analyze=False, seed=seed, update=update,
+                   pool_scores=pool_scores)
+
+    summaries = {}
+    for name in SUMMARIES:
+        with open(f'{match.OUT_PATH}{name}.summary.json') as f:
+            summaries[name] = json.load(f)
+    return {
+        'round': match.loadMatchState()['round'],
+        'summaries': summaries,
+        'seconds': time.perf_counter() - start,
+    }
+
+def checkRows(rows, name):
+    """ Raises a 400 unless ROWS is a list of rows of strings and numbers. """
+    if not isinstance(rows, list) or not all(
+            isinstance(row, list) and
+            all(isinstance(value, (str, int, float)) for value in row)
+            for row in rows):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           f'{name} must be a list of rows of strings and '
+                           f'numbers')
+
+def appendResponses(event_dir, event, numbers, text):
+    """
+    Adds the survey rows NUMBERS and TEXT (one per respondent, in the same
+    order, laid out as in the exports) to EVENT's exports.
+    """
+    folder = os.path.join(event_dir, event)
+    for name, rows in [('numbers.csv', numbers), ('text.csv', text)]:
+        with open(os.path.join(folder, name), newline='') as f:
+            width = len(next(csv.reader(f)))
+        if any(len(row) != width for row in rows):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               f'Every row of {name} has {width} columns')
+
+    for name, rows in [('numbers.csv', numbers), ('text.csv', text)]:
+        with open(os.path.join(folder, name), 'a', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+################################### Events ####################################
+
+def eventFolder(state, event):
+    """ Returns EVENT's folder, or raises a 404 if there is no such event. """
+    folder = os.path.join(state['event dir'], event)
+    if not re.fullmatch(r'[\w.-]+', event) or event.startswith('.') or \
+       not os.path.exists(os.path.join(folder, 'numbers.csv')):
+        raise RequestError(HTTPStatus.NOT_FOUND, f'No event {event}')
+    return folder
+
+def eventDate(event_dir, event):
+    """
+    Returns EVENT's date: the end date of the last response in its exports,
+    as in match.latestResponse, or None if there is none yet.
+    """
+    with open(os.path.join(event_dir, event, 'numbers.csv'), newline='') as f:
+        rows = csv.reader(f)
+        for _ in range(HEADER_ROWS):
+            next(rows, None)
+        return max((row[1] for row in rows if len(row) > 1), default=None)
+
+def eventLock(state, event):
+    """
+    Returns EVENT's lock, held while its exports are read or written, so
+    that nobody reads half of a submission.
+    """
+    return state['locks'].setdefault(event, asyncio.Lock())
+
+async def inPool(state, function, *args):
+    """ Runs FUNCTION(*ARGS) in the worker pool. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(state['pool'], function, *args)
+
+async def loadedEvent(state, event):
+    """
+    Returns EVENT's cache entry (see loadEvent), loading it in the worker
+    pool if it isn't in memory. Requests for an event that is being loaded
+    wait for that load.
+    """
+    eventFolder(state, event)
+    cache = state['cache']
+    if event not in cache:
+        async def load():
+            async with eventLock(state, event):
+                entry = await inPool(state, loadEvent, state['event dir'],
+                                     event)
+            for who in state['removed'].get(event, ()):
+                removePerson(entry, *findPerson(entry, who))
+            return entry
+        cache[event] = asyncio.ensure_future(load())
+        while len(cache) > state['max events']:
+            cache.popitem(last=False)
+    cache.move_to_end(event)
+
+    try:
+        return await cache[event]
+    except Exception:
+        cache.pop(event, None)
+        raise
+
+def findPerson(entry, who):
+    """
+    Returns (pool, index) of the person in ENTRY whose qualtrics id or email
+    is WHO. Removed people aren't found.
+    """
+    who = who.strip().lower()
+    for pool in POOLS:
+        if '@' in who:
+            found, _ = lookupPerson(entry['index'][pool], who, cutoff=None)
+        else:
+            found = [entry['ids'][pool][who]] if who in entry['ids'][pool] \
+                    else []
+        if len(found) > 0:
+            return pool, found[0]
+    raise RequestError(HTTPStatus.NOT_FOUND, f'Nobody is {who}')
+
+def removePerson(entry, pool, i):
+    """
+    Takes person I of POOL out of ENTRY's lookups, everyone's candidates and
+    match runs.
+    """
+    person = entry['people'][pool][i]
+    dropPerson(entry['index'][pool], i, person['name'], person['email'])
+    del entry['ids'][pool][person['qualtrics id'].lower()]
+    entry['removed'][pool].add(i)
+
+def topCandidates(entry, pool, i, k):
+    """
+    Returns person I's K best eligible partners in POOL, best first, with
+    their adjusted scores (as in the match files).
+    """
+    scores = entry['scores'][pool][i].copy()
+    scores[list(entry['removed'][pool])] = INELIGIBLE
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k] if k > 0 else []
+    best = sorted((j for j in best if j != i and scores[j] > INELIGIBLE),
+                  key=lambda j: (-scores[j], j))
+    return [{**entry['people'][pool][j],
+             'score': match.adjustScore(float(scores[j]))} for j in best]
+
+################################## Endpoints ##################################
+
+async def listEvents(state, query, body):
+    folders = os.listdir(state['event dir']) \
+              if os.path.isdir(state['event dir']) else []
+    dates = {event: eventDate(state['event dir'], event) for event in folders
+             if os.path.exists(os.path.join(state['event dir'], event,
+                                            'numbers.csv'))}
+    return {
+        'events': sorted(dates, key=lambda event: (dates[event] or '', event)),
+        'dates': dates,
+        'in memory': list(state['cache']),
+    }
+
+async def getEvent(state, query, body, event):
+    entry = await loadedEvent(state, event)
+    return {
+        'event': event,
+        **{pool: len(entry['people'][pool]) for pool in POOLS},
+        'load seconds': entry['seconds'],
+    }
+
+async def getCandidates(state, query, body, event, who):
+    try:
+        k = int(query.get('k', [TOP_K])[0])
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'k must be a number')
+
+    entry = await loadedEvent(state, event)
+    pool, i = findPerson(entry, who)
+    return {
+        'person': entry['people'][pool][i],
+        'pool': pool,
+        'candidates': topCandidates(entry, pool, i, k),
+    }
+
+async def deletePerson(state, query, body, event, who):
+    entry = await loadedEvent(state, event)
+    pool, i = findPerson(entry, who)
+    removePerson(entry, pool, i)
+    state['removed'].setdefault(event, set()).add(
+        entry['people'][pool][i]['qualtrics id'])
+    return {'event': event, 'removed': entry['people'][pool][i],
+            'pool': pool}
+
+async def postResponses(state, query, body, event):
+    numbers, text = body.get('numbers', []), body.get('text', [])
+    checkRows(numbers, 'numbers')
+    checkRows(text, 'text')
+    if len(numbers) != len(text):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           'numbers and text need one row per respondent')
+
+    eventFolder(state, event)
+    async with eventLock(state, event):
+        await asyncio.to_thread(appendResponses, state['event dir'], event,
+                                numbers, text)
+        state['cache'].pop(event, None)
+    return {'event': event, 'added': len(numbers)}
+
+async def postMatch(state, query, body, event):
+    seed, update = body.get('seed'), bool(body.get('update', False))
+    if seed is not None and not isinstance(seed, int):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'seed must be a number')
+
+    """ Responses added meanwhile drop the entry, which is then reloaded. """
+    while True:
+        entry = await loadedEvent(state, event)
+        async with eventLock(state, event):
+            cached = state['cache'].get(event)
+            if cached is None or not cached.done() or \
+               cached.result() is not entry:
+                continue
+            pools = [([person['qualtrics id'] for person in
+                       entry['people'][pool]], entry['scores'][pool],
+                      entry['removed'][pool]) for pool in POOLS]
+            result = await inPool(state, runMatch, state['event dir'], event,
+                                  seed, update, pools)
+        return {'event': event, **result}
+
+ROUTES = [
+    ('GET', r'/events/?', listEvents),
+    ('GET', r'/events/([^/]+)/?', getEvent),
+    ('GET', r'/events/([^/]+)/people/([^/]+)/candidates/?', getCandidates),
+    ('DELETE', r'/events/([^/]+)/people/([^/]+)/?', deletePerson),
+    ('POST', r'/events/([^/]+)/responses/?', postResponses),
+    ('POST', r'/events/([^/]+)/match/?', postMatch),
+]
+
+################################### Server ####################################
+
+async def route(state, method, target, body):
+    """ Returns (status, payload) for the request. """
+    url = urlsplit(target)
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        found = re.fullmatch(pattern, url.path)
+        if found is None:
+            continue
+        allowed = True
+        if route_method != method:
+            continue
+
+        try:
+            body = json.loads(body) if body.strip() else {}
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'The body is not JSON')
+        if not isinstance(body, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               'The body must be a JSON object')
+        args = [unquote(group) for group in found.groups()]
+        return HTTPStatus.OK, await handler(state, parse_qs(url.query), body,
+                                            *args)
+
+    if allowed:
+        raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED,
+                           f'{method} is not allowed on {url.path}')
+    raise RequestError(HTTPStatus.NOT_FOUND, f'Nothing at {url.path}')
+
+async def handleConnection(state, reader, writer):
+    """ Serves one request and closes the connection. """
+    start = time.perf_counter()
+    method = target = None
+    try:
+        request_line = (await reader.readline()).decode('latin-1')
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        status, payload = await route(state, method, target, body)
+    except RequestError as error:
+        status, payload = error.status, {'error': str(error)}
+    except (ValueError, asyncio.IncompleteReadError):
+        status, payload = HTTPStatus.BAD_REQUEST, {'error': 'Bad request'}
+    except Exception as error:
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        payload = {'error': f'{type(error).__name__}: {error}'}
+
+    data = json.dumps(payload, indent=4).encode()
+    writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode() + data)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+    if state['verbose']:
+        print(f'{method} {target} {status.value} ' + \
+              f'({(time.perf_counter() - start) * 1000:.1f} ms)')
+
+async def serve(event_dir=EVENT_DIR, host=HOST, port=PORT,
+                max_events=MAX_EVENTS, workers=WORKERS, verbose=True):
+    """
+    Serves the events in EVENT_DIR on HOST:PORT until interrupted or
+    terminated, then shuts the worker pool down.
+    """
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        # not available on Windows, where Ctrl+C still stops the server
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        state = {
+            'event dir': event_dir,
+            'cache': OrderedDict(),
+            'locks': {},
+            # event -> qualtrics ids of the people removed from it
+            'removed': {},
+            'pool': pool,
+            'max events': max_events,
+            'verbose': verbose,
+        }
+        server = await asyncio.start_server(
+            lambda reader, writer: handleConnection(state, reader, writer),
+            host, port)
+        print(f'Serving {event_dir} on http://{host}:{port}')
+        async with server:
+            await stop.wait()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Athlete Mingle service')
+    parser.add_argument('--events', default=EVENT_DIR,
+                        help='folder with one folder per event')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-events', type=int, default=MAX_EVENTS,
+                        help='events kept in memory')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='processes for loading and matching')
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help='first write a made-up event "demo" of N people')
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        folder = os.path.join(args.events, 'demo')
+        os.makedirs(folder, exist_ok=True)
+        writeSurvey(args.synthetic, os.path.join(folder, 'numbers.csv'),
+                    os.path.join(folder, 'text.csv'))
+
+    try:
+        asyncio.run(serve(event_dir=args.events, host=args.host,
+                          port=args.port, max_events=args.max_events,
+                          workers=args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,100 @@
+"""
+file: stats.py
+date: 10/17/26
+----------------------
+Counts everything the analysis plots show, in one pass over the cohort.
+
+Years, majors, sports and kinds are encoded as integer codes (positions in
+their label lists) once, and every histogram and cross-tab is then a single
+np.bincount. The result is a dictionary:
+    'count'         number of people
+    'year labels', 'major labels', 'sport labels', 'kind labels'
+    'years', 'majors', 'sports', 'kinds'    counts per label
+    'year kind'     len(kind labels) x len(year labels) cross-tab
+    'answers'       the answer values that occur in the responses
+    'responses'     29 x len(answers) counts of each answer to each question
+
+People whose year, major or sport isn't one of the labels are left out of
+that histogram and of the cross-tab.
+"""
+import numpy as np
+
+from scoring import KIND_LABELS, NUM_QUESTIONS, responseMatrix
+
+YEAR_LABELS = ['Frosh', 'Sophomore', 'Junior', 'Senior', '5th year/Coterm']
+MAJOR_LABELS = [
+    'Aeronautics and Astronautics',
+    'Biology',
+    'Chemistry',
+    'Computer Science',
+    'Earth Systems',
+    'Econ',
+    'Engineering',
+    'English',
+    'History',
+    'Human Biology',
+    'MS&E',
+    'Physics',
+    'Political Science',
+    'Product Design',
+    'Psychology',
+    'STS',
+    'SymSys',
+    'Other'
+]
+
+def encode(values, labels):
+    """ Returns the position of each of VALUES in LABELS, or -1 if absent. """
+    codes = {label: i for i, label in enumerate(labels)}
+    return np.array([codes.get(value, -1) for value in values],
+                    dtype=np.int64)
+
+def histogram(codes, size):
+    """ Returns how often each code in range(SIZE) occurs in CODES. """
+    return np.bincount(codes[codes >= 0], minlength=size)
+
+def crossTab(row_codes, col_codes, shape):
+    """
+    Returns the SHAPE table counting each (row, col) pair of codes, skipping
+    pairs where either code is -1.
+    """
+    valid = (row_codes >= 0) & (col_codes >= 0)
+    flat = row_codes[valid] * shape[1] + col_codes[valid]
+    return np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+
+def cohortStats(people, sport_data):
+    """ Returns the counts (see above) for PEOPLE. """
+    sport_labels = list(sport_data)
+    sport_kinds = encode([sport_data[sport]['kind'] for sport in sport_labels],
+                         KIND_LABELS)
+
+    info = [person['meta data'] for person in people]
+    years = encode([i['year'] for i in info], YEAR_LABELS)
+    majors = encode([i['major'] for i in info], MAJOR_LABELS)
+    sports = encode([i['sport name'] for i in info], sport_labels)
+    kinds = np.where(sports >= 0, sport_kinds[sports], -1)
+
+    responses = responseMatrix(people)
+    lowest = int(responses.min()) if len(people) > 0 else 0
+    highest = int(responses.max()) if len(people) > 0 else lowest - 1
+    answers = np.arange(lowest, highest + 1)
+    questions = np.broadcast_to(np.arange(NUM_QUESTIONS), responses.shape)
+    response_counts = crossTab(questions.ravel(),
+                               responses.ravel().astype(np.int64) - lowest,
+                               (NUM_QUESTIONS, len(answers)))
+
+    return {
+        'count': len(people),
+        'year labels': YEAR_LABELS,
+        'major labels': MAJOR_LABELS,
+        'sport labels': sport_labels,
+        'kind labels': KIND_LABELS,
+        'years': histogram(years, len(YEAR_LABELS)),
+        'majors': histogram(majors, len(MAJOR_LABELS)),
+        'sports': histogram(sports, len(sport_labels)),
+        'kinds': histogram(kinds, len(KIND_LABELS)),
+        'year kind': crossTab(kinds, years,
+                              (len(KIND_LABELS), len(YEAR_LABELS))),
+        'answers': answers,
+        'responses': response_counts,
+    }
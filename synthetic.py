@@ -0,0 +1,199 @@
+"""
+file: synthetic.py
+date: 10/17/26
+----------------------
+Writes made-up survey exports with the same layout as the real ones, so the
+matcher can be run and benchmarked without the (private) survey data.
+
+writeSurvey produces a NUMBER_FILE/TEXT_FILE pair: 62 columns as described
+at the top of match.py, the three Qualtrics header rows, and one row per
+respondent, in the same order in both files. Answers are codes in the number
+export and labels in the text export. Respondents belong to one of a few
+personality types, so their compatibility answers have some structure to
+match on. Some surveys are left unfinished, and some people nominate
+friends: usually by name, sometimes by email, misspelled, or someone who
+didn't fill out the survey.
+
+From the command line:
+    python synthetic.py 1000 data/synthetic
+writes data/synthetic_numbers.csv and data/synthetic_text.csv.
+"""
+import argparse
+import csv
+
+import numpy as np
+
+from cohort import NUM_QUESTIONS, sportData
+from stats import MAJOR_LABELS, YEAR_LABELS
+
+# Share of unfinished surveys and of people who put down friends
+INCOMPLETE_RATE = 0.1
+FRIEND_RATE = 0.25
+# Number of personality types the compatibility answers are drawn around
+NUM_TYPES = 8
+
+META_COLUMNS = [
+    'StartDate', 'EndDate', 'Status', 'IPAddress', 'Progress',
+    'Duration (in seconds)', 'Finished', 'RecordedDate', 'ResponseId',
+    'RecipientLastName', 'RecipientFirstName', 'RecipientEmail',
+    'ExternalReference', 'LocationLatitude', 'LocationLongitude',
+    'DistributionChannel', 'UserLanguage',
+]
+EXTRA_COLUMNS = [
+    'Q7_Parent Topics', 'Q7_Sentiment Polarity', 'Q7_Sentiment Score',
+    'Q7_Sentiment', 'Q7_Topic Sentiment Label', 'Q7_Topic Sentiment Score',
+    'Q7_Topics',
+]
+AGREEMENT_LABELS = ['Strongly disagree', 'Somewhat disagree',
+                    'Neither agree nor disagree', 'Somewhat agree',
+                    'Strongly agree']
+FIRST_NAMES = [
+    'Alex', 'Bailey', 'Cameron', 'Dana', 'Elliot', 'Finley', 'Gray',
+    'Harper', 'Indira', 'Jordan', 'Kai', 'Logan', 'Morgan', 'Noa', 'Oakley',
+    'Parker', 'Quinn', 'Riley', 'Sasha', 'Taylor', 'Uma', 'Val', 'Wren',
+    'Xiomara', 'Yuki', 'Zion',
+]
+# Last names are made of four of these, so few people share a name
+SYLLABLES = ['ba', 'ko', 'mi', 'ne', 'ro', 'sa', 'ti', 'vu', 'da', 'le',
+             'zo', 'ha', 'ri', 'po', 'lu', 'me', 'na', 'ya', 'ge', 'fi']
+
+def headerRows():
+    """ Returns the three header rows Qualtrics puts at the top. """
+    questions = [f'Q{q}' for q in range(1, 9)] + \
+                [f'Q9_{q}' for q in range(1, NUM_QUESTIONS + 1)] + ['Q10']
+    names = META_COLUMNS + questions + EXTRA_COLUMNS
+
+    texts = META_COLUMNS + [
+        'First and last name', 'Stanford email', 'What year are you?',
+        'What sport do you do?', 'Major? (or interest if no major yet)',
+        'Would you rather be matched 1-on-1 or in a small group?',
+        'If you want one teammate or friend to be in your group, you should '
+        'both put each other\'s name for this question!',
+        'Do you want to be placed with people in your year?',
+    ] + [f'How much do you agree? - Statement {q}'
+         for q in range(1, NUM_QUESTIONS + 1)] + [
+        'Unrelated to Athlete Mingle: would you be interested in a '
+        'student-athlete speed dating event in the future?',
+    ] + EXTRA_COLUMNS
+
+    import_ids = ['{"ImportId":"' + name + '"}' for name in names]
+    return [names, texts, import_ids]
+
+def _misspell(name, rng):
+    """ Returns NAME with two neighboring letters swapped. """
+    i = rng.integers(1, max(len(name) - 2, 2))
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+def _nominations(n, names, emails, rng):
+    """ Returns what each of the N respondents wrote as their friends. """
+    friends = [''] * n
+    nominators = np.flatnonzero(rng.random(n) < FRIEND_RATE)
+    picks = rng.integers(0, n, size=(len(nominators), 2))
+    kinds = rng.random((len(nominators), 2))
+
+    for i, pick, kind in zip(nominators, picks, kinds):
+        nominated = []
+        # most people name one friend, some name two
+        for j, roll in zip(pick[:1 + (kind[1] < 0.1)], kind):
+            if roll < 0.8:
+                nominated.append(names[j])
+            elif roll < 0.9:
+                nominated.append(emails[j])
+            elif roll < 0.95:
+                nominated.append(_misspell(names[j], rng))
+            else:
+                nominated.append(f'{FIRST_NAMES[j % len(FIRST_NAMES)]} '
+                                 'Notsignedup')
+        friends[i] = ', '.join(nominated)
+
+        # friends usually put each other down
+        j = pick[0]
+        if kind[0] < 0.8 and j != i and friends[j] == '':
+            friends[j] = names[i]
+    return friends
+
+def writeSurvey(n, number_file, text_file, seed=0):
+    """
+    Writes the exports for N made-up respondents to NUMBER_FILE and
+    TEXT_FILE. The same SEED always writes the same files.
+    """
+    rng = np.random.default_rng(seed)
+    sports = list(sportData())
+
+    first = rng.integers(0, len(FIRST_NAMES), n)
+    last = rng.integers(0, len(SYLLABLES), size=(n, 4))
+    names = [FIRST_NAMES[f] + ' ' + ''.join(SYLLABLES[s] for s in l).title()
+             for f, l in zip(first, last)]
+    emails = [f'{FIRST_NAMES[f].lower()}{i}@stanford.edu'
+              for i, f in enumerate(first)]
+
+    years = rng.integers(0, len(YEAR_LABELS), n)
+    sport_ids = rng.integers(0, len(sports), n)
+    majors = rng.integers(0, len(MAJOR_LABELS), n)
+    one_on_one = rng.random(n) < 0.3
+    same_grade = rng.random(n) < 0.3
+    speed_dating = rng.random(n) < 0.5
+
+    """ Answers are a personality type's answers plus some noise. """
+    types = rng.uniform(1, 5, size=(NUM_TYPES, NUM_QUESTIONS))
+    noise = rng.normal(0, 1, size=(n, NUM_QUESTIONS))
+    responses = np.clip(np.rint(types[rng.integers(0, NUM_TYPES, n)] + noise),
+                        1, 5).astype(np.int64)
+
+    """ Unfinished surveys stop partway through the questions. """
+    incomplete = rng.random(n) < INCOMPLETE_RATE
+    stops = rng.integers(0, NUM_QUESTIONS, n)
+
+    friends = _nominations(n, names, emails, rng)
+    durations = rng.integers(120, 1200, n)
+
+    with open(number_file, 'w', newline='') as number_f, \
+         open(text_file, 'w', newline='') as text_f:
+        number_writer = csv.writer(number_f)
+        text_writer = csv.writer(text_f)
+        for row in headerRows():
+            number_writer.writerow(row)
+            text_writer.writerow(row)
+
+        for i in range(n):
+            answers = [str(x) for x in responses[i]]
+            labels = [AGREEMENT_LABELS[x - 1] for x in responses[i]]
+            progress = '100'
+            if incomplete[i]:
+                answers[stops[i]:] = [''] * (NUM_QUESTIONS - stops[i])
+                labels[stops[i]:] = [''] * (NUM_QUESTIONS - stops[i])
+                progress = str(40 + stops[i] * 2)
+            finished = '0' if incomplete[i] else '1'
+
+            meta = ['2021-02-10 09:00:00', '2021-02-10 09:10:00', '0',
+                    '', progress, str(durations[i]), finished,
+                    '2021-02-10 09:10:00', f'R_{seed:x}{i:09x}', '', '', '',
+                    '', '', '', 'anonymous', 'EN']
+            # people type their names and emails in all sorts of ways
+            name = names[i] if i % 7 else f' {names[i].lower()} '
+            email = emails[i] if i % 5 else emails[i].upper()
+
+            number_writer.writerow(meta + [
+                name, email, str(years[i] + 1), str(sport_ids[i] + 1),
+                str(majors[i] + 1), '1' if one_on_one[i] else '2',
+                friends[i], '1' if same_grade[i] else '2',
+            ] + answers + ['1' if speed_dating[i] else '2'] +
+                [''] * len(EXTRA_COLUMNS))
+            text_writer.writerow(meta + [
+                name, email, YEAR_LABELS[years[i]], sports[sport_ids[i]],
+                MAJOR_LABELS[majors[i]],
+                'One-on-one' if one_on_one[i] else 'Small group',
+                friends[i], 'Yes' if same_grade[i] else 'No',
+            ] + labels + ['Yes' if speed_dating[i] else 'No'] +
+                [''] * len(EXTRA_COLUMNS))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes made-up exports')
+    parser.add_argument('n', type=int, help='number of respondents')
+    parser.add_argument('out_base', help='written to OUT_BASE_numbers.csv '
+                                         'and OUT_BASE_text.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    writeSurvey(args.n, f'{args.out_base}_numbers.csv',
+                f'{args.out_base}_text.csv', seed=args.seed)
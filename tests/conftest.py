@@ -0,0 +1,57 @@
+"""
+file: conftest.py
+date: 10/17/26
+----------------------
+Shared fixtures. Every test runs in its own temporary folder with its own
+data/sports.json and made-up survey exports (see synthetic.py), so nothing
+needs the real survey data.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cohort import cohortPeople, loadCohort, sportData
+from synthetic import writeSurvey
+
+SPORTS = {
+    'Baseball': {'kind': 'Men'},
+    'Football': {'kind': 'Men'},
+    "Men's Basketball": {'kind': 'Men'},
+    "Men's Soccer": {'kind': 'Men'},
+    'Wrestling': {'kind': 'Men'},
+    'Softball': {'kind': 'Women'},
+    "Women's Basketball": {'kind': 'Women'},
+    "Women's Soccer": {'kind': 'Women'},
+    'Field Hockey': {'kind': 'Women'},
+    'Lacrosse': {'kind': 'Women'},
+    'Sailing': {'kind': 'Co-Ed'},
+    'Fencing': {'kind': 'Co-Ed'},
+    'Squash': {'kind': 'Co-Ed'},
+}
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """ Runs the test in TMP_PATH, with SPORTS as data/sports.json. """
+    os.makedirs(tmp_path / 'data')
+    with open(tmp_path / 'data' / 'sports.json', 'w') as f:
+        json.dump(SPORTS, f)
+    monkeypatch.chdir(tmp_path)
+    sportData.cache_clear()
+    yield tmp_path
+    sportData.cache_clear()
+
+def writeExports(folder, n, seed=0):
+    """ Writes made-up exports of N people to FOLDER and returns them. """
+    numbers = os.path.join(folder, 'numbers.csv')
+    text = os.path.join(folder, 'text.csv')
+    writeSurvey(n, numbers, text, seed=seed)
+    return numbers, text
+
+@pytest.fixture
+def people(workdir):
+    """ The people of a made-up survey of 300, in the order of the exports. """
+    return cohortPeople(loadCohort(*writeExports(workdir, 300)))
@@ -0,0 +1,85 @@
+"""
+file: test_checkpoint.py
+date: 10/17/26
+----------------------
+Reusing checkpoints and throwing them away (see checkpoint.py).
+"""
+import csv
+import glob
+import os
+
+import numpy as np
+
+import checkpoint
+from checkpoint import (contentKey, invalidate, loadCheckpoint,
+                        saveCheckpoint)
+import match
+from conftest import writeExports
+
+def test_keys():
+    assert contentKey('a', 1, None) == contentKey('a', 1, None)
+    assert contentKey(np.arange(3)) != contentKey(np.arange(3.0))
+    assert contentKey(np.zeros((2, 3))) != contentKey(np.zeros((3, 2)))
+    assert contentKey(True, 'a') != contentKey('a', True)
+
+def test_save_load_prune_and_invalidate(workdir, monkeypatch):
+    monkeypatch.setattr(checkpoint, 'MAX_CHECKPOINTS', 2)
+    folder = str(workdir / 'checkpoints')
+    assert loadCheckpoint(folder, 'scores', 'a') is None
+
+    saveCheckpoint(folder, 'scores', 'a', {'scores': np.eye(3)})
+    assert np.array_equal(loadCheckpoint(folder, 'scores', 'a')['scores'],
+                          np.eye(3))
+
+    """ Loading 'a' makes it the most recent, so 'b' is pruned instead. """
+    saveCheckpoint(folder, 'scores', 'b', {'scores': np.ones(2)})
+    for name, written in [('a', 0), ('b', 100)]:
+        os.utime(os.path.join(folder, f'scores-{name}.npz'),
+                 (written, written))
+    loadCheckpoint(folder, 'scores', 'a')
+    saveCheckpoint(folder, 'scores', 'c', {'scores': np.zeros(2)})
+    saveCheckpoint(folder, 'cohort', 'a', {'seed': np.array(3)})
+    assert sorted(os.listdir(folder)) == \
+           ['cohort-a.npz', 'scores-a.npz', 'scores-c.npz']
+
+    invalidate(folder, ['scores'])
+    assert os.listdir(folder) == ['cohort-a.npz']
+    invalidate(folder)
+    assert os.listdir(folder) == []
+
+    with open(os.path.join(folder, 'scores-a.npz'), 'w') as f:
+        f.write('not a checkpoint')
+    assert loadCheckpoint(folder, 'scores', 'a') is None
+
+def test_cohort_checkpoint(workdir, monkeypatch, capsys):
+    numbers, text = writeExports(workdir, 120)
+    monkeypatch.setattr(match, 'NUMBER_FILE', numbers)
+    monkeypatch.setattr(match, 'TEXT_FILE', text)
+    monkeypatch.setattr(match, 'OUT_PATH', 'output/')
+    monkeypatch.setattr(match, 'CHECKPOINTS', True)
+
+    people, seed = match.loadData(seed=4)
+    again, same_seed = match.loadData()
+    assert 'Loaded the cohort from a checkpoint' in capsys.readouterr().out
+    assert same_seed == seed
+    assert [p['qualtrics id'] for p in again] == \
+           [p['qualtrics id'] for p in people]
+    assert match.computeSimilarities(people).tolist() == \
+           match.computeSimilarities(again).tolist()
+    assert len(glob.glob('output/checkpoints/scores-*.npz')) == 1
+    capsys.readouterr()
+
+    """ A new response changes the key, so the exports are parsed again. """
+    for path in [numbers, text]:
+        with open(path, newline='') as f:
+            last = list(csv.reader(f))[-1]
+        last[8] = 'R_late'
+        with open(path, 'a', newline='') as f:
+            csv.writer(f).writerow(last)
+    match.loadData(seed=4)
+    assert 'from a checkpoint' not in capsys.readouterr().out
+    assert len(glob.glob('output/checkpoints/cohort-*.npz')) == 2
+
+    invalidate('output/checkpoints/', ['cohort'])
+    match.loadData(seed=4)
+    assert 'from a checkpoint' not in capsys.readouterr().out
@@ -0,0 +1,70 @@
+"""
+file: test_cohort.py
+date: 10/17/26
+----------------------
+Looking up the people nominated in the friend question (see
+cohort.lookupPerson).
+"""
+import difflib
+
+from cohort import buildPersonIndex, dropPerson, lookupPerson, normalizeName
+
+NAMES = ['Ana Lopez', 'José Álvarez', 'Sam Chen', 'Sam Chen',
+         'Samantha Chen', 'Jordan Whitfield', 'Jordan Whitfeld',
+         'Kai Nakamura']
+
+def person(name, k):
+    email = f"{name.split()[0].lower()}{k}@stanford.edu"
+    return {'meta data': {'name': name, 'email': email}}
+
+def test_exact_and_email_lookups():
+    index = buildPersonIndex([person(name, k) for k, name in
+                              enumerate(NAMES)])
+    assert lookupPerson(index, 'ana lopez') == ([0], False)
+    assert lookupPerson(index, '  Jose  Alvarez ') == ([1], False)
+    assert lookupPerson(index, 'KAI8@stanford.edu ') == ([], False)
+    assert lookupPerson(index, 'KAI7@stanford.edu ') == ([7], False)
+    assert lookupPerson(index, 'nobody@stanford.edu') == ([], False)
+
+    """ Two people with one name are ambiguous, even when typed exactly. """
+    assert lookupPerson(index, 'Sam Chen') == ([2, 3], False)
+
+def test_approximate_lookups():
+    index = buildPersonIndex([person(name, k) for k, name in
+                              enumerate(NAMES)])
+    assert lookupPerson(index, 'Kia Nakamura') == ([7], True)
+    assert lookupPerson(index, 'Kai Nakamuraa') == ([7], True)
+    assert lookupPerson(index, 'Ana Lopes') == ([0], True)
+    assert lookupPerson(index, 'Ana Lopes', cutoff=None) == ([], False)
+    assert lookupPerson(index, 'Zed Quimby') == ([], True)
+
+    """ A typo between two real names finds both, so it is ambiguous. """
+    candidates, approximate = lookupPerson(index, 'Jordan Whitfied')
+    assert sorted(candidates) == [5, 6] and approximate
+
+def test_approximate_lookups_agree_with_a_full_search():
+    """ Single typos find what comparing with every name would. """
+    names = [f'{first} {last}' for first in ['Ana', 'Eli', 'Maya', 'Omar']
+             for last in ['Abbott', 'Baker', 'Castillo', 'Dunn', 'Ellison']]
+    index = buildPersonIndex([person(name, k) for k, name in
+                              enumerate(names)])
+    for name in names:
+        for typo in [name[:3] + name[4] + name[3] + name[5:],
+                     name[:-2] + name[-1], name + 'e', name[:-1] + 'x']:
+            everyone = difflib.get_close_matches(normalizeName(typo),
+                                                 list(index['names']), n=2,
+                                                 cutoff=0.85)
+            expected = [i for match in everyone
+                        for i in index['names'][match]]
+            if normalizeName(typo) not in index['names']:
+                assert lookupPerson(index, typo) == (expected, True)
+
+def test_dropped_people_are_not_found():
+    people = [person(name, k) for k, name in enumerate(NAMES)]
+    index = buildPersonIndex(people)
+    for i in [2, 7]:
+        dropPerson(index, i, NAMES[i], people[i]['meta data']['email'])
+    assert lookupPerson(index, 'Sam Chen') == ([3], False)
+    assert lookupPerson(index, 'kai7@stanford.edu') == ([], False)
+    assert lookupPerson(index, 'Kai Nakamura') == ([], True)
+    assert lookupPerson(index, 'Ana Lopes') == ([0], True)
@@ -0,0 +1,100 @@
+"""
+file: test_friends.py
+date: 10/17/26
+----------------------
+Cutting friend clusters into seeds and completing seeds of three (see
+friends.py and match.pairGroup).
+"""
+from itertools import combinations
+
+import numpy as np
+
+import match
+from cohort import sportData
+from friends import (fillSeeds, friendClusters, friendSeeds, seedPairs,
+                     seedSizes, splitCluster)
+from scoring import INELIGIBLE, cohortArrays, computeSimilarityBlock
+
+def links(*edges, n=10):
+    """ Returns a friend_dict over N people with the nominations EDGES. """
+    friend_dict = {i: [] for i in range(n)}
+    for i, j in edges:
+        friend_dict[i].append(j)
+        friend_dict[j].append(i)
+    return friend_dict
+
+def teammates(group, grades):
+    """ Returns three people of one sport someone is eligible with. """
+    responses, sports, kinds = cohortArrays(group, sportData())
+    for sport in np.unique(sports):
+        for three in combinations(np.flatnonzero(sports == sport)[:6], 3):
+            eligible = computeSimilarityBlock(responses, sports, kinds, three,
+                                              range(len(group)),
+                                              grades=grades) > INELIGIBLE
+            if eligible.all(axis=0).any():
+                return [int(i) for i in three]
+
+def test_clusters_and_seeds():
+    friend_dict = links((0, 1), (1, 2), (5, 4), (7, 8), (8, 9), (9, 6),
+                        (6, 3))
+    assert friendClusters(friend_dict) == [[0, 1, 2], [3, 6, 7, 8, 9],
+                                           [4, 5]]
+    assert [seedSizes(n) for n in [2, 3, 4, 5, 6, 9]] == \
+           [[2], [3], [4], [3, 2], [4, 2], [4, 3, 2]]
+
+    """ Seeds follow the chain of friends from its first member. """
+    assert splitCluster([3, 6, 7, 8, 9], friend_dict) == [[3, 6, 9], [8, 7]]
+    assert friendSeeds(friend_dict) == [[0, 1, 2], [3, 6, 9], [8, 7],
+                                        [4, 5]]
+
+def test_fill_seeds():
+    scores = np.array([[3.0, 1.0, -np.inf],
+                       [2.5, -np.inf, -np.inf],
+                       [2.0, 0.5, 0.1]])
+    """ The best fit is taken first, and nobody fills two seeds. """
+    assert fillSeeds(scores) == [0, -1, 1]
+    assert fillSeeds(scores[[1, 2]]) == [0, 1]
+    assert fillSeeds(np.full((2, 3), -np.inf)) == [-1, -1]
+    assert fillSeeds(np.ones((3, 2))) == [0, 1, -1]
+
+def test_seed_pairs():
+    scores = np.array([[0, .9, .1, .2],
+                       [.9, 0, .3, .1],
+                       [.1, .3, 0, -1],
+                       [.2, .1, -1, 0]])
+    assert seedPairs(scores[:2, :2]) == [(0, 1)]
+    assert seedPairs(scores) == [(0, 3), (1, 2)]
+
+def test_rules_hold_outside_nominations(people, monkeypatch):
+    monkeypatch.setattr(match, 'QUIET', True)
+    group, grades = people, match.personGrades(people)
+    responses, sports, kinds = cohortArrays(group, sportData())
+    team = teammates(group, grades)
+
+    """ A chain of three teammates: the two at its ends never nominated. """
+    first, middle, last = team
+    friend_dict = links((first, middle), (middle, last), n=len(group))
+    matches, friend_matches, everyone, preformed = match.pairGroup(
+        group, friend_dict)
+
+    ids = [person['qualtrics id'] for person in group]
+    in_group = [ids.index(person['qualtrics id']) for person in everyone]
+    seed = in_group[-4:]
+    filler, = set(seed) - set(team)
+    assert (computeSimilarityBlock(responses, sports, kinds, team,
+                                   [filler], grades=grades) > INELIGIBLE).all()
+
+    waived = computeSimilarityBlock(responses, sports, kinds, seed, seed,
+                                    same_kind_ok=True, same_sport_ok=True)
+    ruled = computeSimilarityBlock(responses, sports, kinds, seed, seed,
+                                   grades=grades)
+    scores = np.where([[j in friend_dict[i] for j in seed] for i in seed],
+                      waived, ruled)
+    at = {i: k for k, i in enumerate(seed)}
+    assert ruled[at[first], at[last]] == INELIGIBLE
+    for (i, j), score in friend_matches:
+        a, b = at[in_group[i]], at[in_group[j]]
+        assert score == scores[a, b] > INELIGIBLE
+
+    assert preformed == [[(len(matches), len(matches) + 1),
+                          scores[np.triu_indices(4, 1)].mean()]]
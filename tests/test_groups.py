@@ -0,0 +1,69 @@
+"""
+file: test_groups.py
+date: 10/17/26
+----------------------
+Scoring merges of pairs into groups of four (see groups.py).
+"""
+import numpy as np
+
+from cohort import sportData
+from groups import formGroups, mergeScores
+from scoring import INELIGIBLE, cohortArrays, computeSimilarityMatrix
+
+def sameSportPairs(sports, count):
+    """ Returns COUNT disjoint pairs of people who play the same sport. """
+    pairs, used = [], set()
+    for i in range(len(sports)):
+        for j in range(i + 1, len(sports)):
+            if sports[i] == sports[j] and not used & {i, j}:
+                pairs.append((i, j))
+                used.update((i, j))
+                if len(pairs) == count:
+                    return pairs
+    return pairs
+
+def test_merges_use_the_pairs_own_scores(people):
+    arrays = cohortArrays(people, sportData())
+    friends = sameSportPairs(arrays[1], 2)
+    full = computeSimilarityMatrix(*arrays)
+    waived = computeSimilarityMatrix(*arrays, same_kind_ok=True,
+                                     same_sport_ok=True)
+
+    """ Scored again, teammates break the rules; as matched, they don't. """
+    (a, b), (c, d) = friends
+    scored = mergeScores(friends, *arrays)
+    as_matched = mergeScores(friends, *arrays,
+                             within=[waived[a, b], waived[c, d]])
+    assert full[a, b] == INELIGIBLE
+    across = full[a, c] + full[a, d] + full[b, c] + full[b, d]
+    assert np.isclose(scored[0, 1], (2 * INELIGIBLE + across) / 6)
+    assert np.isclose(as_matched[0, 1],
+                      (waived[a, b] + waived[c, d] + across) / 6)
+
+    """ A seed of four friends keeps the score it was given. """
+    groups, leftover = formGroups(friends, *arrays,
+                                  preformed=[[(0, 1), 0.25]])
+    assert groups == [[(a, b, c, d), 0.25]] and leftover == []
+
+def test_sparse_merges_match_the_dense_ones(people):
+    arrays = cohortArrays(people, sportData())
+    pairs = [(i, i + 1) for i in range(0, 120, 2)]
+    dense, dense_left = formGroups(pairs, *arrays, preformed=[[(0, 1), .5]])
+
+    """ With K covering every pair, the top-K merges are the dense ones. """
+    sparse, sparse_left = formGroups(pairs, *arrays,
+                                     preformed=[[(0, 1), .5]],
+                                     top_k=len(pairs))
+    assert [ids for ids, _ in sparse] == [ids for ids, _ in dense]
+    assert np.allclose([score for _, score in sparse],
+                       [score for _, score in dense])
+    assert sparse_left == dense_left
+
+    """ With a small K, every group is still one the dense scores allow. """
+    scores = mergeScores(pairs, *arrays)
+    position = {pair: a for a, pair in enumerate(pairs)}
+    sparse, sparse_left = formGroups(pairs, *arrays, top_k=2)
+    for (i, j, k, l), score in sparse:
+        a, b = position[i, j], position[k, l]
+        assert np.isclose(score, scores[a, b]) and score > INELIGIBLE
+    assert len(sparse) >= len(dense) - 2
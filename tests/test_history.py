@@ -0,0 +1,143 @@
+"""
+file: test_history.py
+date: 10/17/26
+----------------------
+Reading past rounds and keeping their pairs apart (see history.py).
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+from cohort import sportData
+from groups import formGroups
+from history import (LOWEST_SCORE, loadHistory, pairKey, pastBlock,
+                     pastPairs, pastRounds, penalizeEdges, penalizeScores,
+                     roundDate)
+from matching import candidateEdges, greedyMatch
+from scoring import INELIGIBLE, cohortArrays, computeSimilarityMatrix
+
+def writeRound(folder, name, groups, emails):
+    """ Writes GROUPS (tuples of indices into EMAILS) like match.py does. """
+    os.makedirs(folder, exist_ok=True)
+    size = max(len(ids) for ids in groups)
+    with open(os.path.join(folder, name), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f'p{n} {field}' for n in range(1, size + 1)
+                         for field in ['id', 'email']] + ['score'])
+        for ids in groups:
+            writer.writerow([value for i in ids for value in (i, emails[i])] +
+                            ['50%'])
+
+def test_groups_are_history(people, workdir):
+    arrays = cohortArrays(people, sportData())
+    emails = [person['meta data']['email'] for person in people]
+    pairs = [ids for ids, _ in greedyMatch(
+        computeSimilarityMatrix(*arrays, upper_only=True))[0]]
+    groups, _ = formGroups(pairs, *arrays)
+
+    writeRound(workdir / 'output' / '03-01', 'groups.csv',
+               [ids for ids, _ in groups], emails)
+    history = loadHistory([str(workdir / 'output' / '03-01')])
+    assert len(history) == 6 * len(groups)
+    a, b, c, d = groups[0][0]
+    assert history[pairKey(emails[a].upper(), emails[d])] == 1
+
+    """ Next round, the same pairs can't be grouped with the same pairs. """
+    past = pastPairs(history, emails)
+    again, _ = formGroups(pairs, *arrays, past=past)
+    assert len(again) > 0
+    for (a, b, c, d), _ in again:
+        assert not pastBlock(past, [a, b], [c, d]).any()
+
+    """ With a penalty, they only can if nothing better is left. """
+    penalized, _ = formGroups(pairs, *arrays,
+                              past=pastPairs(history, emails, penalty=10))
+    assert len(penalized) == len(groups)
+    assert sorted(score for _, score in penalized) != \
+           sorted(score for _, score in groups)
+
+def test_past_block(people):
+    emails = [person['meta data']['email'] for person in people]
+    history = {pairKey(emails[3], emails[8]): 1,
+               pairKey(emails[8], emails[20]): 2}
+    past = pastPairs(history, emails, penalty=0.25, decay=0.5)
+
+    block = pastBlock(past, [8, 1], [20, 3, 5])
+    assert np.array_equal(block, [[0.125, 0.25, 0], [0, 0, 0]])
+    assert np.array_equal(pastBlock(past, [3, 20], [8]), [[0.25], [0.125]])
+
+def test_rounds_are_ordered_by_date(workdir):
+    """ MM-DD names sort wrongly across a new year; the dates don't. """
+    dates = {'12-01': '2021-12-01 10:00:00', '01-15': '2022-01-15 10:00:00',
+             '03-01': '2022-03-01 10:00:00'}
+    for name, date in dates.items():
+        os.makedirs(workdir / 'output' / name)
+        with open(workdir / 'output' / name / 'groups.summary.json', 'w') as f:
+            json.dump({'matches': 1, 'round date': date}, f)
+
+    names = lambda folders: [os.path.basename(os.path.dirname(folder))
+                             for folder in folders]
+    assert names(pastRounds('output/*/')) == ['12-01', '01-15', '03-01']
+    earlier = pastRounds('output/*/', 'output/03-01/',
+                         before='2022-02-01 00:00:00')
+    assert names(earlier) == ['12-01', '01-15']
+
+    """ A round without a date in its summaries is dated by its files. """
+    writeRound(workdir / 'output' / 'old', 'matches_1-on-1.csv', [(0, 1)],
+               ['a@x.edu', 'b@x.edu'])
+    os.utime(workdir / 'output' / 'old' / 'matches_1-on-1.csv', (0, 0))
+    assert roundDate(str(workdir / 'output' / 'old')) < dates['12-01']
+    assert names(pastRounds('output/*/'))[0] == 'old'
+
+def test_past_pairs(people):
+    emails = [person['meta data']['email'] for person in people]
+    emails[40] = emails[12]
+    history = {pairKey(emails[9], ' ' + emails[2].upper()): 1,
+               pairKey(emails[30], emails[5]): 3,
+               pairKey(emails[12], emails[12]): 1,
+               pairKey(emails[7], 'gone@stanford.edu'): 1}
+
+    pairs, amounts = pastPairs(history, emails, penalty=0.4, decay=0.5)
+    assert sorted(zip(map(tuple, pairs.tolist()), amounts.tolist())) == \
+           [((2, 9), 0.4), ((5, 30), 0.1)]
+
+    pairs, amounts = pastPairs(history, emails)
+    assert len(pairs) == 2 and np.isinf(amounts).all()
+    assert len(pastPairs({}, emails)[0]) == 0
+
+def test_penalize_scores_and_edges(people):
+    arrays = cohortArrays(people[:60], sportData())
+    emails = [person['meta data']['email'] for person in people[:60]]
+    scores = computeSimilarityMatrix(*arrays)
+    eligible = np.argwhere(np.triu(scores > INELIGIBLE, 1))
+    ineligible = np.argwhere(np.triu(scores == INELIGIBLE, 1))[0]
+    history = {pairKey(emails[i], emails[j]): k % 3 + 1
+               for k, (i, j) in enumerate(eligible[:20].tolist() +
+                                          [ineligible.tolist()])}
+
+    for penalty in [None, 0.3, 5.0]:
+        past = pastPairs(history, emails, penalty=penalty, decay=0.5)
+        penalized = scores.copy()
+        penalizeScores(penalized, past)
+        assert np.array_equal(penalized, penalized.T)
+        changed = np.argwhere(np.triu(penalized != scores, 1)).tolist()
+        assert sorted(changed) == sorted(eligible[:20].tolist())
+        if penalty is None:
+            assert (penalized[tuple(eligible[:20].T)] == INELIGIBLE).all()
+        else:
+            assert (penalized > INELIGIBLE).sum() == \
+                   (scores > INELIGIBLE).sum()
+            assert penalized.min(initial=0, where=penalized > INELIGIBLE) \
+                   >= LOWEST_SCORE
+
+        """ Edges of a subset of people get exactly the same scores. """
+        ids = np.arange(5, 60)
+        rows, cols = np.nonzero(np.triu(scores[np.ix_(ids, ids)] >
+                                        INELIGIBLE, 1))
+        kept = penalizeEdges(rows, cols, scores[ids[rows], ids[cols]], past,
+                             ids)
+        expected = candidateEdges(penalized[np.ix_(ids, ids)])
+        for got, want in zip(kept, expected):
+            assert np.array_equal(got, want)
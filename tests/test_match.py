@@ -0,0 +1,121 @@
+"""
+file: test_match.py
+date: 10/17/26
+----------------------
+Whole runs of match.py on made-up exports, and updating them with late
+responses (see match.updateMatches).
+"""
+import csv
+import json
+
+import pytest
+
+import match
+from cohort import HEADER_ROWS
+from conftest import writeExports
+
+FILES = ['matches_1-on-1', 'matches_group', 'groups']
+
+def readTable(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+@pytest.fixture
+def exports(workdir, monkeypatch):
+    """
+    Made-up exports of 300 people, and a copy holding only the first 250
+    responses, as if the rest came in late.
+    """
+    numbers, text = writeExports(workdir, 300)
+    early = []
+    for path in [numbers, text]:
+        with open(path, newline='') as f:
+            rows = list(csv.reader(f))
+        early.append(path.replace('.csv', '_early.csv'))
+        with open(early[-1], 'w', newline='') as f:
+            csv.writer(f).writerows(rows[:HEADER_ROWS + 250])
+
+    monkeypatch.setattr(match, 'OUT_PATH', 'output/03-01/')
+    monkeypatch.setattr(match, 'QUIET', True)
+    monkeypatch.setattr(match, 'HISTORY_GLOB', None)
+    return early, (numbers, text)
+
+def run(monkeypatch, files, **kwargs):
+    monkeypatch.setattr(match, 'NUMBER_FILE', files[0])
+    monkeypatch.setattr(match, 'TEXT_FILE', files[1])
+    match.main(analyze=False, **kwargs)
+    return {name: readTable(f'{match.OUT_PATH}{name}.csv') for name in FILES}
+
+def test_update_keeps_earlier_matches(exports, monkeypatch):
+    early, full = exports
+    before = run(monkeypatch, early, seed=3)
+    after = run(monkeypatch, full, update=True)
+
+    with open(f'{match.OUT_PATH}{match.STATE_FILE}') as f:
+        state = json.load(f)
+    assert state['round'] == 1 and state['seed'] == 3
+
+    for name in FILES:
+        """
+        Every earlier row comes back first and unchanged, ids and shared
+        question included; only the late people's rows are new.
+        """
+        old, new = before[name], after[name]
+        assert len(new) > len(old)
+        for old_row, new_row in zip(old, new):
+            assert new_row.pop('round') == '0'
+            assert new_row == old_row
+        assert {row['round'] for row in new[len(old):]} == {'1'}
+
+    """ Nobody is matched twice. """
+    emails = [row[f'p{n} email'] for row in after['matches_1-on-1'] +
+              after['matches_group'] for n in [1, 2]]
+    assert len(emails) == len(set(emails))
+
+def test_update_without_late_people_changes_nothing(exports, monkeypatch):
+    _, full = exports
+    before = run(monkeypatch, full, seed=3)
+    after = run(monkeypatch, full, update=True)
+    for name in FILES:
+        assert [{**row, 'round': '0'} for row in before[name]] == after[name]
+
+def test_seed_repeats_a_run(exports, monkeypatch):
+    _, full = exports
+    assert run(monkeypatch, full, seed=8) == run(monkeypatch, full, seed=8)
+
+def test_given_scores_repeat_a_run(exports, monkeypatch):
+    _, full = exports
+    before = run(monkeypatch, full, seed=5)
+    people, _ = match.loadData(shuffle=False)
+    pools = [([person['qualtrics id'] for person in pool],
+              match.computeSimilarities(pool))
+             for pool in match.separatePairsAndGroups(people)]
+    assert run(monkeypatch, full, seed=5, pool_scores=pools) == before
+
+    """ People missing from the scores are left out. """
+    (ids, scores), group = pools
+    gone, = [person['meta data']['email'] for person in people
+             if person['qualtrics id'] == ids[0]]
+    assert gone in [row[f'p{n} email'] for row in before['matches_1-on-1']
+                    for n in [1, 2]]
+    after = run(monkeypatch, full, seed=5,
+                pool_scores=[(ids[1:], scores[1:, 1:]), group])
+    assert gone not in [row[f'p{n} email'] for row in after['matches_1-on-1']
+                        for n in [1, 2]]
+
+def test_restarts_repeat_and_rerun_with_the_best_seed(exports, monkeypatch):
+    _, full = exports
+    monkeypatch.setattr(match, 'RESTART_WORKERS', 2)
+    first = run(monkeypatch, full, seed=4, restarts=3)
+    with open(f'{match.OUT_PATH}{match.RESTARTS_FILE}') as f:
+        restarts = json.load(f)
+    assert sorted(restarts['community scores']) == ['4', '5', '6']
+
+    """ The same seeds give the same scores and matches, in any process. """
+    monkeypatch.setattr(match, 'RESTART_WORKERS', 1)
+    assert run(monkeypatch, full, seed=4, restarts=3) == first
+    with open(f'{match.OUT_PATH}{match.RESTARTS_FILE}') as f:
+        assert json.load(f) == restarts
+
+    """ Passing the best seed alone writes the same matches. """
+    assert run(monkeypatch, full, seed=restarts['best seed']) == first
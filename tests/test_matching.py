@@ -0,0 +1,109 @@
+"""
+file: test_matching.py
+date: 10/17/26
+----------------------
+The matching engines against plain greedy matching on the dense matrix.
+"""
+import numpy as np
+import pytest
+
+from cohort import sportData
+from constraints import gradeArrays
+from history import pairKey, pastPairs, penalizeScores
+from matching import (cohortShards, greedyMatch, greedyMatchEdges,
+                      greedyMatchRuns, shardMatch, storeEdges)
+from scoring import INELIGIBLE, cohortArrays, computeSimilarityMatrix
+
+@pytest.fixture
+def arrays(people):
+    return cohortArrays(people, sportData())
+
+def argmaxMatch(scores):
+    """
+    The original greedy loop: take the argmax of the whole matrix, then rule
+    out both people's rows and columns. It stops when nothing eligible is
+    left instead of failing.
+    """
+    scores = scores.copy()
+    matches = []
+    while True:
+        i, j = np.unravel_index(np.argmax(scores, axis=None), scores.shape)
+        if scores[i, j] <= INELIGIBLE:
+            return matches
+        matches.append([(int(i), int(j)), float(scores[i, j])])
+        scores[[i, j], :] = INELIGIBLE
+        scores[:, [i, j]] = INELIGIBLE
+
+@pytest.mark.parametrize('seed', range(5))
+def test_greedy_breaks_ties_like_the_argmax_loop(seed):
+    """ Few distinct scores, so most of the matches are picked from ties. """
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(-1, 3, size=(15, 15)).astype(np.float64)
+    scores = np.maximum(scores, scores.T)
+    np.fill_diagonal(scores, INELIGIBLE)
+
+    upper = scores.copy()
+    upper[np.tril_indices(len(scores))] = INELIGIBLE
+
+    expected = argmaxMatch(scores)
+    assert greedyMatch(scores)[0] == expected
+    assert greedyMatch(upper)[0] == expected
+
+    """ Edges given in any order come out the same. """
+    rows, cols = np.nonzero(np.triu(scores > INELIGIBLE, 1))
+    order = rng.permutation(len(rows))
+    rows, cols = rows[order], cols[order]
+    assert greedyMatchEdges(15, rows, cols, scores[rows, cols])[0] == \
+           expected
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_store_matches_like_dense_greedy(arrays, workdir, workers):
+    dense = greedyMatch(computeSimilarityMatrix(*arrays, upper_only=True))
+    runs = storeEdges(*arrays, str(workdir / 'runs'), workers=workers,
+                      tile_size=64, dtype=np.float64)
+    assert len(runs) == sum(range(1, -(-len(arrays[0]) // 64) + 1))
+    assert greedyMatchRuns(len(arrays[0]), runs, chunk=7) == dense
+
+@pytest.mark.parametrize('penalty', [None, 0.5])
+def test_store_applies_grades_and_history(people, arrays, workdir, penalty):
+    """ The first matching, made a round or two ago, is avoided. """
+    grades = gradeArrays(people)
+    emails = [person['meta data']['email'] for person in people]
+    scores = computeSimilarityMatrix(*arrays, upper_only=True, grades=grades)
+    first, _ = greedyMatch(scores)
+    history = {pairKey(emails[i], emails[j]): k % 2 + 1
+               for k, ((i, j), _) in enumerate(first)}
+
+    past = pastPairs(history, emails, penalty=penalty, decay=0.5)
+    penalizeScores(scores, past)
+    runs = storeEdges(*arrays, str(workdir / 'runs'), workers=1,
+                      tile_size=50, dtype=np.float64, grades=grades,
+                      past=past)
+    assert greedyMatchRuns(len(people), runs) == greedyMatch(scores)
+
+def test_one_shard_matches_like_dense_greedy(arrays):
+    dense = greedyMatch(computeSimilarityMatrix(*arrays, upper_only=True))
+    assert shardMatch(*arrays, None, workers=1) == dense
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_shards_match_like_dense_greedy_per_shard(people, arrays, workers):
+    """ Each shard, then the leftovers, is matched greedily on its own. """
+    grades = gradeArrays(people)
+    dense = computeSimilarityMatrix(*arrays, upper_only=True, grades=grades)
+    shards = cohortShards(arrays[2], grades, 40)
+    assert len(shards) > 4
+
+    expected, leftovers = [], []
+    for ids in shards:
+        found, unmatched = greedyMatch(dense[np.ix_(ids, ids)])
+        expected += [[(ids[i], ids[j]), score] for (i, j), score in found]
+        leftovers += ids[unmatched].tolist()
+    leftovers = np.array(sorted(leftovers))
+    found, unmatched = greedyMatch(dense[np.ix_(leftovers, leftovers)])
+    expected += [[(leftovers[i], leftovers[j]), score]
+                 for (i, j), score in found]
+
+    matches, left = shardMatch(*arrays, 40, grades=grades, workers=workers)
+    assert matches == expected
+    assert left == leftovers[unmatched].tolist()
+    assert all(dense[i, j] > INELIGIBLE for (i, j), _ in matches)
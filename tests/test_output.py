@@ -0,0 +1,92 @@
+"""
+file: test_output.py
+date: 10/17/26
+----------------------
+Picking the shared question of each match and writing match tables (see
+output.py).
+"""
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from output import sharedResponses, writeTable
+
+RESPONSES = np.array([[1, 2, 3, 4],
+                      [1, 5, 3, 2],
+                      [2, 2, 3, 4],
+                      [5, 5, 5, 5]], dtype=np.uint8)
+
+def test_shared_responses():
+    """ 0 and 1 agree on questions 0 and 2; 0 and 3 on nothing. """
+    questions, answers = sharedResponses(RESPONSES, [[0, 1], [0, 3]], rng=0)
+    assert questions[0] in (0, 2) and answers[0] == RESPONSES[0, questions[0]]
+    assert (questions[1], answers[1]) == (-1, -1)
+
+    """ Padded groups only need their real members to agree. """
+    questions, answers = sharedResponses(RESPONSES, [[0, 1, 2, -1],
+                                                     [2, 0, -1, -1]])
+    assert (questions[0], answers[0]) == (2, 3)
+    assert questions[1] in (1, 2, 3)
+    assert answers[1] == RESPONSES[2, questions[1]]
+
+def test_shared_question_is_a_uniform_choice():
+    picks = [int(sharedResponses(RESPONSES, [[0, 1]], rng=seed)[0][0])
+             for seed in range(200)]
+    assert set(picks) == {0, 2} and 60 < picks.count(0) < 140
+
+    """ The same seed picks the same questions. """
+    members = [[0, 1], [0, 2], [1, 2], [2, 3]]
+    first = sharedResponses(RESPONSES, members, rng=5)
+    again = sharedResponses(RESPONSES, members, rng=5)
+    assert all(np.array_equal(a, b) for a, b in zip(first, again))
+
+def test_no_matches():
+    questions, answers = sharedResponses(RESPONSES, np.zeros((0, 2)))
+    assert len(questions) == len(answers) == 0
+
+TABLE = {
+    'p1 name': ['Ana López', 'Sam "Sammy" Chen', 'Kai, Jr.'],
+    'score': [0.8123456, 0.5, 0.25],
+    'question': [3, None, 0],
+    'note': ['', None, 'line\nbreak'],
+}
+
+def test_table_round_trips(workdir):
+    base = str(workdir / 'matches')
+    paths = writeTable(TABLE, base, formats=('csv', 'jsonl', 'npz'),
+                       summary={'seed': 3, 'community score': 0.5},
+                       csv_formats={'score': '{:.2%}'})
+    assert paths == [f'{base}.{ext}' for ext in
+                     ['csv', 'jsonl', 'npz', 'summary.json']]
+
+    with open(f'{base}.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['p1 name'] for row in rows] == TABLE['p1 name']
+    assert [row['score'] for row in rows] == ['81.23%', '50.00%', '25.00%']
+    assert [row['question'] for row in rows] == ['3', '', '0']
+    assert [row['note'] for row in rows] == ['', '', 'line\nbreak']
+
+    with open(f'{base}.jsonl') as f:
+        rows = [json.loads(line) for line in f]
+    assert {column: [row[column] for row in rows] for column in TABLE} == \
+           TABLE
+
+    with np.load(f'{base}.npz') as saved:
+        assert sorted(saved.files) == sorted(TABLE)
+        assert saved['p1 name'].tolist() == TABLE['p1 name']
+        assert saved['score'].tolist() == TABLE['score']
+        assert saved['question'].tolist() == [3, -1, 0]
+        assert saved['note'].tolist() == ['', '', 'line\nbreak']
+
+    with open(f'{base}.summary.json') as f:
+        assert json.load(f) == {'seed': 3, 'community score': 0.5}
+
+def test_table_formats(workdir):
+    base = str(workdir / 'matches')
+    assert writeTable({'a': []}, base) == [f'{base}.csv']
+    with open(f'{base}.csv', newline='') as f:
+        assert list(csv.reader(f)) == [['a']]
+    with pytest.raises(ValueError):
+        writeTable(TABLE, base, formats=('xlsx',))
@@ -0,0 +1,53 @@
+"""
+file: test_plot.py
+date: 10/17/26
+----------------------
+Averaging score matrices down to heat map cells (see plot.heatMapCells).
+"""
+import numpy as np
+import pytest
+
+from plot import heatMapCells
+from scoring import INELIGIBLE
+
+def naiveCells(scores, order, b):
+    """ Adds every eligible pair to both of its b x b cells, one at a time. """
+    n = len(scores)
+    m = -(-n // b)
+    position = np.argsort(order)
+    totals, counts = np.zeros((m, m)), np.zeros((m, m))
+    for i in range(n):
+        for j in range(n):
+            if scores[i, j] == INELIGIBLE:
+                continue
+            row, col = position[i] // b, position[j] // b
+            for cell in [(row, col), (col, row)]:
+                totals[cell] += scores[i, j]
+                counts[cell] += 1
+    with np.errstate(invalid='ignore'):
+        return totals / counts
+
+@pytest.mark.parametrize('n, size', [(23, 5), (23, 23), (40, 7), (9, 4)])
+@pytest.mark.parametrize('upper_only', [False, True])
+def test_cells_match_the_naive_loop(n, size, upper_only):
+    rng = np.random.default_rng(n * size)
+    scores = rng.uniform(-1, 1, (n, n)).round(2)
+    scores = np.maximum(scores, scores.T)
+    scores[rng.random((n, n)) < 0.3] = INELIGIBLE
+    if upper_only:
+        scores[np.tril_indices(n)] = INELIGIBLE
+    order = rng.permutation(n)
+
+    for given in [None, order]:
+        cells, b = heatMapCells(scores, order=given, size=size)
+        assert b == -(-n // size) and len(cells) == -(-n // b)
+        expected = naiveCells(scores, np.arange(n) if given is None
+                              else given, b)
+        np.testing.assert_allclose(cells, expected, equal_nan=True)
+
+def test_blocks_without_eligible_pairs_are_blank():
+    scores = np.full((6, 6), INELIGIBLE)
+    scores[0, 1] = scores[1, 0] = 0.5
+    cells, b = heatMapCells(scores, size=3)
+    assert b == 2
+    assert cells[0, 0] == 0.5 and np.isnan(cells[1:]).all()
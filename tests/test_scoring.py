@@ -0,0 +1,105 @@
+"""
+file: test_scoring.py
+date: 10/17/26
+----------------------
+The batched scorers against np.corrcoef and, where the module can be
+imported, against the per-pair similarity.computeSimilarity they replace.
+"""
+import numpy as np
+import pytest
+
+from cohort import sportData
+from scoring import (INELIGIBLE, candidateIndex, cohortArrays,
+                     computeSimilarityBlock, computeSimilarityMatrix)
+
+@pytest.fixture
+def computeSimilarity():
+    """ The per-pair scorer match.py used to import, if it is installed. """
+    return pytest.importorskip('similarity').computeSimilarity
+
+def referenceMatrix(computeSimilarity, people, same_kind_ok=False,
+                    same_sport_ok=False):
+    return np.array([[computeSimilarity(p1, p2, same_kind_ok=same_kind_ok,
+                                        same_sport_ok=same_sport_ok)
+                      for p2 in people] for p1 in people])
+
+@pytest.fixture
+def cohort(people):
+    """ The first 120 people, one of whom gave the same answer everywhere. """
+    people = people[:120]
+    people[7] = {**people[7], 'responses': [3] * 29}
+    return people, cohortArrays(people, sportData())
+
+@pytest.mark.parametrize('same_kind_ok, same_sport_ok',
+                         [(False, False), (True, False), (True, True)])
+def test_matrix_is_pearson_of_eligible_pairs(cohort, same_kind_ok,
+                                             same_sport_ok):
+    people, (responses, sports, kinds) = cohort
+    scores = computeSimilarityMatrix(responses, sports, kinds,
+                                     same_kind_ok=same_kind_ok,
+                                     same_sport_ok=same_sport_ok)
+
+    ruled_out = np.zeros(scores.shape, dtype=bool)
+    if not same_sport_ok:
+        ruled_out |= sports[:, None] == sports[None, :]
+    if not same_kind_ok:
+        ruled_out |= kinds[:, None] == kinds[None, :]
+    assert ruled_out.any() != same_sport_ok
+    assert (scores[ruled_out] == INELIGIBLE).all()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pearson = np.nan_to_num(np.corrcoef(responses.astype(np.float64)))
+    assert np.allclose(scores[~ruled_out], pearson[~ruled_out], rtol=0,
+                       atol=1e-12)
+    assert (scores[7][~ruled_out[7]] == 0).all()
+
+@pytest.mark.parametrize('same_kind_ok, same_sport_ok',
+                         [(False, False), (True, False), (True, True)])
+def test_matrix_matches_per_pair_scores(computeSimilarity, cohort,
+                                        same_kind_ok, same_sport_ok):
+    people, arrays = cohort
+    expected = referenceMatrix(computeSimilarity, people, same_kind_ok,
+                               same_sport_ok)
+    scores = computeSimilarityMatrix(*arrays, same_kind_ok=same_kind_ok,
+                                     same_sport_ok=same_sport_ok)
+    assert np.allclose(scores, expected, rtol=0, atol=1e-12)
+
+def test_rules_cover_same_kind_and_same_sport(cohort):
+    """ The cohort has pairs that only one of the rules rules out. """
+    people, (_, sports, kinds) = cohort
+    same_sport = sports[:, None] == sports[None, :]
+    same_kind = kinds[:, None] == kinds[None, :]
+    assert (same_kind & ~same_sport).any() and same_sport.sum() > len(people)
+
+    scores = computeSimilarityMatrix(*cohort[1], same_kind_ok=True)
+    assert (scores[same_sport] == INELIGIBLE).all()
+    assert (scores[same_kind & ~same_sport] > INELIGIBLE).all()
+
+def test_block_is_part_of_the_matrix(cohort):
+    _, arrays = cohort
+    rows, cols = [5, 7, 30, 2], [7, 100, 2, 64, 5]
+    expected = computeSimilarityMatrix(*arrays, same_kind_ok=True,
+                                       same_sport_ok=True)[np.ix_(rows, cols)]
+    block = computeSimilarityBlock(*arrays, rows, cols, same_kind_ok=True,
+                                   same_sport_ok=True)
+    assert np.array_equal(block, expected)
+
+def test_upper_only_is_the_upper_triangle(cohort):
+    _, arrays = cohort
+    full = computeSimilarityMatrix(*arrays)
+    upper = computeSimilarityMatrix(*arrays, upper_only=True)
+    above = np.triu_indices(len(full), 1)
+    assert np.array_equal(upper[above], full[above])
+    assert (upper[np.tril_indices(len(full))] == INELIGIBLE).all()
+
+def test_candidate_index_is_each_row_best(cohort):
+    _, arrays = cohort
+    scores = computeSimilarityMatrix(*arrays)
+    np.fill_diagonal(scores, INELIGIBLE)
+    partners, partner_scores = candidateIndex(*arrays, 5)
+
+    assert np.array_equal(partner_scores, -np.sort(-scores, axis=1)[:, :5])
+    listed = partners >= 0
+    rows = np.repeat(np.arange(len(scores)), 5).reshape(-1, 5)
+    assert np.array_equal(scores[rows[listed], partners[listed]],
+                          partner_scores[listed])
@@ -0,0 +1,176 @@
+"""
+file: test_service.py
+date: 10/17/26
+----------------------
+The service's endpoints, served on a free port from a folder of made-up
+events (see synthetic.py).
+"""
+import asyncio
+import csv
+import json
+import os
+import socket
+import urllib.error
+import urllib.request
+
+import service
+from synthetic import writeSurvey
+
+def freePort():
+    with socket.socket() as s:
+        s.bind((service.HOST, 0))
+        return s.getsockname()[1]
+
+def request(port, method, path, body=None):
+    """ Returns (status, JSON payload) of one request to the service. """
+    data = None if body is None else json.dumps(body).encode()
+    url = f'http://{service.HOST}:{port}{path}'
+    try:
+        with urllib.request.urlopen(urllib.request.Request(
+                url, data=data, method=method)) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+def serveWhile(event_dir, client):
+    """ Serves EVENT_DIR while CLIENT(port) runs, and returns its result. """
+    port = freePort()
+
+    async def run():
+        server = asyncio.ensure_future(service.serve(
+            event_dir, port=port, workers=1, verbose=False))
+        for _ in range(100):
+            try:
+                await asyncio.to_thread(request, port, 'GET', '/events')
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        try:
+            return await asyncio.to_thread(client, port)
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+    return asyncio.run(run())
+
+def lateRows(path, n):
+    """ Returns N rows of the export at PATH renamed as new responses. """
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))[-n:]
+    for k, row in enumerate(rows):
+        row[8] = f'R_late{k}'
+    return rows
+
+def test_endpoints(workdir):
+    for event in ['spring', 'fall']:
+        os.makedirs(workdir / 'events' / event)
+        writeSurvey(150, str(workdir / 'events' / event / 'numbers.csv'),
+                    str(workdir / 'events' / event / 'text.csv'),
+                    seed=len(event))
+    folder = workdir / 'events' / 'fall'
+    late = {name: lateRows(str(folder / f'{name}.csv'), 3)
+            for name in ['numbers', 'text']}
+
+    def client(port):
+        status, events = request(port, 'GET', '/events')
+        assert status == 200
+        assert sorted(events['events']) == ['fall', 'spring']
+        assert sorted(events['dates'][name] for name in events['events']) \
+               == [events['dates'][name] for name in events['events']]
+        assert events['in memory'] == []
+
+        status, event = request(port, 'GET', '/events/fall')
+        assert status == 200
+        size = event['1-on-1'] + event['group']
+        assert 100 < size < 150
+
+        with open(folder / 'numbers.csv', newline='') as f:
+            first = list(csv.reader(f))[service.HEADER_ROWS]
+        status, found = request(
+            port, 'GET', f'/events/fall/people/{first[8]}/candidates?k=4')
+        assert status == 200
+        assert found['person']['qualtrics id'] == first[8]
+        scores = [candidate['score'] for candidate in found['candidates']]
+        assert 0 < len(scores) <= 4 and scores == sorted(scores, reverse=True)
+
+        status, result = request(port, 'POST', '/events/fall/match',
+                                 {'seed': 2})
+        assert status == 200 and result['round'] == 0
+        assert sorted(result['summaries']) == sorted(service.SUMMARIES)
+        assert result['summaries']['groups']['seed'] == 2
+
+        """ Late responses drop the event from memory and are matched. """
+        for body in [{'numbers': late['numbers'][0],
+                      'text': late['text'][0]},
+                     {'numbers': 'rows', 'text': 'rows'},
+                     {'numbers': late['numbers'], 'text': late['text'][:2]},
+                     {'numbers': [row[:5] for row in late['numbers']],
+                      'text': late['text']}]:
+            assert request(port, 'POST', '/events/fall/responses',
+                           body)[0] == 400
+        status, added = request(port, 'POST', '/events/fall/responses', late)
+        assert status == 200 and added['added'] == 3
+        assert 'fall' not in request(port, 'GET', '/events')[1]['in memory']
+
+        status, result = request(port, 'POST', '/events/fall/match',
+                                 {'update': True})
+        assert status == 200 and result['round'] == 1
+        status, event = request(port, 'GET', '/events/fall')
+        assert event['1-on-1'] + event['group'] > size
+
+        assert request(port, 'GET', '/events/winter')[0] == 404
+        assert request(port, 'GET', '/events/fall/people/nobody/'
+                                    'candidates')[0] == 404
+        assert request(port, 'GET', '/events/fall/people/x/candidates?k=a'
+                       )[0] == 400
+        assert request(port, 'POST', '/events/fall/match',
+                       {'seed': 'a'})[0] == 400
+        assert request(port, 'DELETE', '/events/fall')[0] == 405
+
+    serveWhile(str(workdir / 'events'), client)
+
+def test_lookup_after_removal(workdir):
+    folder = workdir / 'events' / 'fall'
+    os.makedirs(folder)
+    writeSurvey(120, str(folder / 'numbers.csv'), str(folder / 'text.csv'),
+                seed=1)
+    with open(folder / 'numbers.csv', newline='') as f:
+        first = list(csv.reader(f))[service.HEADER_ROWS][8]
+    late = {name: lateRows(str(folder / f'{name}.csv'), 2)
+            for name in ['numbers', 'text']}
+
+    def client(port):
+        path = '/events/fall/people/{}/candidates?k=200'
+        status, found = request(port, 'GET', path.format(first))
+        assert status == 200
+        gone = found['candidates'][0]
+
+        status, removed = request(port, 'DELETE',
+                                  f"/events/fall/people/{gone['email']}")
+        assert status == 200
+        assert removed['removed']['qualtrics id'] == gone['qualtrics id']
+        for who in [gone['qualtrics id'], gone['email']]:
+            assert request(port, 'GET', path.format(who))[0] == 404
+            assert request(port, 'DELETE', f'/events/fall/people/{who}'
+                           )[0] == 404
+        emails = [candidate['email'] for candidate in
+                  request(port, 'GET', path.format(first))[1]['candidates']]
+        assert gone['email'] not in emails and len(emails) > 0
+
+        """ Runs leave them out, and so do reloads after new responses. """
+        assert request(port, 'POST', '/events/fall/match', {'seed': 1}
+                       )[0] == 200
+        assert request(port, 'POST', '/events/fall/responses', late
+                       )[0] == 200
+        assert request(port, 'GET', path.format(gone['qualtrics id'])
+                       )[0] == 404
+        assert request(port, 'POST', '/events/fall/match',
+                       {'update': True})[0] == 200
+        return gone['email']
+
+    gone = serveWhile(str(workdir / 'events'), client)
+    for name in service.SUMMARIES[:2]:
+        with open(folder / 'output' / f'{name}.csv', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) > 0
+        assert gone not in [row[f'p{n} email'] for row in rows
+                            for n in [1, 2]]